@@ -1,3 +1,5 @@
-__all__ = ['run_qforce', 'run_hessian_fitting_for_external']
+__all__ = ['run_qforce', 'run_hessian_fitting_for_external', 'run_hessian_fitting_in_memory',
+           'get_config']
 
-from .main import run_qforce, run_hessian_fitting_for_external
+from .main import run_qforce, run_hessian_fitting_for_external, run_hessian_fitting_in_memory
+from .initialize import get_config
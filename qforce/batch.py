@@ -0,0 +1,108 @@
+import os
+#
+from .main import (initialize_run, setup_run, fit_run_hessian, make_run_fragments, restore_run,
+                   fit_run_dihedrals)
+from .misc import run_in_pool
+
+"""
+
+Batch driver: all molecules of a set are set up in one process, fragments are deduplicated over
+the whole set before any QM input is written and the fitting is distributed over a worker pool.
+The stages (with their checkpoints and the result cache) are the ones of run_qforce.
+
+"""
+
+COORD_EXTENSIONS = ('.xyz', '.pdb', '.gro', '.mol', '.mol2', '.sdf')
+
+
+def run_batch(batch_input, config=None, presets=None, n_workers=1):
+    runs, pending = [], []
+
+    for input_arg in get_batch_inputs(batch_input):
+        try:
+            runs.append(setup_molecule(input_arg, config, presets))
+        except SystemExit:
+            pending.append(input_arg)
+
+    print(f'Fitting the Hessian of {len(runs)} molecule(s) on {n_workers} worker(s)...\n')
+    fits = run_in_pool(fit_run_hessian, [(run.config, run.job, run.qm_out, run.ext_q, run.ext_lj)
+                                         for run in runs], n_workers)
+    for run, (mol, md_hessian) in zip(runs, fits):
+        run.mol, run.md_hessian = mol, md_hessian
+
+    ready, done = [], []
+    for run in runs:
+        try:
+            run.fragments = make_run_fragments(run)
+        except SystemExit:
+            pending.append(run.job.dir)
+            continue
+        if not restore_run(run):
+            ready.append(run)
+        done.append(run.job.dir)
+
+    print(f'Fitting the dihedrals of {len(ready)} molecule(s) on {n_workers} worker(s)...\n')
+    run_in_pool(fit_run_dihedrals, [(run.config, run.job, run.qm_out, run.ext_q, run.ext_lj,
+                                     run.mol, run.md_hessian, run.fragments, run.result_key)
+                                    for run in ready], n_workers)
+
+    print_batch_outcome(done, pending)
+    return done, pending
+
+
+def get_batch_inputs(batch_input):
+    """
+    Molecules of a batch: either all coordinate files and job directories in a directory, or
+    the entries of a file with one coordinate file / job directory per line.
+    """
+    if os.path.isdir(batch_input):
+        entries = sorted(os.listdir(batch_input))
+        names = [os.path.splitext(entry)[0] for entry in entries
+                 if entry.lower().endswith(COORD_EXTENSIONS)]
+        inputs = [os.path.join(batch_input, entry) for entry in entries
+                  if entry.lower().endswith(COORD_EXTENSIONS) or
+                  (entry.endswith('_qforce') and entry[:-7] not in names)]
+    else:
+        base = os.path.dirname(batch_input)
+        with open(batch_input, 'r') as file:
+            lines = [line.split('#')[0].strip() for line in file]
+        inputs = [os.path.join(base, line) for line in lines if line]
+
+    if not inputs:
+        raise ValueError(f'No molecules found in "{batch_input}".')
+    return inputs
+
+
+def setup_molecule(input_arg, config, presets):
+    config, job = initialize_run(input_arg, config, presets)
+    if not sets_option(f'{job.dir}/settings.ini', 'scan', 'batch_run'):
+        # fragments of the whole set share the library: inputs are only written once per fragment
+        config.scan.batch_run = True
+    return setup_run(config, job)
+
+
+def sets_option(settings_file, block, option):
+    """Whether a settings file sets the option of a block (else its default is used)."""
+    if not os.path.isfile(settings_file):
+        return False
+    section = None
+    with open(settings_file, 'r') as file:
+        for line in file:
+            line = line.split('#')[0].strip()
+            if line.startswith('[') and line.endswith(']'):
+                section = line[1:-1].strip()
+            elif section == block and line.partition('=')[0].strip() == option:
+                return True
+    return False
+
+
+def print_batch_outcome(done, pending):
+    print(f'Force fields are created for {len(done)} molecule(s):')
+    for job_dir in done:
+        print(f'- {job_dir}')
+    if pending:
+        print(f'\n{len(pending)} molecule(s) are waiting for QM data (see the QM input files '
+              'created in their job directories):')
+        for name in pending:
+            print(f'- {name}')
+    print()
@@ -0,0 +1,130 @@
+import os
+import pickle
+import hashlib
+from functools import lru_cache
+from types import SimpleNamespace
+import numpy as np
+#
+from .misc import get_version
+
+"""
+
+Checkpoints of the pipeline stages: the result of a stage is pickled to the checkpoints
+subdirectory of the job together with a hash of everything it is computed from (the results of
+the earlier stages enter through their hashes). On a rerun a stage with an unchanged hash is
+loaded instead of computed. The keys include a fingerprint of the qforce code, so that results
+of another version (or of a modified source tree) are never reused.
+
+"""
+
+# options that do not change the results of the stages: output, caching and job execution
+IGNORED_SETTINGS = {
+    'ff': ['plots', 'checkpoints', 'result_cache', 'result_cache_size'],
+    'qm': ['job_script', 'memory', 'n_proc', 'parse_cache', 'run_jobs',
+           'local_command', 'max_jobs', 'submit_command', 'status_command', 'poll_interval',
+           'max_poll_interval', 'status_retries', 'n_retries'],
+    'scan': ['n_proc', 'scan_cache'],
+}
+
+
+def run_stage(job, name, key, compute, enabled=True):
+    """Result of compute(), taken from the checkpoint of the stage if that has the same key."""
+    if not enabled:
+        return compute()
+
+    file_name = f'{job.dir}/checkpoints/{name}.pkl'
+    result = load_checkpoint(file_name, key)
+    if result is not None:
+        print(f'Taking the "{name}" stage from its checkpoint.\n')
+        return result[0]
+
+    result = compute()
+    save_checkpoint(file_name, key, result)
+    return result
+
+
+def make_key(*parts):
+    """Hash of the stage inputs: arrays, numbers, strings and (nested) lists/dicts/namespaces."""
+    sha = hashlib.sha256(get_code_fingerprint().encode())
+    for part in parts:
+        _update_hash(sha, part)
+    return sha.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_code_fingerprint():
+    """Hash of the qforce version and of all files of the package (code and data, no tests)."""
+    sha = hashlib.sha256(get_version().encode())
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for root, dirs, files in os.walk(package_dir):
+        dirs[:] = sorted(name for name in dirs if name not in ('tests', '__pycache__'))
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            sha.update(os.path.relpath(path, package_dir).encode())
+            with open(path, 'rb') as file:
+                sha.update(hashlib.sha256(file.read()).digest())
+    return sha.hexdigest()
+
+
+def get_settings(section, block, keep=()):
+    """Options of a settings block (namespace) without the IGNORED_SETTINGS not in keep."""
+    ignored = set(IGNORED_SETTINGS.get(block, [])) - set(keep)
+    return {key: value for key, value in vars(section).items() if key not in ignored}
+
+
+def read_job_files(job, names):
+    """Contents of the optional input files in the job directory (e.g. ext_q, ext_lj)."""
+    contents = {}
+    for name in names:
+        if os.path.isfile(f'{job.dir}/{name}'):
+            with open(f'{job.dir}/{name}', 'rb') as file:
+                contents[name] = hashlib.sha256(file.read()).hexdigest()
+    return contents
+
+
+def load_checkpoint(file_name, key):
+    """(result,) of a checkpoint with the given key, None if there is none."""
+    if not os.path.isfile(file_name):
+        return None
+    try:
+        with open(file_name, 'rb') as file:
+            checkpoint = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None  # unreadable or from an incompatible version: compute again
+    if not isinstance(checkpoint, dict) or checkpoint.get('key') != key:
+        return None
+    return (checkpoint['result'],)
+
+
+def save_checkpoint(file_name, key, result):
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    tmp_file = f'{file_name}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'wb') as file:
+            pickle.dump({'key': key, 'result': result}, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, file_name)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):  # just no checkpoint
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _update_hash(sha, value):
+    if isinstance(value, np.ndarray):
+        sha.update(f'array {value.dtype} {value.shape}'.encode())
+        if value.dtype == object:
+            _update_hash(sha, value.tolist())
+        else:
+            sha.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, SimpleNamespace):
+        _update_hash(sha, vars(value))
+    elif isinstance(value, dict):
+        sha.update(f'dict {len(value)}'.encode())
+        for key in sorted(value, key=str):
+            _update_hash(sha, str(key))
+            _update_hash(sha, value[key])
+    elif isinstance(value, (list, tuple)):
+        sha.update(f'list {len(value)}'.encode())
+        for item in value:
+            _update_hash(sha, item)
+    else:
+        sha.update(f'{type(value).__name__} {value!r};'.encode())
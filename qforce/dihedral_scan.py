@@ -1,23 +1,25 @@
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 import os
 import shutil
+import hashlib
 import numpy as np
-import seaborn as sns
-from ase.optimize import BFGS
-import scipy.optimize as optimize
-from ase import Atoms
-from ase.io import read
-from scipy.interpolate import interp1d as interpolate
 from numba import jit
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 #
 from colt import Colt
 #
 from .forcefield import ForceField
-from .calculator import QForce
-from .forces import get_dihed, get_dist
+from .geometry import get_diheds, set_dists
+from .optimizer import relax_native, get_hessian_guess
+from .hessian import calc_term_hessian
+from .misc import run_in_pool, LazyImport
+from .plots import calc_r_squared, plot_scan, plot_fit
+
+optimize = LazyImport('scipy.optimize')
+linalg = LazyImport('scipy.linalg')
+sparse = LazyImport('scipy.sparse')
+sparse_linalg = LazyImport('scipy.sparse.linalg')
+interpolate = LazyImport('scipy.interpolate')
 
 """
 
@@ -46,7 +48,17 @@ conj_bo_cutoff = 1.4 :: float
 break_co_bond = no :: bool
 
 # Method for doing the MM relaxed dihedral scan
-method = qforce :: str :: [qforce, gromacs]
+# (qforce: ASE BFGS, qforce_native: in-house L-BFGS on the Q-Force terms, gromacs: GROMACS EM)
+method = qforce :: str :: [qforce, qforce_native, gromacs]
+
+# Hold the restrained dihedrals exactly during the MM relaxed scan instead of using stiff
+# harmonic restraints (only for method = qforce_native)
+exact_constraints = no :: bool
+
+# Start the relaxations of the MM scan from the MM Hessian of the fragment (computed once per
+# fragment with the fitted force constants) instead of a scaled identity
+# (only for method = qforce and qforce_native)
+hessian_guess = no :: bool
 
 # The executable for gromacs - necessary if scan method is gromacs
 gromacs_exec = gmx :: str
@@ -54,15 +66,43 @@ gromacs_exec = gmx :: str
 # Number of iterations of dihedral fitting
 n_dihed_scans = 5 :: int
 
+# Stop relaxing a fragment once the last fit changed none of its RB parameters by more than
+# param_tol (kJ/mol) and its MM scan energies moved by less than energy_tol (kJ/mol, weighted
+# RMS) between two iterations. Its energies are then updated to first order with the new
+# parameters. The fitting stops when all fragments are converged (0 disables).
+param_tol = 0.01 :: float
+energy_tol = 0.01 :: float
+
+# Re-relax only the scan points whose MM energy changes by more than rerelax_tol (kJ/mol) to
+# first order with the new RB parameters, the others keep their previous geometry
+# (0 re-relaxes all points)
+rerelax_tol = 0.0 :: float
+
+# Largest allowed change of a single RB coefficient (kJ/mol) per fitting iteration
+# (no bound if not set)
+fit_bound = :: float, optional
+
+# Number of processes for the MM relaxed dihedral scans (scan points of all fragments are
+# relaxed in parallel, for method = gromacs this is the number of concurrent GROMACS runs)
+n_proc = 1 :: int
+
 # Symmetrize the dihedral profile of a specific dihedral by inputting the range
 # For symmetrizing the dihedral profile between atoms 77 and 80 where 0-180 is inversely
 # equivalent to 180-360:
 # 77 80 = 0 180 360 : +-
 symmetrize = :: literal
 
-# Save extra plots with fitting data
+# Save extra plots with fitting data (rendered according to the "plots" setting in [ff])
 plot_fit = no :: bool
 
+# Reuse the MM relaxed scans of identical scan states (same fragment, term parameters, starting
+# geometries, restraints and scan settings), stored in the fragment library
+scan_cache = yes :: bool
+
+# Maximum size (MB) of the scan cache of a fragment, the least recently used scans are removed
+# beyond it
+scan_cache_size = 100.0 :: float
+
 # Directory where the fragments are saved
 frag_lib = ~/qforce_fragments :: folder
 
@@ -72,38 +112,45 @@ batch_run = False :: bool
 
     def __init__(self, fragments, mol, job, all_config):
         self.frag_dir = job.frag_dir
+        self.plots = all_config.ff.plots
         self.job_name = job.name
         self.mdp_file = f'{job.md_data}/default.mdp'
         self.config = all_config.scan
         self.symmetrize = self._set_symmetrize()
         self.scan = getattr(self, f'scan_dihed_{self.config.method.lower()}')
+        if self.config.exact_constraints and self.config.method != 'qforce_native':
+            raise ValueError('"exact_constraints" is only available for the "qforce_native" '
+                             'scan method.')
         self.move_capping_atoms(fragments)
 
         fragments, all_dih_terms, weights = self.arrange_data(mol, fragments)
+        if self.config.hessian_guess:
+            self.set_hessian_guess(fragments)
         final_energy, params = self.scan_dihedrals(fragments, mol, all_config, all_dih_terms,
                                                    weights)
         self.finalize_results(fragments, final_energy, all_dih_terms, params)
 
     def arrange_data(self, mol, fragments):
-        all_dih_terms, weights = [], []
+        # dihedral type -> its block of 6 RB parameters in the fit
+        all_dih_terms, weights = {}, []
 
         for term in mol.terms['dihedral/flexible']:
-            if str(term) not in all_dih_terms:
-                all_dih_terms.append(str(term))
+            all_dih_terms.setdefault(str(term), len(all_dih_terms))
 
         for n_fit, frag in enumerate(fragments, start=1):
-            angles = []
             for term in frag.terms['dihedral/flexible']:
                 if all([atom in [0, 1] for atom in term.atomids[1:3]]):
                     frag.fit_terms.append({'name': str(term), 'atomids': term.atomids,
-                                           'params': np.zeros(6)})
-
-            for i, coord in enumerate(frag.qm_coords):
-                angle = get_dihed(coord[frag.scanned_atomids])[0]
-                angles.append(angle)
+                                           'idx': all_dih_terms[str(term)]})
 
-            angles = np.array(angles)
+            # the params of the fit terms are views on one array, updated all at once
+            frag.fit_idx = np.array([term['idx'] for term in frag.fit_terms], dtype=int)
+            frag.fit_params = np.zeros((len(frag.fit_terms), 6))
+            for term, term_params in zip(frag.fit_terms, frag.fit_params):
+                term['params'] = term_params
+            frag.flex_idx = [all_dih_terms[str(term)] for term in frag.terms['dihedral/flexible']]
 
+            angles = get_diheds(frag.qm_coords, frag.scanned_atomids)[:, 0]
             angles[angles < 0] += 2*np.pi
             order = np.argsort(angles)
 
@@ -120,6 +167,12 @@ batch_run = False :: bool
 
         return fragments, all_dih_terms, np.array(weights)
 
+    @staticmethod
+    def set_hessian_guess(fragments):
+        for frag in fragments:
+            hessian = calc_term_hessian(frag.coords[0], frag.terms)
+            frag.hessian_guess, frag.inv_hessian_guess = get_hessian_guess(hessian)
+
     def finalize_results(self, fragments, final_energy, all_dih_terms, params):
         sum_scans = 0
         bad_fits = []
@@ -137,20 +190,17 @@ batch_run = False :: bool
             unfit_energy -= fit_sum
             r_squared = calc_r_squared(fit_sum, frag.qm_energies-unfit_energy)
 
-            self.plot_results(frag, final, 'scan', r_squared=r_squared)
+            scan_file = f'{self.frag_dir}/scan_data_{frag.id}.npy'
+            fit_file = f'{self.frag_dir}/fit_data_{frag.id}.npy'
+            np.save(scan_file, np.vstack((frag.qm_angles, frag.qm_energies, final)))
+            np.save(fit_file, np.vstack((frag.qm_angles, frag.qm_energies,
+                                         unfit_energy - unfit_energy.min(), fit_sum)))
 
-            np.save(f'{self.frag_dir}/scan_data_{frag.id}', np.vstack((frag.qm_angles,
-                                                                       frag.qm_energies,
-                                                                       final)))
+            if self.plots == 'inline':
+                plot_scan(scan_file)
+                if self.config.plot_fit:
+                    plot_fit(fit_file)
 
-            if self.config.plot_fit:
-                self.plot_fit(frag, frag.qm_energies-unfit_energy, fit_sum, r_squared)
-                unfit_energy -= unfit_energy.min()
-                self.plot_results(frag, unfit_energy, 'unfit')
-                np.save(f'{self.frag_dir}/fit_data_{frag.id}', np.vstack((frag.qm_angles,
-                                                                          frag.qm_energies,
-                                                                          unfit_energy,
-                                                                          fit_sum)))
             energy_diff = frag.qm_energies - final
             if np.any(energy_diff > 2.0) and r_squared < 0.9:
                 bad_fits.append(frag.id)
@@ -163,21 +213,40 @@ batch_run = False :: bool
             print('         Please check manually to see if you find the accuracy satisfactory.\n')
 
     def scan_dihedrals(self, fragments, mol, all_config, all_dih_terms, weights):
+        for frag in fragments:
+            frag.n_iterations, frag.converged, frag.md_energy = 0, False, None
+            if os.path.exists(self.get_scan_log(frag)):
+                os.remove(self.get_scan_log(frag))
+        params = np.zeros(len(all_dih_terms)*6)
+        mol_idx = [all_dih_terms[str(term)] for term in mol.terms['dihedral/flexible']]
+
         for n_run in range(self.config.n_dihed_scans):
+            active = [frag for frag in fragments if not frag.converged]
+            if not active:
+                break
+
             energy_diffs, md_energies = [], []
-            for n_fit, frag in enumerate(fragments, start=1):
+            for n_fit, frag in enumerate(active, start=1):
                 print(f'Run {n_run+1}/{self.config.n_dihed_scans}, fitting dihedral '
-                      f'{n_fit}/{len(fragments)}: {frag.id}')
+                      f'{n_fit}/{len(active)}: {frag.id}')
 
-                scan_dir = f'{self.frag_dir}/{frag.id}'
-                make_scan_dir(scan_dir)
+                make_scan_dir(f'{self.frag_dir}/{frag.id}')
 
-                for term in frag.fit_terms:
-                    term['angles'] = []
+            scan_energies = iter(self.scan_with_cache(all_config, active, mol, n_run))
 
-                md_energy = self.scan(all_config, frag, scan_dir, mol, n_run)
+            for frag in fragments:
+                if frag.converged:
+                    # not relaxed anymore: first order update with the last parameter change
+                    md_energy = frag.md_energy + calc_frag_rb_change(frag, params)
+                else:
+                    md_energy = next(scan_energies)
+                    frag.n_iterations += 1
                 md_energy -= md_energy.min()
 
+                if not frag.converged and n_run > 0:
+                    frag.converged = self.check_convergence(frag, md_energy, params)
+                frag.md_energy = md_energy
+
                 if frag.central_atoms in self.symmetrize.keys():
                     _, md_energy = self.symmetrize_dihedral(frag.angles, md_energy,
                                                             self.symmetrize[frag.central_atoms])
@@ -192,88 +261,235 @@ batch_run = False :: bool
                 #         low_e_idx.append((i+np.argmin(neigh_energies)-1) % md_energy.size)
                 #     frag.coords = frag.coords[low_e_idx]
 
-            params, matrix = self.fit_dihedrals(fragments, energy_diffs, weights, all_dih_terms)
+            params, matrix = self.fit_dihedrals(fragments, energy_diffs, weights, all_dih_terms,
+                                                self.config.fit_bound)
 
+            blocks = params.reshape(-1, 6)
             for frag in fragments:
-                for term in frag.terms['dihedral/flexible']:
-                    term_idx = all_dih_terms.index(str(term))
-                    term.equ += params[6*term_idx:(6*term_idx)+6]
+                for term, term_idx in zip(frag.terms['dihedral/flexible'], frag.flex_idx):
+                    term.equ += blocks[term_idx]
+                frag.fit_params += blocks[frag.fit_idx]
 
-                for term in frag.fit_terms:
-                    term_idx = all_dih_terms.index(term['name'])
-                    term['params'] += params[6*term_idx:(6*term_idx)+6]
-
-            for term in mol.terms['dihedral/flexible']:
-                term_idx = all_dih_terms.index(str(term))
-                term.equ += params[6*term_idx:(6*term_idx)+6]
+            for term, term_idx in zip(mol.terms['dihedral/flexible'], mol_idx):
+                term.equ += blocks[term_idx]
 
         print('Done!\n')
-        final_energy = np.array(md_energies) + np.sum(matrix * params, axis=1)
+        print('Number of MM relaxed scans per fragment:')
+        for frag in fragments:
+            print(f'    - {frag.id}: {frag.n_iterations}')
+        print()
+        final_energy = np.array(md_energies) + matrix @ params
 
         return final_energy, params
 
+    def check_convergence(self, frag, md_energy, params):
+        """
+        A fragment is converged if the last fit changed none of its RB parameters by more than
+        param_tol and its MM energy profile moved less than energy_tol (weighted RMS).
+        """
+        param_change = np.abs(params.reshape(-1, 6)[frag.fit_idx]).max(initial=0.)
+        weights = frag.fit_weights / frag.fit_weights.sum()
+        energy_change = np.sqrt((weights * (md_energy - frag.md_energy)**2).sum())
+        return param_change < self.config.param_tol and energy_change < self.config.energy_tol
+
     @staticmethod
     def move_capping_atoms(fragments):
         for frag in fragments:
-            for cap in frag.caps:
-                for coord in frag.coords:
-                    vec, dist = get_dist(coord[cap['idx']], coord[cap['connected']])
-                    new_vec = vec / dist * cap['b_length']
-                    coord[cap['idx']] = coord[cap['connected']] + new_vec
+            if frag.caps and len(frag.coords) > 0:
+                frag.coords = np.asarray(frag.coords, dtype=float)
+                set_dists(frag.coords, [[cap['idx'], cap['connected']] for cap in frag.caps],
+                          [cap['b_length'] for cap in frag.caps])
+
+    def scan_dihed_qforce(self, all_config, fragments, mol, n_run, nsteps=1000):
+        tasks = []
+        for frag, i, coord, restraints, scan_dir in self.get_scan_points(fragments, n_run):
+            traj_name = f'{scan_dir}/{frag.id}_run{n_run+1}_{i:02d}.traj'
+            log_name = f'{scan_dir}/opt_{frag.id}_run{n_run+1}_{i:02d}.log'
+            tasks.append((frag.terms, frag.elements, coord, restraints, traj_name, log_name,
+                          nsteps, getattr(frag, 'hessian_guess', None)))
 
-    def scan_dihed_qforce(self, all_config, frag, scan_dir, mol, n_run, nsteps=1000):
-        md_energies = []
+        results = run_in_pool(relax_scan_point, tasks, self.config.n_proc)
+        return self.collect_scan_results(fragments, results)
 
-        for i, coord in enumerate(frag.coords):
-            restraints = self.find_restraints(frag, frag.qm_coords[i], n_run)
-            atom = Atoms(frag.elements, positions=coord,
-                         calculator=QForce(frag.terms, dihedral_restraints=restraints))
+    def scan_dihed_qforce_native(self, all_config, fragments, mol, n_run, nsteps=1000):
+        tasks = [(frag.terms, coord, restraints, nsteps, self.config.exact_constraints,
+                  getattr(frag, 'inv_hessian_guess', None))
+                 for frag, _, coord, restraints, _ in self.get_scan_points(fragments, n_run)]
 
-            traj_name = f'{scan_dir}/{frag.id}_run{n_run+1}_{i:02d}.traj'
-            log_name = f'{scan_dir}/opt_{frag.id}_run{n_run+1}.log'
-            e_minimiz = BFGS(atom, trajectory=traj_name, logfile=log_name)
-            e_minimiz.run(fmax=0.01, steps=nsteps)
-            coords = atom.get_positions()
-            self.calc_fit_angles(frag, coords)
-            md_energies.append(atom.get_potential_energy())
-            frag.coords[i] = coords
-        return np.array(md_energies)
-
-    def scan_dihed_gromacs(self, all_config, frag, scan_dir, mol, n_run):
-        md_energies = []
-
-        ff = ForceField(self.job_name, all_config, frag, frag.neighbors,
-                        exclude_all=frag.remove_non_bonded)
-
-        for i, coord in enumerate(frag.coords):
-            step_dir = f"{scan_dir}/step{i:02d}"
-            make_scan_dir(step_dir)
+        results = run_in_pool(relax_native_scan_point, tasks, self.config.n_proc)
+        return self.collect_scan_results(fragments, results)
 
-            ff.write_gromacs(step_dir, frag, coord)
-            shutil.copy2(self.mdp_file, step_dir)
+    def scan_with_cache(self, all_config, fragments, mol, n_run):
+        if not self.config.scan_cache:
+            return self.scan(all_config, fragments, mol, n_run)
 
-            restraints = self.find_restraints(frag, frag.qm_coords[i], n_run)
-            ff.add_restraints(restraints, step_dir)
+        cache_files, cached = {}, {}
+        for frag in fragments:
+            os.makedirs(f'{frag.dir}/mm_scans', exist_ok=True)
+            cache_files[frag.id] = f'{frag.dir}/mm_scans/{self.get_scan_key(frag, n_run)}.npz'
+            if os.path.isfile(cache_files[frag.id]):
+                with np.load(cache_files[frag.id]) as data:
+                    cached[frag.id] = {key: data[key] for key in data.files}
+                os.utime(cache_files[frag.id])  # last use, for the eviction
+
+        to_scan = [frag for frag in fragments if frag.id not in cached]
+        if cached:
+            print(f'Taking the MM scans of {len(cached)} fragment(s) from the scan cache.')
+        for frag in fragments:
+            if frag.id in cached:
+                with open(self.get_scan_log(frag), 'a') as file:
+                    file.write(f'Run {n_run+1}: taken from the scan cache '
+                               f'({os.path.basename(cache_files[frag.id])})\n')
+        scan_energies = iter(self.scan(all_config, to_scan, mol, n_run) if to_scan else [])
 
-            run_gromacs(step_dir, all_config.scan.gromacs_exec, ff.polar_title)
-            md_energy = read_gromacs_energies(step_dir)
-            md_energies.append(md_energy)
+        all_energies = []
+        for frag in fragments:
+            if frag.id in cached:
+                data = cached[frag.id]
+                frag.coords = data['coords']
+                for term, angles in zip(frag.fit_terms, data['fit_angles']):
+                    term['angles'] = angles
+                frag.relaxed = [(energy, list(equs)) for energy, equs
+                                in zip(data['relaxed_energies'], data['relaxed_equs'])]
+                all_energies.append(data['energies'].copy())
+            else:
+                energies = next(scan_energies)
+                fit_angles = np.array([term['angles'] for term in frag.fit_terms])
+                relaxed_energies = np.array([energy for energy, _ in frag.relaxed])
+                relaxed_equs = np.array([equs for _, equs in frag.relaxed])
+                tmp_file = f'{cache_files[frag.id]}.{os.getpid()}.tmp'
+                with open(tmp_file, 'wb') as file:
+                    np.savez(file, coords=frag.coords, energies=energies, fit_angles=fit_angles,
+                             relaxed_energies=relaxed_energies, relaxed_equs=relaxed_equs)
+                os.replace(tmp_file, cache_files[frag.id])
+                evict_scans(f'{frag.dir}/mm_scans', self.config.scan_cache_size)
+                all_energies.append(energies)
+        return all_energies
+
+    def get_scan_key(self, frag, n_run):
+        """
+        Hash of everything an MM relaxed scan depends on: the fragment, its term parameters,
+        the starting geometries, the restraints and the scan settings.
+        """
+        key = hashlib.sha256(frag.id.encode())
+        for term in frag.terms:
+            key.update(f'{term}{term.atomids}{term.fconst!r}'.encode())
+            key.update(np.asarray(term.equ, dtype=float).tobytes())
+        key.update(np.asarray(frag.coords, dtype=float).tobytes())
+        for qm_coord in frag.qm_coords:
+            for atomids, phi0 in self.find_restraints(frag, qm_coord, n_run):
+                key.update(np.asarray(atomids).tobytes() + np.float64(phi0).tobytes())
+        settings = [self.config.method, self.config.exact_constraints, self.config.hessian_guess,
+                    self.config.rerelax_tol]
+        if self.config.method == 'gromacs':  # another GROMACS installation can relax differently
+            settings.append(shutil.which(self.config.gromacs_exec) or self.config.gromacs_exec)
+        elif self.config.hessian_guess:
+            key.update(np.asarray(frag.hessian_guess, dtype=float).tobytes())
+        key.update(repr(settings).encode())
+        if self.config.rerelax_tol > 0 and n_run > 1:  # skipped points depend on the history
+            for energy, equs in frag.relaxed:
+                key.update(np.float64(energy).tobytes() + np.concatenate(equs).tobytes())
+        return key.hexdigest()
+
+    def get_scan_points(self, fragments, n_run):
+        self.select_scan_points(fragments, n_run)
+        for frag in fragments:
+            scan_dir = f'{self.frag_dir}/{frag.id}'
+            for i, coord in enumerate(frag.coords):
+                if frag.rerelax[i]:
+                    restraints = self.find_restraints(frag, frag.qm_coords[i], n_run)
+                    yield frag, i, coord, restraints, scan_dir
+
+    def select_scan_points(self, fragments, n_run):
+        """
+        Points whose energy changes less than rerelax_tol to first order with the RB parameter
+        updates since their last relaxation keep their geometry and get the estimated energy.
+        Not done in the first two runs (the first one restrains all flexible dihedrals).
+        """
+        for frag in fragments:
+            n_points = len(frag.coords)
+            frag.rerelax = np.ones(n_points, dtype=bool)
+            frag.energy_estimates = np.zeros(n_points)
+
+            if self.config.rerelax_tol > 0 and n_run > 1:
+                terms = frag.terms['dihedral/flexible']
+                angles = get_diheds(frag.coords, [term.atomids for term in terms])
+                rb = calc_rb(angles.ravel()).reshape(n_points, len(terms), 6)
+                param_changes = np.array([[term.equ - equ for term, equ in zip(terms, equs)]
+                                          for _, equs in frag.relaxed]).reshape(rb.shape)
+                changes = np.einsum('ptk,ptk->p', rb, param_changes)
+                frag.rerelax = np.abs(changes) >= self.config.rerelax_tol
+                frag.energy_estimates = np.array([energy for energy, _ in frag.relaxed]) + changes
+
+            with open(self.get_scan_log(frag), 'a') as file:
+                file.write(f'Run {n_run+1}: relaxed {frag.rerelax.sum()} of {n_points} scan '
+                           'points\n')
+                for i, rerelax in enumerate(frag.rerelax):
+                    if rerelax:
+                        file.write(f'{i:4d}  relaxed\n')
+                    else:
+                        file.write(f'{i:4d}  skipped, energy: {frag.energy_estimates[i]:.4f} '
+                                   'kJ/mol (first order)\n')
+
+    def get_scan_log(self, frag):
+        """Record of the relaxed and skipped scan points of all runs of a fragment."""
+        return f'{self.frag_dir}/mm_scan_{frag.id}.log'
+
+    def collect_scan_results(self, fragments, results):
+        results = iter(results)
+        scan_energies = []
+        for frag in fragments:
+            md_energies = []
+            if not hasattr(frag, 'relaxed'):
+                frag.relaxed = [None] * len(frag.coords)
+            for i in range(len(frag.coords)):
+                if frag.rerelax[i]:
+                    coords, md_energy = next(results)
+                    frag.relaxed[i] = (md_energy, [term.equ.copy() for term
+                                                   in frag.terms['dihedral/flexible']])
+                else:
+                    coords, md_energy = frag.coords[i], frag.energy_estimates[i]
+                md_energies.append(md_energy)
+                frag.coords[i] = coords
+            self.calc_fit_angles(frag)
+            scan_energies.append(np.array(md_energies))
+        return scan_energies
+
+    def scan_dihed_gromacs(self, all_config, fragments, mol, n_run):
+        # itp and mdp are written once per fragment, the points only get a top with their
+        # restraints and a gro with their coordinates
+        tasks, force_fields = [], {}
+        for frag, i, coord, restraints, scan_dir in self.get_scan_points(fragments, n_run):
+            if frag.id not in force_fields:
+                force_fields[frag.id] = ForceField(self.job_name, all_config, frag,
+                                                   frag.neighbors,
+                                                   exclude_all=frag.remove_non_bonded)
+                force_fields[frag.id].write_itp(frag, scan_dir)
+                shutil.copy2(self.mdp_file, scan_dir)
+            ff = force_fields[frag.id]
 
-            coords = read(f'{step_dir}/geom.gro').get_positions()
-            self.calc_fit_angles(frag, coords)
-            frag.coords[i] = coords
-        return np.array(md_energies)
+            step_dir = f"{scan_dir}/step{i:02d}"
+            make_scan_dir(step_dir)
+            ff.write_top(step_dir, itp_dir='..', restraints=restraints)
+            ff.write_gro(step_dir, coord, frag.non_bonded.alpha_map)
+            tasks.append((step_dir, all_config.scan.gromacs_exec, ff.polar_title))
+
+        # the work is done by the GROMACS processes, threads are enough to keep them busy
+        results = run_in_pool(run_gromacs_scan_point, tasks, self.config.n_proc,
+                              executor=ThreadPoolExecutor)
+        return self.collect_scan_results(fragments, results)
 
     @staticmethod
-    def calc_fit_angles(frag, coords):
-        for term in frag.fit_terms:
-            term['angles'].append(get_dihed(coords[term['atomids']])[0])
+    def calc_fit_angles(frag):
+        angles = get_diheds(frag.coords, [term['atomids'] for term in frag.fit_terms])
+        for term, term_angles in zip(frag.fit_terms, angles.T):
+            term['angles'] = term_angles
 
     @staticmethod
     def find_restraints(frag, coord, n_run):
         restraints = []
-        for term in frag.terms['dihedral/flexible']:
-            phi0 = get_dihed(coord[term.atomids])[0]
+        phi0s = get_diheds(coord, [term.atomids for term in frag.terms['dihedral/flexible']])
+        for term, phi0 in zip(frag.terms['dihedral/flexible'], phi0s):
             # if any([cap['idx'] in term.atomids for cap in frag.caps]):
             # if not any([idx in term.atomids for idx in frag.scanned_atomids[1:3]]):
             #     phi = get_dihed(frag.qm_coords[0][term.atomids])[0]
@@ -286,12 +502,11 @@ batch_run = False :: bool
         return restraints
 
     @staticmethod
-    def fit_dihedrals(fragments, energy_diffs, weights, all_dih_terms):
+    def fit_dihedrals(fragments, energy_diffs, weights, all_dih_terms, bound=None):
         energy_diffs = np.array(energy_diffs)
         n_total_scans = energy_diffs.size
         matrix = calc_multi_rb_matrix(fragments, all_dih_terms, n_total_scans)
-        params = optimize.minimize(calc_multi_rb_obj, x0=np.zeros(len(all_dih_terms)*6),
-                                   args=(matrix, weights, energy_diffs)).x
+        params = solve_multi_rb(matrix, weights, energy_diffs, bound=bound)
         return params, matrix
 
     @staticmethod
@@ -308,7 +523,8 @@ batch_run = False :: bool
 
             ang_continious = np.copy(ang_reg)
             ang_continious[ang_reg < region['start']-spacing] += 360
-            ip_funct = interpolate(ang_continious, energy_reg, fill_value="extrapolate", kind=2)
+            ip_funct = interpolate.interp1d(ang_continious, energy_reg, fill_value="extrapolate",
+                                            kind=2)
             ip_angle = np.arange(region['start'], make_contin(region['start'], region['end'])+1)
             ip_energy = ip_funct(ip_angle)
 
@@ -331,39 +547,6 @@ batch_run = False :: bool
         sym_profile -= sym_profile.min()
         return sym_angle, sym_profile
 
-    def plot_results(self, frag, md_energies, title, r_squared=None):
-        angles_deg = np.degrees(frag.qm_angles)
-        width, height = plt.figaspect(0.6)
-        f = plt.figure(figsize=(width, height), dpi=300)
-        sns.set(font_scale=1.3)
-        plt.xlabel('Angle')
-        plt.ylabel('Energy (kJ/mol)')
-        plt.plot(angles_deg, frag.qm_energies, linewidth=4, label='QM')
-        plt.plot(angles_deg, md_energies, linewidth=4, label='Q-Force')
-        plt.xticks(np.arange(0, 361, 60))
-        plt.legend(ncol=2, bbox_to_anchor=(1.03, 1.12), frameon=False)
-        if r_squared:
-            plt.title(f'R-squared = {round(r_squared, 3)}', loc='left')
-        plt.tight_layout()
-        f.savefig(f"{self.frag_dir}/{title}_data_{frag.id}.pdf", bbox_inches='tight')
-        plt.close()
-
-    def plot_fit(self, frag, diff, fit, r_squared):
-        angles_deg = np.degrees(frag.qm_angles)
-        width, height = plt.figaspect(0.6)
-        f = plt.figure(figsize=(width, height), dpi=300)
-        sns.set(font_scale=1.3)
-        plt.xlabel('Angle')
-        plt.ylabel('Energy (kJ/mol)')
-        plt.plot(angles_deg, diff, linewidth=4, label='Diff')
-        plt.plot(angles_deg, fit, linewidth=4, label='Fit')
-        plt.xticks(np.arange(0, 361, 60))
-        plt.tight_layout()
-        plt.title(f'R-squared = {round(r_squared, 3)}', loc='left')
-        plt.legend(ncol=2, bbox_to_anchor=(1.03, 1.12), frameon=False)
-        f.savefig(f"{self.frag_dir}/fit_data_{frag.id}.pdf", bbox_inches='tight')
-        plt.close()
-
     def _set_symmetrize(self):
         sym_dict = {}
         if self.config.symmetrize:
@@ -419,9 +602,59 @@ def make_scan_dir(scan_name):
     os.makedirs(scan_name)
 
 
-def run_gromacs(directory, gromacs_exec, polar_title):
+def evict_scans(scan_dir, max_size):
+    """Remove the least recently used MM scans until scan_dir is at most max_size MB."""
+    scans = []
+    for name in os.listdir(scan_dir):
+        file = f'{scan_dir}/{name}'
+        try:
+            if name.endswith('.npz'):
+                scans.append((os.path.getmtime(file), os.path.getsize(file), file))
+        except OSError:  # removed by a parallel run
+            continue
+
+    total = sum(size for _, size, _ in scans)
+    for _, size, file in sorted(scans):
+        if total <= max_size * 1e6:
+            break
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+        total -= size
+
+
+def relax_scan_point(terms, elements, coord, restraints, traj_name, log_name, nsteps,
+                     hessian_guess=None):
+    from ase import Atoms
+    from ase.optimize import BFGS
+    from .calculator import QForce
+
+    atom = Atoms(elements, positions=coord,
+                 calculator=QForce(terms, dihedral_restraints=restraints))
+    e_minimiz = BFGS(atom, trajectory=traj_name, logfile=log_name)
+    if hessian_guess is not None:
+        e_minimiz.H0 = hessian_guess.copy()  # BFGS updates H0 in place
+    e_minimiz.run(fmax=0.01, steps=nsteps)
+    return atom.get_positions(), atom.get_potential_energy()
+
+
+def relax_native_scan_point(terms, coord, restraints, nsteps, constrained,
+                            inv_hessian_guess=None):
+    coords, md_energy, _ = relax_native(terms, coord, restraints, fmax=0.01, max_steps=nsteps,
+                                        constrained=constrained,
+                                        inv_hessian_guess=inv_hessian_guess)
+    return coords, md_energy
+
+
+def run_gromacs_scan_point(directory, gromacs_exec, polar_title):
+    run_gromacs(directory, gromacs_exec, polar_title, mdp_file='../default.mdp')
+    return read_gro_coords(f'{directory}/geom.gro'), read_gromacs_energies(directory)
+
+
+def run_gromacs(directory, gromacs_exec, polar_title, mdp_file='default.mdp'):
     attempt, returncode = 0, 1
-    grompp = subprocess.Popen([gromacs_exec, 'grompp', '-f', 'default.mdp', '-p',
+    grompp = subprocess.Popen([gromacs_exec, 'grompp', '-f', mdp_file, '-p',
                                f'gas{polar_title}.top', '-c', f'gas{polar_title}.gro', '-o',
                                'em.tpr', '-po', 'em.mdp', '-maxwarn', '10'],
                               cwd=directory, stdout=subprocess.PIPE,
@@ -455,51 +688,93 @@ def check_gromacs_termination(process):
 def read_gromacs_energies(directory):
     log_dir = f"{directory}/em.log"
     with open(log_dir, "r", encoding='utf-8') as em_log:
-        for line in em_log:
-            if "Potential Energy  =" in line:
-                md_energy = float(line.split()[3])
-    return md_energy
+        text = em_log.read()
+    # final energy of the minimization is the last one in the log
+    start = text.rindex("Potential Energy  =")
+    return float(text[start:text.index('\n', start)].split()[3])
 
 
-def calc_r_squared(rb, energy_diff):
-    residuals = rb - energy_diff
-    ss_res = np.sum(residuals**2)
-    ss_tot = np.sum((energy_diff-np.mean(energy_diff))**2)
-    return 1 - (ss_res / ss_tot)
+def read_gro_coords(gro_file):
+    """Coordinates (in Angstrom) of a gro file, read from its fixed width columns."""
+    with open(gro_file, "r", encoding='utf-8') as gro:
+        lines = gro.read().splitlines()
+    n_atoms = int(lines[1])
+    atom_lines = lines[2:2+n_atoms]
+    first_dot = atom_lines[0].index('.', 20)
+    width = atom_lines[0].index('.', first_dot+1) - first_dot
+    coords = [[float(line[20+i*width:20+(i+1)*width]) for i in range(3)] for line in atom_lines]
+    return np.array(coords) * 10
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def calc_multi_rb_obj(params, matrix, weights, energy_diffs):
     rb = np.sum(matrix * params, axis=1)
     weighted_residuals = (rb - energy_diffs)*weights
     return (weighted_residuals**2).sum() + (params**2).sum()*1e-2
 
 
+def solve_multi_rb(matrix, weights, energy_diffs, l2=1e-2, bound=None):
+    """
+    Exact minimizer of calc_multi_rb_obj: solves the regularized weighted normal equations
+    (A^T W^2 A + l2 I) p = A^T W^2 d. With a bound, the same problem is solved as a bounded
+    linear least squares (|p_i| <= bound). Sparse matrices are solved with a sparse solver.
+    """
+    n_params = matrix.shape[1]
+    if sparse.issparse(matrix):
+        weighted = sparse.diags(weights) @ matrix
+    else:
+        weighted = matrix * weights[:, np.newaxis]
+    rhs = energy_diffs * weights
+
+    if bound is not None:
+        if sparse.issparse(weighted):
+            augmented = sparse.vstack([weighted, np.sqrt(l2) * sparse.identity(n_params)])
+        else:
+            augmented = np.vstack([weighted, np.sqrt(l2) * np.identity(n_params)])
+        return optimize.lsq_linear(augmented, np.concatenate([rhs, np.zeros(n_params)]),
+                                   bounds=(-bound, bound), tol=1e-12, lsmr_tol='auto').x
+
+    normal = weighted.T @ weighted
+    if sparse.issparse(normal):
+        return sparse_linalg.spsolve((normal + l2 * sparse.identity(n_params)).tocsc(),
+                                     weighted.T @ rhs)
+    normal[np.diag_indices(n_params)] += l2
+    return linalg.cho_solve(linalg.cho_factor(normal), weighted.T @ rhs)
+
+
 def calc_multi_rb_matrix(fragments, all_dih_terms, n_total_scans):
+    """
+    Sparse RB design matrix of the fit: each scan point has a row, each dihedral type a block
+    of 6 columns. Contributions of the same dihedral type in a fragment are summed.
+    """
+    rows, columns, angles = [], [], []
     scan_sum = 0
-    n_dihs = len(all_dih_terms)
-    n_terms = n_dihs*6
-
-    matrix = np.zeros((n_total_scans, n_terms))
     for frag in fragments:
         n_scans = len(frag.qm_angles)
         for term in frag.fit_terms:
-            term_idx = all_dih_terms.index(term['name'])
-            matrix[scan_sum:scan_sum+n_scans,
-                   term_idx*6:(term_idx*6)+6] += calc_rb(term['angles'])
+            rows.append(np.arange(scan_sum, scan_sum+n_scans))
+            columns.append(np.full(n_scans, term['idx']))
+            angles.append(term['angles'])
         scan_sum += n_scans
-    return matrix
+
+    shape = (n_total_scans, len(all_dih_terms)*6)
+    if not angles:
+        return sparse.csr_matrix(shape)
+    rows = np.repeat(np.concatenate(rows), 6)
+    columns = (6*np.concatenate(columns)[:, np.newaxis] + np.arange(6)).ravel()
+    values = calc_rb(np.concatenate(angles)).ravel()
+    return sparse.csr_matrix((values, (rows, columns)), shape=shape)
+
+
+def calc_frag_rb_change(frag, params):
+    """Change of the MM energy of the scan points of a fragment by an RB parameter change."""
+    angles = np.array([term['angles'] for term in frag.fit_terms]).reshape(-1)
+    rb = calc_rb(angles).reshape(len(frag.fit_terms), -1, 6)
+    return np.einsum('tpk,tk->p', rb, params.reshape(-1, 6)[frag.fit_idx])
 
 
 def calc_rb(angles):
-    rb = np.zeros((len(angles), 6))
-    rb[:, 0] = 1
-    cos_phi = np.cos(np.array(angles)-np.pi)
-    cos_factor = np.ones(len(angles))
-    for i in range(1, 6):
-        cos_factor *= cos_phi
-        rb[:, i] = cos_factor
-    return rb
+    return np.cos(np.asarray(angles) - np.pi)[:, np.newaxis] ** np.arange(6)
 
 
 def calc_rb_pot(params, angles):
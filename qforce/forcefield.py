@@ -1,3 +1,4 @@
+from io import StringIO
 import numpy as np
 #
 from .elements import ATOM_SYM, ATOMMASS
@@ -34,57 +35,90 @@ class ForceField():
         self.write_top(directory)
         self.write_gro(directory, coords, mol.non_bonded.alpha_map)
 
-    def write_top(self, directory):
-        with open(f"{directory}/gas{self.polar_title}.top", "w") as top:
-            # defaults
-            top.write("\n[ defaults ]\n")
-            top.write("; nbfunc    comb-rule    gen-pairs      fudgeLJ      fudgeQQ\n")
-            top.write(f"{1:>8} {self.comb_rule:>12} {'yes':>12} {self.fudge_lj:>12} "
-                      f"{self.fudge_q:>12}\n\n\n")
-
-            top.write("; Include the molecule ITP\n")
-            top.write(f'#include "./{self.mol_name}_qforce{self.polar_title}.itp"\n\n\n')
-
-            size = len(self.mol_name)
-            top.write("[ system ]\n")
-            top.write(f"; {' '*(size-6)}name\n")
-            top.write(f"{' '*(6-size)}{self.mol_name}\n\n\n")
-
-            top.write("[ molecules ]\n")
-            top.write(f"; {' '*(size-10)}compound    n_mol\n")
-            top.write(f"{' '*(10-size)}{self.mol_name}        1\n")
+    def get_gromacs(self, mol, coords):
+        """The GROMACS files of write_gromacs as {file name: content}, without writing them."""
+        itp, top, gro = StringIO(), StringIO(), StringIO()
+        self.write_itp_to(itp, mol)
+        self.write_top_to(top)
+        self.write_gro_to(gro, coords, mol.non_bonded.alpha_map)
+        return {self.itp_name: itp.getvalue(), self.top_name: top.getvalue(),
+                self.gro_name: gro.getvalue()}
+
+    @property
+    def itp_name(self):
+        return f'{self.mol_name}_qforce{self.polar_title}.itp'
+
+    @property
+    def top_name(self):
+        return f'gas{self.polar_title}.top'
+
+    @property
+    def gro_name(self):
+        return f'gas{self.polar_title}.gro'
+
+    def write_top(self, directory, itp_dir='.', restraints=None):
+        with open(f"{directory}/{self.top_name}", "w") as top:
+            self.write_top_to(top, itp_dir, restraints)
+
+    def write_top_to(self, top, itp_dir='.', restraints=None):
+        # defaults
+        top.write("\n[ defaults ]\n")
+        top.write("; nbfunc    comb-rule    gen-pairs      fudgeLJ      fudgeQQ\n")
+        top.write(f"{1:>8} {self.comb_rule:>12} {'yes':>12} {self.fudge_lj:>12} "
+                  f"{self.fudge_q:>12}\n\n\n")
+
+        top.write("; Include the molecule ITP\n")
+        top.write(f'#include "{itp_dir}/{self.itp_name}"\n\n\n')
+        if restraints:
+            self.write_restraints(top, restraints)
+            top.write('\n\n')
+
+        size = len(self.mol_name)
+        top.write("[ system ]\n")
+        top.write(f"; {' '*(size-6)}name\n")
+        top.write(f"{' '*(6-size)}{self.mol_name}\n\n\n")
+
+        top.write("[ molecules ]\n")
+        top.write(f"; {' '*(size-10)}compound    n_mol\n")
+        top.write(f"{' '*(10-size)}{self.mol_name}        1\n")
 
     def write_gro(self, directory, coords, alpha_map, box=[20., 20., 20.]):
+        with open(f"{directory}/{self.gro_name}", "w") as gro:
+            self.write_gro_to(gro, coords, alpha_map, box)
+
+    def write_gro_to(self, gro, coords, alpha_map, box=[20., 20., 20.]):
         n_atoms = self.n_atoms
         if self.polar:
             n_atoms += len(alpha_map.keys())
         coords_nm = coords*0.1
-        with open(f"{directory}/gas{self.polar_title}.gro", "w") as gro:
-            gro.write(f"{self.mol_name}\n")
-            gro.write(f"{n_atoms:>6}\n")
-            for i, (a_name, coord) in enumerate(zip(self.atom_names, coords_nm), start=1):
-                gro.write(f"{1:>5}{self.residue:<5}")
-                gro.write(f"{a_name:>5}{i:>5}")
-                gro.write(f"{coord[0]:>8.3f}{coord[1]:>8.3f}{coord[2]:>8.3f}\n")
-            if self.polar:
-                for i, (atom, drude) in enumerate(alpha_map.items(), start=1):
-                    gro.write(f"{2:>5}{self.residue:<5}{f'D{i}':>5}{drude+1:>5}")
-                    gro.write(f"{coords_nm[atom][0]:>8.3f}{coords_nm[atom][1]:>8.3f}")
-                    gro.write(f"{coords_nm[atom][2]:>8.3f}\n")
-            gro.write(f'{box[0]:>12.5f}{box[1]:>12.5f}{box[2]:>12.5f}\n')
+        gro.write(f"{self.mol_name}\n")
+        gro.write(f"{n_atoms:>6}\n")
+        for i, (a_name, coord) in enumerate(zip(self.atom_names, coords_nm), start=1):
+            gro.write(f"{1:>5}{self.residue:<5}")
+            gro.write(f"{a_name:>5}{i:>5}")
+            gro.write(f"{coord[0]:>8.3f}{coord[1]:>8.3f}{coord[2]:>8.3f}\n")
+        if self.polar:
+            for i, (atom, drude) in enumerate(alpha_map.items(), start=1):
+                gro.write(f"{2:>5}{self.residue:<5}{f'D{i}':>5}{drude+1:>5}")
+                gro.write(f"{coords_nm[atom][0]:>8.3f}{coords_nm[atom][1]:>8.3f}")
+                gro.write(f"{coords_nm[atom][2]:>8.3f}\n")
+        gro.write(f'{box[0]:>12.5f}{box[1]:>12.5f}{box[2]:>12.5f}\n')
 
     def write_itp(self, mol, directory):
-        with open(f"{directory}/{self.mol_name}_qforce{self.polar_title}.itp", "w") as itp:
-            itp.write(LOGO_SEMICOL)
-            self.write_itp_atoms_and_molecule(itp, mol.non_bonded)
-            if self.polar:
-                self.write_itp_polarization(itp, mol.non_bonded)
-            self.write_itp_bonds(itp, mol.terms, mol.non_bonded.alpha_map)
-            self.write_itp_angles(itp, mol.terms)
-            self.write_itp_dihedrals(itp, mol.terms)
-            self.write_itp_pairs(itp)
-            self.write_itp_exclusions(itp)
-            itp.write('\n')
+        with open(f"{directory}/{self.itp_name}", "w") as itp:
+            self.write_itp_to(itp, mol)
+
+    def write_itp_to(self, itp, mol):
+        itp.write(LOGO_SEMICOL)
+        self.write_itp_atoms_and_molecule(itp, mol.non_bonded)
+        if self.polar:
+            self.write_itp_polarization(itp, mol.non_bonded)
+        self.write_itp_bonds(itp, mol.terms, mol.non_bonded.alpha_map)
+        self.write_itp_angles(itp, mol.terms)
+        self.write_itp_dihedrals(itp, mol.terms)
+        self.write_itp_pairs(itp)
+        self.write_itp_exclusions(itp)
+        itp.write('\n')
 
     def convert_to_gromacs_nonbonded(self, non_bonded):
         a_types, nb_pairs, nb_1_4 = {}, {}, {}
@@ -373,13 +407,17 @@ class ForceField():
         return atom_names
 
     def add_restraints(self, restraints, directory, fc=1000):
-        with open(f"{directory}/{self.mol_name}_qforce{self.polar_title}.itp", "a") as itp:
-            itp.write("[ dihedral_restraints ]\n")
-            itp.write(";  ai    aj    ak    al  type       phi   dp   kfac\n")
-            for restraint in restraints:
-                a1, a2, a3, a4 = restraint[0]+1
-                phi = np.degrees(restraint[1])
-                itp.write(f'{a1:>5} {a2:>5} {a3:>5} {a4:>5} {1:>5} {phi:>10.4f}  0.0  {fc}\n')
+        with open(f"{directory}/{self.itp_name}", "a") as itp:
+            self.write_restraints(itp, restraints, fc)
+
+    @staticmethod
+    def write_restraints(file, restraints, fc=1000):
+        file.write("[ dihedral_restraints ]\n")
+        file.write(";  ai    aj    ak    al  type       phi   dp   kfac\n")
+        for restraint in restraints:
+            a1, a2, a3, a4 = restraint[0]+1
+            phi = np.degrees(restraint[1])
+            file.write(f'{a1:>5} {a2:>5} {a3:>5} {a4:>5} {1:>5} {phi:>10.4f}  0.0  {fc}\n')
 
     def set_charge(self, non_bonded):
         q = np.copy(non_bonded.q)
@@ -8,7 +8,7 @@ from numba import jit
 """
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def calc_bonds(coords, atoms, r0, fconst, force):
     vec12, r12 = get_dist(coords[atoms[0]], coords[atoms[1]])
     energy = 0.5 * fconst * (r12-r0)**2
@@ -18,7 +18,7 @@ def calc_bonds(coords, atoms, r0, fconst, force):
     return energy
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def calc_angles(coords, atoms, theta0, fconst, force):
     theta, vec12, vec32, r12, r32 = get_angle(coords[atoms])
     cos_theta = math.cos(theta)
@@ -74,7 +74,7 @@ def calc_imp_diheds(coords, atoms, phi0, fconst, force):
     return energy
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def calc_rb_diheds(coords, atoms, params, fconst, force):
     phi, vec_ij, vec_kj, vec_kl, cross1, cross2 = get_dihed(coords[atoms])
     phi += np.pi
@@ -95,7 +95,7 @@ def calc_rb_diheds(coords, atoms, params, fconst, force):
     return energy
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def calc_inversion(coords, atoms, phi0, fconst, force):
     phi, vec_ij, vec_kj, vec_kl, cross1, cross2 = get_dihed(coords[atoms])
     phi += np.pi
@@ -118,7 +118,7 @@ def calc_inversion(coords, atoms, phi0, fconst, force):
     return energy
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def calc_periodic_dihed(coords, atoms, phi0, fconst, force):
     phi, vec_ij, vec_kj, vec_kl, cross1, cross2 = get_dihed(coords[atoms])
     mult = 3
@@ -133,7 +133,7 @@ def calc_periodic_dihed(coords, atoms, phi0, fconst, force):
     return energy
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def convert_to_inversion_rb(fconst, phi0):
     cos_phi0 = np.cos(phi0)
     c0 = fconst * cos_phi0**2
@@ -142,7 +142,7 @@ def convert_to_inversion_rb(fconst, phi0):
     return c0, c1, c2
 
 
-@jit("f8(f8[:], f8[:])", nopython=True)
+@jit("f8(f8[:], f8[:])", nopython=True, cache=True)
 def dot_prod(a, b):
     x = a[0]*b[0]
     y = a[1]*b[1]
@@ -151,7 +151,7 @@ def dot_prod(a, b):
 
 
 @jit("void(f8[:,:], i8[:], f8[:], f8[:], f8[:], f8[:], f8[:], f8)",
-     nopython=True)
+     nopython=True, cache=True)
 def calc_dih_force(force, a, vec_ij, vec_kj, vec_kl, cross1, cross2, ddphi):
     inner1 = dot_prod(cross1, cross1)
     inner2 = dot_prod(cross2, cross2)
@@ -179,7 +179,7 @@ def calc_dih_force(force, a, vec_ij, vec_kj, vec_kl, cross1, cross2, ddphi):
     force[a[3]] += f_l
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def calc_pairs(coords, atoms, params, force):
     c6, c12, qq = params
     vec, r = get_dist(coords[atoms[0]], coords[atoms[1]])
@@ -196,14 +196,14 @@ def calc_pairs(coords, atoms, params, force):
     return energy
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def get_dist(coord1, coord2):
     vec = coord1 - coord2
     r = norm(vec)
     return vec, r
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def get_angle(coords):
     vec12, r12 = get_dist(coords[0], coords[1])
     vec32, r32 = get_dist(coords[2], coords[1])
@@ -215,7 +215,7 @@ def get_angle(coords):
     return math.acos(dot), vec12, vec32, r12, r32
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def get_angle_from_vectors(vec1, vec2):
     dot = np.dot(vec1/norm(vec1), vec2/norm(vec2))
     if dot > 1.0:
@@ -225,7 +225,7 @@ def get_angle_from_vectors(vec1, vec2):
     return math.acos(dot)
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def get_dihed(coords):
     vec12, r12 = get_dist(coords[0], coords[1])
     vec32, r32 = get_dist(coords[2], coords[1])
@@ -238,7 +238,7 @@ def get_dihed(coords):
     return phi, vec12, vec32, vec34, cross1, cross2
 
 
-@jit("f8[:](f8[:], f8[:])", nopython=True)
+@jit("f8[:](f8[:], f8[:])", nopython=True, cache=True)
 def cross_prod(a, b):
     c = np.empty(3, dtype=np.double)
     c[0] = a[1]*b[2] - a[2]*b[1]
@@ -247,7 +247,7 @@ def cross_prod(a, b):
     return c
 
 
-@jit("f8(f8[:])", nopython=True)
+@jit("f8(f8[:])", nopython=True, cache=True)
 def norm(vec):
     return math.sqrt(vec[0]**2 + vec[1]**2 + vec[2]**2)
 
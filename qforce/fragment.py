@@ -1,14 +1,19 @@
-import networkx as nx
 import os
+import re
 import hashlib
 import sys
-import networkx.algorithms.isomorphism as iso
 import numpy as np
 import json
 import pickle
 #
 from .elements import ELE_COV, ATOM_SYM, ELE_ENEG
-from .forces import get_dihed
+from .geometry import get_diheds
+from .misc import LazyImport
+from .qm.logfile import LOG_EXTENSIONS
+from .qm.jobs import run_jobs
+
+nx = LazyImport('networkx')
+iso = LazyImport('networkx.algorithms.isomorphism')
 
 """
 
@@ -20,7 +25,7 @@ Prompt a warning when if any point has an error larger than 2kJ/mol.
 """
 
 
-def fragment(mol, qm, job, config):
+def fragment(mol, qm, job, config, ran_inputs=()):
     fragments = []
     unique_dihedrals = {}
 
@@ -35,12 +40,20 @@ def fragment(mol, qm, job, config):
             unique_dihedrals[name] = term.atomids
 
     generated = []  # Number of fragments generated but not computed
+    inputs = []  # QM inputs written in this pass
     for name, atomids in unique_dihedrals.items():
         frag = Fragment(job, config, mol, qm, atomids, name)
         if frag.has_data:
             fragments.append(frag)
         elif config.scan.batch_run and frag.has_inp:
             generated.append(frag)
+        inputs += frag.inputs
+
+    # run the new inputs and collect the fragments again with their outputs (inputs that
+    # were already run once are not repeated, they fall through to the missing data report)
+    if qm.config.run_jobs != 'no' and inputs and not set(inputs) & set(ran_inputs):
+        run_jobs(inputs, qm.config, qm.software.is_complete)
+        return fragment(mol, qm, job, config, ran_inputs=(*ran_inputs, *inputs))
 
     check_and_notify(job, config.scan, len(unique_dihedrals), len(fragments), len(generated))
 
@@ -96,6 +109,8 @@ class Fragment():
         self.id = ''
         self.has_data = False
         self.has_inp = False
+        self.refining = False
+        self.inputs = []
         self.map_frag_to_db = {}
         self.map_mol_to_frag = {}
         self.elements = []
@@ -293,11 +308,23 @@ class Fragment():
 
     def check_new_scan_data(self, job, mol, config, qm):
         files = [f for f in os.listdir(job.frag_dir) if f.startswith(self.id) and
-                 f.endswith(('log', 'out'))]
+                 f.endswith(LOG_EXTENSIONS)]
+        refine_angles = None
+        if qm.config.adaptive_scan:  # the coarse scan first, then the refinements
+            files.sort(key=lambda f: (f.startswith(f'{self.id}_refine'), f))
+            refine_angles = self.get_refine_angles(job)
+            if files and files[0].startswith(f'{self.id}_refine'):  # coarse scan missing
+                files = []
 
         if files:
+            qm_out = qm.read_scan(files, refine_angles)
+            if qm.config.adaptive_scan:
+                refinements = qm.get_scan_refinements(qm_out.angles, qm_out.energies)
+                if refinements:
+                    self.make_qm_refine_inputs(job, qm, qm_out, refinements)
+                    return
+
             self.has_data = True
-            qm_out = qm.read_scan(files)
             self.qm_energies = qm_out.energies
             self.qm_coords = qm_out.coords
             self.assign_frag_charge(mol, qm_out.charges)
@@ -383,9 +410,14 @@ class Fragment():
             with open(f"{self.dir}/qm_method_{self.hash_idx}", 'w') as file:
                 json.dump(self.graph.graph['qm_method'], file, sort_keys=True, indent=4)
 
-            if not (self.has_data or (config.batch_run and self.has_inp)):
+            if not (self.has_data or self.refining or (config.batch_run and self.has_inp)):
                 self.make_qm_input(job, qm)
 
+    def get_data_files(self):
+        """Files of the fragment library that the scan data of this fragment is taken from"""
+        return [f'{self.dir}/{name}_{self.hash_idx}{ext}' for name, ext in
+                [('scandata', ''), ('scancoords', '.npy'), ('charges', '')]]
+
     def assign_frag_charge(self, mol, charges):
         if (self.charge_method in charges.keys() and
                 not (self.ext_charges and self.use_ext_charges_for_frags)):
@@ -412,9 +444,38 @@ class Fragment():
             atnums.append(data[1]['elem'])
 
         coords = np.array(coords)
-        start_angle = np.degrees(get_dihed(coords[self.scanned_atomids])[0])
+        start_angle = np.degrees(get_diheds(coords, self.scanned_atomids)[0])
 
-        with open(f'{job.frag_dir}/{self.id}.inp', 'w') as file:
+        file_name = f'{job.frag_dir}/{self.id}.inp'
+        with open(file_name, 'w') as file:
             qm.write_scan(file, self.id, coords, atnums, self.graph.graph['scan'], start_angle,
                           self.graph.graph['qm_method']['charge'],
                           self.graph.graph['qm_method']['multiplicity'])
+        self.inputs.append(file_name)
+
+    def get_refine_angles(self, job):
+        """Midpoints of the requested refinements of an adaptive scan (from their inputs)."""
+        refine = re.compile(rf'{re.escape(self.id)}_refine(\d+)\.inp$')
+        return [int(match.group(1)) for match in map(refine.match, os.listdir(job.frag_dir))
+                if match]
+
+    def make_qm_refine_inputs(self, job, qm, qm_out, refinements):
+        """
+        Adaptive scan: one single step scan for each interval to be split, starting from the
+        optimized geometry at the beginning of the interval.
+        """
+        self.refining = True
+        atnums = [data[1]['elem'] for data in sorted(self.graph.nodes.data())]
+
+        for idx, step_size in refinements:
+            coords = qm_out.coords[idx]
+            start_angle = np.degrees(get_diheds(coords, self.scanned_atomids)[0])
+            refine_id = f'{self.id}_refine{round(qm_out.angles[idx] + step_size) % 360:03d}'
+
+            file_name = f'{job.frag_dir}/{refine_id}.inp'
+            with open(file_name, 'w') as file:
+                qm.write_scan(file, refine_id, coords, atnums, self.graph.graph['scan'],
+                              start_angle, self.graph.graph['qm_method']['charge'],
+                              self.graph.graph['qm_method']['multiplicity'],
+                              step_size=step_size, n_steps=1)
+            self.inputs.append(file_name)
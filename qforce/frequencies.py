@@ -1,34 +1,26 @@
 import numpy as np
-from scipy.linalg import eigh
-import seaborn as sns
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 #
 from .elements import ATOMMASS, ATOM_SYM
+from .plots import plot_frequencies
+from .misc import LazyImport
 
+linalg = LazyImport('scipy.linalg')
 
-def calc_qm_vs_md_frequencies(job, qm, md_hessian):
+
+def calc_qm_vs_md_frequencies(job, qm, md_hessian, plots='inline'):
+    qm_freq, qm_vec, md_freq, md_vec = get_qm_vs_md_frequencies(qm, md_hessian)
+    write_vibrational_frequencies(qm_freq, qm_vec, md_freq, md_vec, qm, job)
+    np.save(f'{job.dir}/frequencies', np.vstack((qm_freq, md_freq)))
+    if plots == 'inline':
+        plot_frequencies(f'{job.dir}/frequencies.npy')
+    return qm_freq, md_freq
+
+
+def get_qm_vs_md_frequencies(qm, md_hessian):
+    """QM and MD vibrational frequencies and modes: (qm_freq, qm_vec, md_freq, md_vec)"""
     qm_freq, qm_vec = calc_vibrational_frequencies(qm.hessian, qm)
     md_freq, md_vec = calc_vibrational_frequencies(md_hessian, qm)
-    mean_percent_error = write_vibrational_frequencies(qm_freq, qm_vec, md_freq, md_vec, qm, job)
-    plot_frequencies(job, qm_freq, md_freq, mean_percent_error)
-
-
-def plot_frequencies(job, qm_freq, md_freq, mean_percent_error):
-    n_freqs = np.arange(len(qm_freq))+1
-    width, height = plt.figaspect(0.6)
-    f = plt.figure(figsize=(width, height), dpi=300)
-    sns.set(font_scale=1.3)
-    plt.title(f'Mean Percent Error = {round(mean_percent_error, 2)}%', loc='left')
-    plt.xlabel('Vibrational Mode #')
-    plt.ylabel(r'Frequencies (cm$^{-1}$)')
-    plt.plot(n_freqs, qm_freq, linewidth=3, label='QM')
-    plt.plot(n_freqs, md_freq, linewidth=3, label='Q-Force')
-    plt.tight_layout()
-    plt.legend(ncol=2, bbox_to_anchor=(1.03, 1.12), frameon=False)
-    f.savefig(f"{job.dir}/frequencies.pdf", bbox_inches='tight')
-    plt.close()
+    return qm_freq, qm_vec, md_freq, md_vec
 
 
 def calc_vibrational_frequencies(upper, qm):
@@ -53,7 +45,7 @@ def calc_vibrational_frequencies(upper, qm):
             matrix[i, j] = upper[count]/np.sqrt(mass_i*mass_j)
             matrix[j, i] = matrix[i, j]
             count += 1
-    val, vec = eigh(matrix)
+    val, vec = linalg.eigh(matrix)
     vec = np.reshape(np.transpose(vec), (3*qm.n_atoms, qm.n_atoms, 3))[6:]
 
     for i in range(qm.n_atoms):
@@ -0,0 +1,68 @@
+import numpy as np
+
+"""
+
+Vectorized geometry kernels: measure many distances, angles or dihedrals over many geometries in
+one call. coords is (n_frames, n_atoms, 3) or a single (n_atoms, 3) geometry, indices is
+(n_tuples, k). The results are (n_frames, n_tuples), or (n_tuples,) for a single geometry.
+Angles are in radians, dihedrals between -pi and pi with the sign convention of
+forces.get_dihed. The scalar helpers in forces are left to the force kernels, which also need
+the vectors.
+
+"""
+
+
+def get_dists(coords, indices):
+    coords, indices, single = _prepare(coords, indices, 2)
+    dists = np.linalg.norm(coords[:, indices[:, 0]] - coords[:, indices[:, 1]], axis=-1)
+    return dists[0] if single else dists
+
+
+def get_angles(coords, indices):
+    coords, indices, single = _prepare(coords, indices, 3)
+    vec12 = coords[:, indices[:, 0]] - coords[:, indices[:, 1]]
+    vec32 = coords[:, indices[:, 2]] - coords[:, indices[:, 1]]
+    cos_theta = (_dot(vec12, vec32) / np.linalg.norm(vec12, axis=-1)
+                 / np.linalg.norm(vec32, axis=-1))
+    angles = np.arccos(np.clip(cos_theta, -1., 1.))
+    return angles[0] if single else angles
+
+
+def get_diheds(coords, indices):
+    coords, indices, single = _prepare(coords, indices, 4)
+    vec12 = coords[:, indices[:, 0]] - coords[:, indices[:, 1]]
+    vec32 = coords[:, indices[:, 2]] - coords[:, indices[:, 1]]
+    vec34 = coords[:, indices[:, 2]] - coords[:, indices[:, 3]]
+    cross1 = np.cross(vec12, vec32)
+    cross2 = np.cross(vec32, vec34)
+    cos_phi = (_dot(cross1, cross2) / np.linalg.norm(cross1, axis=-1)
+               / np.linalg.norm(cross2, axis=-1))
+    phi = np.arccos(np.clip(cos_phi, -1., 1.))
+    phi = np.where(_dot(vec12, cross2) < 0, -phi, phi)
+    return phi[0] if single else phi
+
+
+def _prepare(coords, indices, n_indices):
+    coords = np.asarray(coords, dtype=float)
+    indices = np.asarray(indices, dtype=int).reshape(-1, n_indices)
+    single = coords.ndim == 2
+    if single:
+        coords = coords[np.newaxis]
+    return coords, indices, single
+
+
+def _dot(vec1, vec2):
+    return np.einsum('...i,...i->...', vec1, vec2)
+
+
+def set_dists(coords, indices, dists):
+    """
+    Move the first atom of each pair along the pair vector so that the pairs are at dists,
+    in place for all frames.
+    """
+    coords = np.asarray(coords)
+    indices = np.asarray(indices, dtype=int).reshape(-1, 2)
+    frames = coords if coords.ndim == 3 else coords[np.newaxis]
+    vec = frames[:, indices[:, 0]] - frames[:, indices[:, 1]]
+    vec *= (np.asarray(dists) / np.linalg.norm(vec, axis=-1))[..., np.newaxis]
+    frames[:, indices[:, 0]] = frames[:, indices[:, 1]] + vec
@@ -1,5 +1,8 @@
-import scipy.optimize as optimize
 import numpy as np
+#
+from .misc import LazyImport
+
+optimize = LazyImport('scipy.optimize')
 
 
 def fit_hessian(config, mol, qm):
@@ -60,6 +63,29 @@ def calc_hessian(coords, mol):
     return full_hessian
 
 
+def calc_term_hessian(coords, terms, dx=0.003):
+    """
+    Scope:
+    -----
+    Numerical MM hessian of a geometry with the current force constants of the terms.
+    """
+    n_coords = coords.size
+    hessian = np.zeros((n_coords, n_coords))
+    coords = np.array(coords, dtype=float)
+
+    for i in range(n_coords):
+        displaced = []
+        for sign in [1, -1]:
+            crd = coords.copy()
+            crd.flat[i] += sign * dx
+            force = np.zeros(coords.shape)
+            for term in terms:
+                term.do_force(crd, force)
+            displaced.append(force.ravel())
+        hessian[i] = - (displaced[0] - displaced[1]) / (2 * dx)
+    return (hessian + hessian.T) / 2
+
+
 def calc_forces(coords, mol):
     """
     Scope:
@@ -2,7 +2,6 @@ import os
 import shutil
 from io import StringIO
 from types import SimpleNamespace
-import pkg_resources
 #
 from colt import Colt
 #
@@ -11,6 +10,9 @@ from .molecule.terms import Terms
 from .dihedral_scan import DihedralScan
 from .misc import LOGO
 
+# force field libraries and default mdp settings shipped with qforce
+MD_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
 
 class Initialize(Colt):
     _user_input = """
@@ -68,6 +70,21 @@ _d4 = no :: bool
 # Residue name printed on the force field file (Max 5 characters)
 res_name = MOL :: str
 
+# Validation plots (frequencies, dihedral profiles): rendered during the run (inline), only their
+# data saved to be rendered later with "qforce report" (deferred), or not mentioned at all (none)
+plots = deferred :: str :: [none, deferred, inline]
+
+# Store the results of the pipeline stages (molecule, Hessian fit, dihedral fit) in the
+# checkpoints subdirectory of the job and take them from there when their inputs are unchanged
+checkpoints = yes :: bool
+
+# Directory of a store of finished runs, shared between jobs (e.g. in a screening): a run with the
+# same QM data, settings and qforce version copies its outputs from there instead of computing them
+result_cache = :: folder, optional
+
+# Maximum size of the result_cache store (MB), the least recently used runs are removed first
+result_cache_size = 1000.0 :: float
+
 # Polarize a coordinate file and quit (requires itp_file)
 _polarize = no :: bool
 
@@ -139,7 +156,7 @@ def _get_job_info(filename):
 
     job['dir'] = f'{path}{job["name"]}_qforce'
     job['frag_dir'] = f'{job["dir"]}/fragments'
-    job['md_data'] = pkg_resources.resource_filename('qforce', 'data')
+    job['md_data'] = MD_DATA
     os.makedirs(job['dir'], exist_ok=True)
     return SimpleNamespace(**job)
 
@@ -172,3 +189,15 @@ def initialize(filename, config_file, presets=None):
     config = Initialize.from_questions(config=settings_file, presets=presets, check_only=True)
 
     return config, job_info
+
+
+def get_config(config_file=None, presets=None):
+    """Settings from a file name or StringIO (default settings if None), without a job."""
+    return Initialize.from_questions(config=config_file, presets=presets, check_only=True)
+
+
+def get_memory_job(name, job_dir=None):
+    """Job info of a run without a job directory: job_dir is only set if outputs are wanted."""
+    frag_dir = None if job_dir is None else f'{job_dir}/fragments'
+    return SimpleNamespace(coord_file=False, name=name, dir=job_dir, frag_dir=frag_dir,
+                           md_data=MD_DATA)
@@ -1,13 +1,22 @@
-from .polarize import polarize
-from .initialize import initialize
+import os
+import sys
+from io import StringIO
+from types import SimpleNamespace
+from contextlib import redirect_stdout, nullcontext
+#
+from .initialize import initialize, get_config, get_memory_job
 from .qm.qm import QM
 from .qm.qm_base import HessianOutput
 from .forcefield import ForceField
 from .molecule import Molecule
 from .fragment import fragment
 from .dihedral_scan import DihedralScan
-from .frequencies import calc_qm_vs_md_frequencies
+from .frequencies import calc_qm_vs_md_frequencies, get_qm_vs_md_frequencies
 from .hessian import fit_hessian
+from .plots import make_report
+from .checkpoint import run_stage, make_key, read_job_files, get_settings
+from .result_cache import restore_results, store_results, get_cache_settings
+from .qm.parse_cache import hash_file
 
 from .misc import check_if_file_exists, LOGO
 from colt import from_commandline
@@ -33,57 +42,271 @@ options = :: file, optional, alias=o
         'comment': 60,
         },
 })
-def run(file, options):
+def run_single(file, options):
     run_qforce(input_arg=file, config=options)
 
 
+@from_commandline("""
+# Directory with the coordinate files (mol.ext) and/or job directories (mol_qforce) of all
+# molecules, or a file listing them (one per line).
+molecules = :: file
+
+# File name for the optional options (used for all molecules).
+options = :: file, optional, alias=o
+
+# Number of worker processes for the Hessian and dihedral fitting.
+n_workers = 1 :: int, alias=n
+""", description={
+    'logo': LOGO,
+    'alias': 'qforce batch',
+    'arg_format': {
+        'name': 12,
+        'comment': 60,
+        },
+})
+def run_batch_commandline(molecules, options, n_workers):
+    from .batch import run_batch
+    run_batch(molecules, config=options, n_workers=n_workers)
+
+
+@from_commandline("""
+# Job directory (mol_qforce) of a finished run
+job_dir = :: existing_folder
+
+# Also render the extra dihedral fitting plots (needs the fit data of the run)
+plot_fit = no :: bool
+
+# Number of worker processes for rendering the plots
+n_proc = 1 :: int, alias=n
+""", description={
+    'logo': LOGO,
+    'alias': 'qforce report',
+    'arg_format': {
+        'name': 12,
+        'comment': 60,
+        },
+})
+def run_report_commandline(job_dir, plot_fit, n_proc):
+    data_files = make_report(job_dir, plot_fit=plot_fit, n_proc=n_proc)
+    print(f'Plots are rendered for {len(data_files)} data file(s) in: {job_dir}.')
+
+
+def run():
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        del sys.argv[1]
+        run_batch_commandline()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'report':
+        del sys.argv[1]
+        run_report_commandline()
+    else:
+        run_single()
+
+
 def run_qforce(input_arg, ext_q=None, ext_lj=None, config=None, presets=None):
+    run = setup_run(*initialize_run(input_arg, config, presets), ext_q, ext_lj)
+    run.mol, run.md_hessian = fit_run_hessian(run.config, run.job, run.qm_out, run.ext_q,
+                                              run.ext_lj)
+    run.fragments = make_run_fragments(run)
+    if not restore_run(run):
+        fit_run_dihedrals(run.config, run.job, run.qm_out, run.ext_q, run.ext_lj, run.mol,
+                          run.md_hessian, run.fragments, run.result_key)
+    print_outcome(run.job.dir, run.config.ff.plots)
+
+
+# Stages of run_qforce, also used by the batch driver (which runs the fitting stages on its
+# worker pool): initialize_run -> setup_run -> fit_run_hessian -> make_run_fragments ->
+# restore_run (result cache) -> fit_run_dihedrals
+def initialize_run(input_arg, config=None, presets=None):
     config, job = initialize(input_arg, config, presets)
 
     if config.ff._polarize:
+        from .polarize import polarize
         polarize(job, config.ff)
+    return config, job
 
+
+def setup_run(config, job, ext_q=None, ext_lj=None):
     qm = QM(job, config.qm)
-    qm_hessian_out = qm.read_hessian()
+    return SimpleNamespace(config=config, job=job, qm=qm, ext_q=ext_q, ext_lj=ext_lj,
+                           qm_out=qm.read_hessian(), mol=None, md_hessian=None, fragments=[],
+                           result_key=None)
 
-    mol = Molecule(config, job, qm_hessian_out, ext_q, ext_lj)
 
-    md_hessian = fit_hessian(config.terms, mol, qm_hessian_out)
+def get_hessian_key(config, job, qm_out, ext_q, ext_lj):
+    mol_key = make_key(qm_out.__dict__, get_settings(config.ff, 'ff'), config.terms, job.name,
+                       ext_q, ext_lj, read_job_files(job, ['ext_q', 'ext_lj', 'ext_alpha']))
+    return mol_key, make_key(mol_key, 'hessian_fit')
+
+
+def fit_run_hessian(config, job, qm_out, ext_q, ext_lj):
+    """Molecule with the fitted Hessian terms and its MD Hessian (checkpointed stages)."""
+    mol_key, hessian_key = get_hessian_key(config, job, qm_out, ext_q, ext_lj)
+
+    def make_molecule():
+        return Molecule(config, job, qm_out, ext_q, ext_lj)
+
+    def fit_molecule_hessian():
+        mol = run_stage(job, 'molecule', mol_key, make_molecule, config.ff.checkpoints)
+        return mol, fit_hessian(config.terms, mol, qm_out)
+
+    return run_stage(job, 'hessian_fit', hessian_key, fit_molecule_hessian,
+                     config.ff.checkpoints)
+
+
+def make_run_fragments(run):
+    """Fragments of the flexible dihedrals with their scan data (exits if data is missing)."""
+    if len(run.mol.terms['dihedral/flexible']) > 0 and run.config.scan.do_scan:
+        return fragment(run.mol, run.qm, run.job, run.config)
+    return []
+
+
+def restore_run(run):
+    """
+    Take the outputs from the result cache if it has a run with the same QM data, settings,
+    qforce code and fragments with the same scan data (a partial run with avail_only or
+    batch_run is not reused once more scan data is there).
+    """
+    store = run.config.ff.result_cache
+    if not store:
+        return False
+
+    job, qm = run.job, run.qm
+    run.result_key = make_key('run_qforce', job.name, get_cache_settings(run.config), run.ext_q,
+                              run.ext_lj, {req: hash_file(file)
+                                           for req, file in qm.hessian_files.items()},
+                              read_job_files(job, ['ext_q', 'ext_lj', 'ext_alpha']),
+                              [(frag.id, [hash_file(file) for file in frag.get_data_files()
+                                          if os.path.isfile(file)])
+                               for frag in run.fragments])
+    return restore_results(store, run.result_key, job.dir) is not None
+
+
+def fit_run_dihedrals(config, job, qm_out, ext_q, ext_lj, mol, md_hessian, fragments,
+                      result_key=None):
+    """Dihedral fitting (checkpointed) and the outputs of the run, stored in the result cache."""
+    if fragments:
+        _, hessian_key = get_hessian_key(config, job, qm_out, ext_q, ext_lj)
+        dihedral_key = make_key(hessian_key, get_settings(config.scan, 'scan'),
+                                get_settings(config.qm, 'qm'),
+                                [(frag.id, frag.qm_energies, frag.qm_coords, frag.frag_charges)
+                                 for frag in fragments])
 
-    if len(mol.terms['dihedral/flexible']) > 0 and config.scan.do_scan:
-        fragments = fragment(mol, qm, job, config)
-        DihedralScan(fragments, mol, job, config)
+        def fit_dihedrals():
+            DihedralScan(fragments, mol, job, config)
+            return mol
 
-    calc_qm_vs_md_frequencies(job, qm_hessian_out, md_hessian)
+        mol = run_stage(job, 'dihedral_fit', dihedral_key, fit_dihedrals, config.ff.checkpoints)
+
+    calc_qm_vs_md_frequencies(job, qm_out, md_hessian, config.ff.plots)
     ff = ForceField(job.name, config, mol, mol.topo.neighbors)
-    ff.write_gromacs(job.dir, mol, qm_hessian_out.coords)
+    ff.write_gromacs(job.dir, mol, qm_out.coords)
 
-    print_outcome(job.dir)
+    if config.ff.result_cache:
+        store_results(config.ff.result_cache, result_key, job.dir, mol.terms,
+                      [file for frag in fragments for file in frag.get_data_files()],
+                      config.ff.result_cache_size)
+    return job.dir
 
 
 def run_hessian_fitting_for_external(job_dir, qm_data, ext_q=None, ext_lj=None,
                                      config=None, presets=None):
     config, job = initialize(job_dir, config, presets)
 
+    store = config.ff.result_cache
+    if store:
+        result_key = make_key('external', job.name, get_cache_settings(config), ext_q, ext_lj,
+                              qm_data, read_job_files(job, ['ext_q', 'ext_lj', 'ext_alpha']))
+        terms = restore_results(store, result_key, job.dir)
+        if terms is not None:
+            print_outcome(job.dir, config.ff.plots)
+            return terms
+
     qm_hessian_out = HessianOutput(config.qm.vib_scaling, **qm_data)
 
     mol = Molecule(config, job, qm_hessian_out, ext_q, ext_lj)
 
     md_hessian = fit_hessian(config.terms, mol, qm_hessian_out)
-    calc_qm_vs_md_frequencies(job, qm_hessian_out, md_hessian)
+    calc_qm_vs_md_frequencies(job, qm_hessian_out, md_hessian, config.ff.plots)
 
     ff = ForceField(job.name, config, mol, mol.topo.neighbors)
     ff.write_gromacs(job.dir, mol, qm_hessian_out.coords)
 
-    print_outcome(job.dir)
+    if store:
+        store_results(store, result_key, job.dir, mol.terms, max_size=config.ff.result_cache_size)
+
+    print_outcome(job.dir, config.ff.plots)
 
     return mol.terms
 
 
-def print_outcome(job_dir):
+def run_hessian_fitting_in_memory(qm_data, name='mol', ext_q=None, ext_lj=None, config=None,
+                                  presets=None, output_dir=None, serialize=False, verbose=False):
+    """
+    Hessian fitting for QM data held in memory (e.g. many QM records in a loop): no job directory
+    is created and nothing is written or printed unless output_dir / verbose are given.
+
+    config: settings file name, StringIO or the namespace of get_config (parse it once for a loop)
+
+    Returns a namespace with the fitted terms, the non_bonded parameters, the QM and MD
+    frequencies (cm-1), the GROMACS files as {file name: content} if serialize (else None) and
+    the log of the run.
+    """
+    log = StringIO()
+    with nullcontext() if verbose else redirect_stdout(log):
+        if not isinstance(config, SimpleNamespace):
+            config = get_config(config, presets)
+        if output_dir is None:
+            check_memory_settings(config.ff, ext_q, ext_lj)
+        job = get_memory_job(name, output_dir)
+
+        qm_hessian_out = HessianOutput(config.qm.vib_scaling, **qm_data)
+        mol = Molecule(config, job, qm_hessian_out, ext_q, ext_lj)
+        md_hessian = fit_hessian(config.terms, mol, qm_hessian_out)
+        ff = ForceField(name, config, mol, mol.topo.neighbors)
+
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+            qm_freq, md_freq = calc_qm_vs_md_frequencies(job, qm_hessian_out, md_hessian,
+                                                         config.ff.plots)
+            ff.write_gromacs(output_dir, mol, qm_hessian_out.coords)
+        else:
+            qm_freq, _, md_freq, _ = get_qm_vs_md_frequencies(qm_hessian_out, md_hessian)
+
+        force_field = ff.get_gromacs(mol, qm_hessian_out.coords) if serialize else None
+
+    return SimpleNamespace(terms=mol.terms, non_bonded=mol.non_bonded,
+                           frequencies=SimpleNamespace(qm=qm_freq, md=md_freq),
+                           force_field=force_field, log=log.getvalue())
+
+
+def check_memory_settings(config, ext_q, ext_lj):
+    """
+    Without output_dir there is no job directory to read the ext_q, ext_lj and ext_alpha files
+    from: the external charges and LJ types have to be given as ext_q / ext_lj.
+    """
+    if config.ext_charges and ext_q is None:
+        raise ValueError('"ext_charges" is set but no ext_q is given: pass the charges as ext_q, '
+                         'or an output_dir with the "ext_q" file.')
+    if (not config._d4 and not config.lennard_jones.endswith('_auto')
+            and (ext_lj is None or 'lj_types' not in ext_lj)):
+        raise ValueError(f'"lennard_jones = {config.lennard_jones}" needs the atom types: pass '
+                         'them as ext_lj={"lj_types": [...]}, or an output_dir with the '
+                         '"ext_lj" file.')
+    if config._polar and config._ext_alpha:
+        raise ValueError('"_ext_alpha" reads the "ext_alpha" file: give an output_dir with it.')
+
+
+def print_outcome(job_dir, plots='inline'):
     print(f'Output files can be found in the directory: {job_dir}.')
     print('- Q-Force force field parameters in GROMACS format (gas.gro, gas.itp, gas.top).')
-    print('- QM vs MM vibrational frequencies, pre-dihedral fitting (frequencies.txt,'
-          ' frequencies.pdf).')
+    if plots == 'inline':
+        print('- QM vs MM vibrational frequencies, pre-dihedral fitting (frequencies.txt,'
+              ' frequencies.pdf).')
+    else:
+        print('- QM vs MM vibrational frequencies, pre-dihedral fitting (frequencies.txt).')
     print('- Vibrational modes which can be visualized in VMD (frequencies.nmd).')
-    print('- QM vs MM dihedral profiles (if any) in "fragments" folder as ".pdf" files.')
+    if plots == 'inline':
+        print('- QM vs MM dihedral profiles (if any) in "fragments" folder as ".pdf" files.')
+    elif plots == 'deferred':
+        print(f'- Plots of the frequencies and dihedral profiles (if any) can be rendered with:'
+              f' qforce report {job_dir}')
@@ -1,5 +1,7 @@
 import os
 import sys
+import importlib
+from concurrent.futures import ProcessPoolExecutor
 
 LOGO = """
           ____         ______
@@ -28,7 +30,52 @@ LOGO_SEMICOL = """
 """
 
 
+def get_version():
+    try:
+        from importlib import metadata
+    except ImportError:  # python 3.7
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution('qforce').version
+        except pkg_resources.DistributionNotFound:  # running from a source tree
+            return 'unknown'
+    try:
+        return metadata.version('qforce')
+    except metadata.PackageNotFoundError:  # running from a source tree
+        return 'unknown'
+
+
 def check_if_file_exists(filename):
     if not os.path.exists(filename) and not os.path.exists(f'{filename}_qforce'):
         raise ValueError(f'"{filename}" does not exist.\n')
     return filename
+
+
+class LazyImport:
+    """
+    Stand-in for a heavy module that is only imported at its first attribute access, so that
+    starting qforce does not pay for dependencies of stages that are not run.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def run_in_pool(function, tasks, n_proc, executor=ProcessPoolExecutor):
+    """
+    Call function(*task) for each task on up to n_proc workers and return the results in the
+    order of the tasks. With a single worker (or task) everything runs in the current process.
+    """
+    tasks = list(tasks)
+    if n_proc <= 1 or len(tasks) <= 1:
+        return [function(*task) for task in tasks]
+
+    with executor(max_workers=min(n_proc, len(tasks))) as pool:
+        futures = [pool.submit(function, *task) for task in tasks]
+        return [future.result() for future in futures]
@@ -2,7 +2,7 @@ from itertools import product
 import numpy as np
 #
 from .baseterms import TermABC, TermFactory
-from ..forces import get_dihed, get_angle
+from ..geometry import get_diheds, get_angles
 from ..forces import calc_imp_diheds, calc_rb_diheds, calc_inversion  # , calc_periodic_dihed
 
 
@@ -23,7 +23,7 @@ class DihedralBaseTerm(TermABC):
             d_type.reverse()
             t23.reverse()
 
-        phi = get_dihed(topo.coords[[a1, a2, a3, a4]])[0]
+        phi = get_diheds(topo.coords, [a1, a2, a3, a4])[0]
         phi = np.degrees(abs(phi))
 
         # To prevent very different angles being considered the same term
@@ -41,8 +41,10 @@ class DihedralBaseTerm(TermABC):
     @staticmethod
     def remove_linear_angles(coords, a1s, a2, a3, a4s):
         # Don't add a dihedral if its 3-atom planes have an angle > 170 degrees
-        a1s = [a1 for a1 in a1s if get_angle(coords[[a1, a2, a3]])[0] < 2.9671]
-        a4s = [a4 for a4 in a4s if get_angle(coords[[a4, a3, a2]])[0] < 2.9671]
+        a1s = [a1 for a1, theta in zip(a1s, get_angles(coords, [[a1, a2, a3] for a1 in a1s]))
+               if theta < 2.9671]
+        a4s = [a4 for a4, theta in zip(a4s, get_angles(coords, [[a4, a3, a2] for a4 in a4s]))
+               if theta < 2.9671]
         return a1s, a4s
 
     @staticmethod
@@ -55,7 +57,7 @@ class DihedralBaseTerm(TermABC):
 
     @classmethod
     def get_term(cls, topo, atomids, d_type):
-        phi = get_dihed(topo.coords[atomids])[0]
+        phi = get_diheds(topo.coords, atomids)[0]
         phi = DihedralBaseTerm.check_angle(phi)
         return cls(atomids, phi, d_type)
 
@@ -161,8 +163,7 @@ class DihedralTerms(TermFactory):
                 atoms_in_ring = [a for a in atoms_comb if any(set(a).issubset(set(r))
                                  for r in topo.rings)]
 
-                for atoms in atoms_in_ring:
-                    phi = get_dihed(topo.coords[atoms])[0]
+                for atoms, phi in zip(atoms_in_ring, get_diheds(topo.coords, atoms_in_ring)):
                     d_type = get_dtype(topo, *atoms)
 
                     if abs(phi) < 0.43625:  # check planarity < 25 degrees
@@ -197,7 +198,7 @@ class DihedralTerms(TermFactory):
                 if b not in atoms:
                     atoms[atoms.index(-1)] = b
 
-            phi = get_dihed(topo.coords[atoms])[0]
+            phi = get_diheds(topo.coords, atoms)[0]
             # Only add improper dihedrals if there is no stiff dihedral
             # on the central improper atom and one of the neighbors
             bonds = [sorted([b, i]) for b in bonds]
@@ -214,15 +215,14 @@ class DihedralTerms(TermFactory):
 def check_if_in_a_fully_planar_ring(topo, a2, a3):
     rings = [r for r in topo.rings if set([a2, a3]).issubset(set(r))]
     for ring in rings:
-        is_planar = []
+        diheds = []
         ring_graph = topo.graph.subgraph(ring)
         for edge in ring_graph.edges:
             a1 = [n for n in list(ring_graph.neighbors(edge[0])) if n not in edge][0]
             a4 = [n for n in list(ring_graph.neighbors(edge[1])) if n not in edge][0]
-            dihed = [a1, edge[0], edge[1], a4]
+            diheds.append([a1, edge[0], edge[1], a4])
 
-            is_planar.append(get_dihed(topo.coords[dihed])[0] < 0.43625)  # < 25 degrees
-        if all(is_planar):
+        if all(get_diheds(topo.coords, diheds) < 0.43625):  # < 25 degrees
             all_planar = True
             break
     else:
@@ -246,8 +246,10 @@ def find_flexible_atoms(topo, a1s, a2, a3, a4s):
 
     priority = [[] for _ in range(6)]
 
-    for a1, a4 in product(a1s, a4s):
-        phi = np.degrees(abs(get_dihed(topo.coords[[a1, a2, a3, a4]])[0]))
+    ends = list(product(a1s, a4s))
+    phis = np.degrees(np.abs(get_diheds(topo.coords, [[a1, a2, a3, a4] for a1, a4 in ends])))
+
+    for (a1, a4), phi in zip(ends, phis):
         if phi > 155:
             priority[0].append([a1, a4])
         elif phi < 25:
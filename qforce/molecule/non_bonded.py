@@ -1,12 +1,14 @@
 import subprocess
 import numpy as np
-import pulp
 import sys
 import os
-from scipy.optimize import curve_fit
 from itertools import combinations_with_replacement
 #
 from ..elements import ATOM_SYM
+from ..misc import LazyImport
+
+pulp = LazyImport('pulp')
+optimize = LazyImport('scipy.optimize')
 
 
 class NonBonded():
@@ -653,8 +655,9 @@ def handle_d4(job, comb_rule, qm_out, topo):
 
     d4_out = run_d4(qm_out.charge)
 
-    with open(f'{job.dir}/dftd4_results', 'w') as dftd4_file:
-        dftd4_file.write(d4_out)
+    if job.dir is not None:  # in-memory runs have no job directory
+        with open(f'{job.dir}/dftd4_results', 'w') as dftd4_file:
+            dftd4_file.write(d4_out)
 
     for line in d4_out.split('\n'):
         if 'number of atoms' in line:
@@ -710,7 +713,7 @@ def calc_c6_c12(comb_rule, qm_out, topo, c6s, c8s, r_rels):
         c12 = (c6 + c8/r_vdw**2 + c10/r_vdw**4) * r_vdw**6 / 2
         lj = c12/r**12 - c6/r**6 - c8/r**8 - c10/r**10
         weight = 10*(1-lj / min(lj))+1
-        popt, _ = curve_fit(calc_lj, r, lj, absolute_sigma=False, sigma=weight)
+        popt, _ = optimize.curve_fit(calc_lj, r, lj, absolute_sigma=False, sigma=weight)
         new_ljs.append(popt)
 
     new_ljs = np.array(new_ljs)*hartree2kjmol
@@ -2,7 +2,7 @@ import numpy as np
 #
 from .baseterms import TermBase
 #
-from ..forces import get_dist, get_angle
+from ..geometry import get_dists, get_angles
 from ..forces import calc_bonds, calc_angles, calc_cross_bond_angle
 
 
@@ -37,10 +37,11 @@ class AngleTerm(TermBase):
     def get_terms(cls, topo, non_bonded):
         angle_terms = cls.get_terms_container()
 
-        for a1, a2, a3 in topo.angles:
+        thetas = get_angles(topo.coords, topo.angles)
+
+        for (a1, a2, a3), theta in zip(topo.angles, thetas):
 
             if not topo.edge(a2, a1)['in_ring3'] or not topo.edge(a2, a3)['in_ring3']:
-                theta = get_angle(topo.coords[[a1, a2, a3]])[0]
                 if theta > 2.9671:  # if angle is larger than 170 degree, make it 180
                     theta = np.pi
 
@@ -64,9 +65,10 @@ class UreyAngleTerm(TermBase):
     def get_terms(cls, topo, non_bonded):
         urey_terms = cls.get_terms_container()
 
-        for a1, a2, a3 in topo.angles:
-            dist = get_dist(topo.coords[a1], topo.coords[a3])[1]
-            theta = get_angle(topo.coords[[a1, a2, a3]])[0]
+        thetas = get_angles(topo.coords, topo.angles)
+        dists = get_dists(topo.coords, np.reshape(topo.angles, (-1, 3))[:, [0, 2]])
+
+        for (a1, a2, a3), theta, dist in zip(topo.angles, thetas, dists):
             #  No Urey term  if linear angle (>170) or if in 3-member ring
             if theta < 2.9671 and (not topo.edge(a2, a1)['in_ring3'] or
                                    not topo.edge(a2, a3)['in_ring3']):
@@ -92,15 +94,14 @@ class CrossBondAngleTerm(TermBase):
 
         cross_bond_angle_terms = cls.get_terms_container()
 
-        for a1, a2, a3 in topo.angles:
-            theta = get_angle(topo.coords[[a1, a2, a3]])[0]
+        thetas = get_angles(topo.coords, topo.angles)
+        # 1-2, 3-2 and 1-3 distances of each angle
+        all_dists = get_dists(topo.coords, np.reshape(topo.angles, (-1, 3))[:, [0, 1, 2, 1, 0, 2]])
+
+        for (a1, a2, a3), theta, dists in zip(topo.angles, thetas, all_dists.reshape(-1, 3)):
             #  No CrossBondAngle term  if linear angle (>170) or if in 3-member ring
             if theta < 2.9671 and (not topo.edge(a2, a1)['in_ring3'] or
                                    not topo.edge(a2, a3)['in_ring3']):
-                dist12 = get_dist(topo.coords[a1], topo.coords[a2])[1]
-                dist32 = get_dist(topo.coords[a3], topo.coords[a2])[1]
-                dist13 = get_dist(topo.coords[a1], topo.coords[a3])[1]
-                dists = np.array([dist12, dist32, dist13])
 
                 b21 = topo.edge(a2, a1)['vers']
                 b23 = topo.edge(a2, a3)['vers']
@@ -1,7 +1,9 @@
-import networkx as nx
 import numpy as np
 #
 from ..elements import ATOM_SYM, ELE_MAXB
+from ..misc import LazyImport
+
+nx = LazyImport('networkx')
 
 
 class Topology(object):
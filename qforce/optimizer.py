@@ -0,0 +1,200 @@
+import numpy as np
+#
+from .forces import calc_imp_diheds, calc_dih_force, get_dihed
+
+"""
+
+In-house restrained minimizer for the MM relaxed dihedral scans. Works on flat coordinate arrays
+and calls the term kernels directly, without the ASE Atoms/Calculator/Optimizer machinery.
+
+"""
+
+
+def calc_mm(coords, terms, dihedral_restraints, restraint_fconst=10000):
+    """
+    Energy (without the restraints), restraint energy and forces of a geometry.
+    Same force field as the ASE QForce calculator.
+    """
+    forces = np.zeros(coords.shape)
+    energy, restraint_energy = 0., 0.
+
+    for term in terms:
+        energy += term.do_force(coords, forces)
+
+    for atoms, phi0 in dihedral_restraints:
+        restraint_energy += calc_imp_diheds(coords, atoms, phi0, restraint_fconst, forces)
+    return energy, restraint_energy, forces
+
+
+def relax_native(terms, coords, dihedral_restraints, fmax=0.01, max_steps=1000,
+                 constrained=False, inv_hessian_guess=None):
+    """
+    Relax a geometry with restrained dihedrals using L-BFGS.
+    If constrained, the dihedrals are held exactly at their target values instead: their
+    gradient directions are projected out of the forces and every step is corrected back onto
+    the constraints (SHAKE-like), so that no stiff restraint spoils the conditioning.
+    An inverse Hessian guess (see get_hessian_guess) can be given to precondition the steps.
+
+    Returns
+    -------
+    coords : array
+        Relaxed coordinates of shape (n_atoms, 3).
+    energy : float
+        MM energy of the relaxed geometry (without the restraint energy).
+    n_evals : int
+        Number of energy/force evaluations.
+    """
+    shape = coords.shape
+    constraints, correct = [], None
+    if constrained:
+        constraints, dihedral_restraints = dihedral_restraints, []
+
+        def correct(x):
+            return apply_dihedral_constraints(x.reshape(shape), constraints).ravel()
+
+    def objective(x):
+        energy, restraint_energy, forces = calc_mm(x.reshape(shape), terms, dihedral_restraints)
+        if constraints:
+            forces = project_dihedral_constraints(x.reshape(shape), forces, constraints)
+        return energy + restraint_energy, forces.ravel()
+
+    x = np.array(coords, dtype=float).ravel()
+    if correct is not None:
+        x = correct(x)
+    x, n_evals = minimize_lbfgs(objective, x, fmax, max_steps, correct=correct,
+                                inv_hessian_guess=inv_hessian_guess)
+    coords = x.reshape(shape)
+    energy = calc_mm(coords, terms, dihedral_restraints)[0]
+    return coords, energy, n_evals
+
+
+def calc_dihedral_gradient(coords, atoms):
+    """Dihedral angle and its gradient with respect to the coordinates."""
+    phi, vec_ij, vec_kj, vec_kl, cross1, cross2 = get_dihed(coords[atoms])
+    gradient = np.zeros(coords.shape)
+    calc_dih_force(gradient, atoms, vec_ij, vec_kj, vec_kl, cross1, cross2, -1.)
+    return phi, gradient
+
+
+def project_dihedral_constraints(coords, forces, constraints):
+    """Remove the force components along the gradients of the constrained dihedrals."""
+    gradients = np.array([calc_dihedral_gradient(coords, atoms)[1].ravel()
+                          for atoms, _ in constraints])
+    basis = np.linalg.qr(gradients.T)[0]
+    forces = forces.ravel()
+    return (forces - basis @ (basis.T @ forces)).reshape(coords.shape)
+
+
+def apply_dihedral_constraints(coords, constraints, tol=1e-8, max_iter=50):
+    """Move the atoms along the dihedral gradients until all dihedrals are at their targets."""
+    coords = coords.copy()
+    for _ in range(max_iter):
+        converged = True
+        for atoms, phi0 in constraints:
+            phi, gradient = calc_dihedral_gradient(coords, atoms)
+            dphi = (phi0 - phi + np.pi) % (2 * np.pi) - np.pi
+            if abs(dphi) > tol:
+                converged = False
+                coords += dphi * gradient / (gradient**2).sum()
+        if converged:
+            break
+    return coords
+
+
+def minimize_lbfgs(objective, x, fmax=0.01, max_steps=1000, memory=20, max_step=0.2,
+                   correct=None, inv_hessian_guess=None):
+    """
+    Minimize objective(x) -> (energy, forces) with limited memory BFGS and a backtracking line
+    search. Converged when the largest atomic force is below fmax (as in ASE). No atom is moved
+    more than max_step in a single step. If given, correct(x) maps every trial point back onto
+    the constraints. With inv_hessian_guess the recursion starts from that matrix instead of
+    a scaled identity. A step without sufficient decrease is rejected and retried along steepest
+    descent; if that fails too, the optimization stops unconverged.
+
+    Returns
+    -------
+    x : array
+        Optimized flat coordinates.
+    n_evals : int
+        Number of objective evaluations.
+    """
+    energy, forces = objective(x)
+    n_evals = 1
+    s_list, y_list, rho_list = [], [], []
+    steepest = False
+
+    for _ in range(max_steps):
+        if get_fmax(forces) < fmax:
+            break
+
+        direction = lbfgs_direction(-forces, s_list, y_list, rho_list, inv_hessian_guess)
+        if steepest or np.dot(direction, forces) <= 0:  # restart from steepest descent
+            s_list, y_list, rho_list = [], [], []
+            direction, steepest = forces.copy(), True
+        direction *= min(1., max_step / get_fmax(direction))
+
+        alpha, slope = 1., np.dot(direction, forces)
+        for _ in range(10):
+            x_new = x + alpha * direction
+            if correct is not None:
+                x_new = correct(x_new)
+            energy_new, forces_new = objective(x_new)
+            n_evals += 1
+            if energy_new <= energy - 1e-4 * alpha * slope:
+                break
+            alpha *= 0.5
+        else:  # no sufficient decrease: reject the step
+            if steepest:  # not even along steepest descent: stop (not converged)
+                break
+            steepest = True
+            continue
+        steepest = False
+
+        s, y = x_new - x, forces - forces_new
+        sy = np.dot(s, y)
+        if sy > 1e-10:
+            s_list.append(s)
+            y_list.append(y)
+            rho_list.append(1. / sy)
+            if len(s_list) > memory:
+                s_list.pop(0), y_list.pop(0), rho_list.pop(0)
+
+        x, energy, forces = x_new, energy_new, forces_new
+    return x, n_evals
+
+
+def lbfgs_direction(gradient, s_list, y_list, rho_list, inv_hessian_guess=None):
+    """Two-loop recursion: approximate -H^-1 g from the stored curvature pairs."""
+    q = gradient.copy()
+    alphas = []
+    for s, y, rho in zip(reversed(s_list), reversed(y_list), reversed(rho_list)):
+        alpha = rho * np.dot(s, q)
+        q -= alpha * y
+        alphas.append(alpha)
+
+    if inv_hessian_guess is not None:
+        q = inv_hessian_guess @ q
+    elif s_list:
+        q *= np.dot(s_list[-1], y_list[-1]) / np.dot(y_list[-1], y_list[-1])
+    else:
+        q *= 1e-3
+
+    for s, y, rho, alpha in zip(s_list, y_list, rho_list, reversed(alphas)):
+        beta = rho * np.dot(y, q)
+        q += s * (alpha - beta)
+    return -q
+
+
+def get_hessian_guess(hessian, floor=70.):
+    """
+    Positive definite Hessian guess (and its inverse) from an MM Hessian: eigenvalues below
+    floor (zero, negative and translational/rotational modes) are raised to floor, which is
+    also the scale of the identity guess of ASE BFGS.
+    """
+    val, vec = np.linalg.eigh(hessian)
+    val = np.maximum(val, floor)
+    return (vec * val) @ vec.T, (vec / val) @ vec.T
+
+
+def get_fmax(forces):
+    return np.sqrt((forces.reshape(-1, 3)**2).sum(axis=1).max())
@@ -0,0 +1,134 @@
+import os
+import numpy as np
+#
+from .misc import run_in_pool
+
+"""
+
+Report stage: the validation plots are rendered from the data saved by the fitting
+(frequencies.npy in the job directory, scan_data_*.npy and fit_data_*.npy in the fragments
+directory), either right away (plots = inline) or later with "qforce report" (plots = deferred).
+
+"""
+
+
+def make_report(job_dir, plot_fit=False, n_proc=1):
+    """Render all plots of a job directory on up to n_proc worker processes."""
+    tasks = get_report_tasks(job_dir, plot_fit)
+    if not tasks:
+        raise ValueError(f'No plot data found in "{job_dir}".')
+    run_in_pool(render_plot, tasks, n_proc)
+    return [task[1] for task in tasks]
+
+
+def get_report_tasks(job_dir, plot_fit=False):
+    tasks = []
+    freq_file = f'{job_dir}/frequencies.npy'
+    if os.path.isfile(freq_file):
+        tasks.append(('frequencies', freq_file))
+
+    frag_dir = f'{job_dir}/fragments'
+    if os.path.isdir(frag_dir):
+        for file_name in sorted(os.listdir(frag_dir)):
+            if file_name.startswith('scan_data_') and file_name.endswith('.npy'):
+                tasks.append(('scan', f'{frag_dir}/{file_name}'))
+                if plot_fit:
+                    fit_file = f'{frag_dir}/fit_data_{file_name[10:]}'
+                    if os.path.isfile(fit_file):
+                        tasks.append(('fit', fit_file))
+    return tasks
+
+
+def render_plot(kind, data_file):
+    if kind == 'frequencies':
+        plot_frequencies(data_file)
+    elif kind == 'scan':
+        plot_scan(data_file)
+    else:
+        plot_fit(data_file)
+
+
+def plot_frequencies(data_file):
+    """QM vs MD frequencies (rows of frequencies.npy) -> frequencies.pdf"""
+    qm_freq, md_freq = np.load(data_file)
+    n_freqs = np.arange(len(qm_freq))+1
+    plt, f = _new_figure()
+    plt.title(f'Mean Percent Error = {round(calc_mean_percent_error(qm_freq, md_freq), 2)}%',
+              loc='left')
+    plt.xlabel('Vibrational Mode #')
+    plt.ylabel(r'Frequencies (cm$^{-1}$)')
+    plt.plot(n_freqs, qm_freq, linewidth=3, label='QM')
+    plt.plot(n_freqs, md_freq, linewidth=3, label='Q-Force')
+    plt.tight_layout()
+    plt.legend(ncol=2, bbox_to_anchor=(1.03, 1.12), frameon=False)
+    _save_figure(plt, f, data_file)
+
+
+def plot_scan(data_file):
+    """QM vs MD dihedral profile (scan_data_*.npy) -> scan_data_*.pdf"""
+    angles, qm_energies, md_energies = np.load(data_file)
+    fit_file = data_file.replace('scan_data_', 'fit_data_')
+    r_squared = None
+    if os.path.isfile(fit_file):
+        fit_sum = np.load(fit_file)[3]
+        r_squared = calc_r_squared(fit_sum, qm_energies-md_energies+fit_sum)
+    _plot_profiles(data_file, angles, qm_energies, md_energies, ('QM', 'Q-Force'), r_squared)
+
+
+def plot_fit(data_file):
+    """
+    Fitted dihedral vs the QM - MD difference without it (fit_data_*.pdf), and the MD profile
+    without the fitted dihedral (unfit_data_*.pdf) from fit_data_*.npy
+    """
+    angles, qm_energies, unfit_energies, fit_sum = np.load(data_file)
+    md_energies = np.load(data_file.replace('fit_data_', 'scan_data_'))[2]
+    diff = qm_energies - md_energies + fit_sum
+    r_squared = calc_r_squared(fit_sum, diff)
+    _plot_profiles(data_file, angles, diff, fit_sum, ('Diff', 'Fit'), r_squared)
+    _plot_profiles(data_file.replace('fit_data_', 'unfit_data_'), angles, qm_energies,
+                   unfit_energies, ('QM', 'Q-Force'))
+
+
+def calc_mean_percent_error(qm_freq, md_freq):
+    errors = ((qm_freq - md_freq) / qm_freq * 100)[qm_freq > 100]
+    return np.abs(errors).mean()
+
+
+def calc_r_squared(rb, energy_diff):
+    residuals = rb - energy_diff
+    ss_res = np.sum(residuals**2)
+    ss_tot = np.sum((energy_diff-np.mean(energy_diff))**2)
+    return 1 - (ss_res / ss_tot)
+
+
+def _plot_profiles(data_file, angles, energies1, energies2, labels, r_squared=None):
+    angles_deg = np.degrees(angles)
+    plt, f = _new_figure()
+    plt.xlabel('Angle')
+    plt.ylabel('Energy (kJ/mol)')
+    plt.plot(angles_deg, energies1, linewidth=4, label=labels[0])
+    plt.plot(angles_deg, energies2, linewidth=4, label=labels[1])
+    plt.xticks(np.arange(0, 361, 60))
+    plt.legend(ncol=2, bbox_to_anchor=(1.03, 1.12), frameon=False)
+    if r_squared:
+        plt.title(f'R-squared = {round(r_squared, 3)}', loc='left')
+    plt.tight_layout()
+    _save_figure(plt, f, data_file)
+
+
+def _new_figure():
+    # matplotlib and seaborn are only imported when a plot is actually rendered
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    width, height = plt.figaspect(0.6)
+    f = plt.figure(figsize=(width, height), dpi=300)
+    sns.set(font_scale=1.3)
+    return plt, f
+
+
+def _save_figure(plt, f, data_file):
+    f.savefig(f'{os.path.splitext(data_file)[0]}.pdf', bbox_inches='tight')
+    plt.close()
@@ -0,0 +1,102 @@
+import mmap
+import re
+import numpy as np
+
+"""
+
+Reader for Gaussian formatted checkpoint (.fchk) files: the record headers are indexed once and
+only the requested records are decoded, numeric arrays straight from the file into NumPy.
+
+"""
+
+
+class FchkFile():
+    """
+    Section-indexed view of a formatted checkpoint file, to be used as a context manager:
+
+        with FchkFile(fchk_file) as fchk:
+            hessian = fchk['Cartesian Force Constants']
+
+    Records are decoded lazily on access: scalars as int/float, numeric arrays as NumPy arrays.
+    """
+
+    # "Name (up to 40 characters)   Type   [N=]   value/count"
+    _header = re.compile(rb'^([A-Za-z][^\r\n]{0,39}?) +([IRCLH]) +(N= *)?(\S+)\r?$', re.M)
+    # fixed Fortran field widths of the array records (6I12, 5E16.8, 5A12, 72L1, 9A8): a block
+    # of n values is at least this many bytes long, so the indexing can jump over it
+    _width = {b'I': 12, b'R': 16, b'C': 12, b'L': 1, b'H': 8}
+
+    def __init__(self, fchk_file):
+        self.file_name = fchk_file
+        self._file = open(fchk_file, 'rb')
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._data = b''
+        self.records = self._index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def __getitem__(self, name):
+        if name not in self.records:
+            raise KeyError(f'Record "{name}" not found in the fchk file: {self.file_name}')
+        return self._decode(name, *self.records[name])
+
+    def get(self, name, default=None):
+        if name not in self.records:
+            return default
+        return self[name]
+
+    def _index(self):
+        """Name -> (type, is_array, value or count, start, end) of all records."""
+        records, last, pos = {}, None, 0
+        match = self._header.search(self._data, pos)
+        while match is not None:
+            if last is not None:  # the block of the previous array ends at this header
+                records[last] = records[last][:4] + (match.start(),)
+                last = None
+            name, kind, is_array, value = match.groups()
+            name = name.decode()
+            pos = match.end()
+            records[name] = (kind, is_array is not None, value, pos, pos)
+            if is_array is not None:
+                last = name
+                pos += int(value) * self._width[kind]
+            match = self._header.search(self._data, pos)
+        if last is not None:
+            records[last] = records[last][:4] + (len(self._data),)
+        return records
+
+    def _decode(self, name, kind, is_array, value, start, end):
+        if not is_array:
+            if kind == b'I':
+                return int(value)
+            elif kind == b'R':
+                return float(value)
+            return value.decode()
+
+        block = self._data[start:end]
+        count = int(value)
+        if kind == b'I':
+            values = np.fromstring(block, dtype=int, sep=' ')
+        elif kind == b'R':
+            values = np.fromstring(block, dtype=float, sep=' ')
+        else:  # fixed width text fields, continued over the lines
+            return ''.join(block.decode().splitlines()).strip()
+
+        if values.size != count:
+            raise ValueError(f'Record "{name}" in the fchk file {self.file_name} has '
+                             f'{values.size} values instead of {count}.')
+        return values
@@ -1,8 +1,12 @@
+import re
+from itertools import islice
 from colt import Colt
 import numpy as np
 from ase.units import Hartree, mol, kJ
 #
 from .qm_base import WriteABC, ReadABC
+from .logfile import open_log, find_events, line_at, lines_after, block_after
+from .jobs import has_normal_termination
 from ..elements import ATOM_SYM
 
 
@@ -33,8 +37,20 @@ class Gaussian(Colt):
         self.read = ReadGaussian
         self.write = WriteGaussian
 
+    @staticmethod
+    def is_complete(file_name):
+        """Whether the job of the input file terminated normally."""
+        return has_normal_termination(file_name, b'Normal termination of Gaussian',
+                                      b'Error termination')
+
 
 class ReadGaussian(ReadABC):
+    _n_atoms = re.compile(rb' NAtoms= +(\d+)')
+    _scan_events = {'modredundant': re.compile(rb'following ModRedundant'),
+                    'scan': re.compile(rb'  Scan  [^\n]*!'),
+                    'stationary': re.compile(rb'-- Stationary'),
+                    'unconverged': re.compile(rb'-- Number of steps exceeded')}
+
     def hessian(self, config, out_file, fchk_file):
         b_orders, point_charges = [], []
 
@@ -53,56 +69,64 @@ class ReadGaussian(ReadABC):
 
     def scan(self, config, file_name):
         n_atoms, angles, energies, coords, point_charges = None, [], [], [], {}
-        with open(file_name, "r", encoding='utf-8') as file:
-            for line in file:
-                if line.startswith(" NAtoms= "):
-                    n_atoms = int(line.split()[1])
+        with open_log(file_name) as log:
+            match = self._n_atoms.search(log)
+            if match:
+                n_atoms = int(match.group(1))
 
-                elif "following ModRedundant" in line:
+            for pos, event in find_events(log, self._scan_events):
+                if event == 'modredundant':
                     step = 0
-                    for line in file:
+                    for line in lines_after(log, pos):
                         line = line.split()
                         if line == []:
                             break
                         elif line[0] == 'D' and line[5] == 'S':
                             step_size = float(line[7])
 
-                elif "  Scan  " in line and "!" in line:
-                    init_angle = float(line.split()[3])
-
-                # Find coordinates
-                elif "orientation:" in line:
-                    coord = []
-                    for _ in range(5):
-                        line = file.readline()
-                    while "--" not in line:
-                        coord.append([float(a) for a in line.split()[3:6]])
-                        line = file.readline()
-
-                elif "SCF Done:" in line:
-                    energy = round(float(line.split()[4]), 8)
-
-                # Get optimized energies, coords for each scan angle
-                elif "-- Stationary" in line or '-- Number of steps exceeded' in line:
-                    angle = init_angle + step * step_size
-                    angles.append(angle)
-                    energies.append(energy)
-                    coords.append(coord)
+                elif event == 'scan':
+                    init_angle = float(line_at(log, pos).split()[3])
+
+                # Get optimized energies, coords for each scan angle: only the last energy
+                # and orientation before each stationary point are decoded
+                else:
+                    angles.append(init_angle + step * step_size)
+                    energies.append(self._read_last_energy(log, pos))
+                    coords.append(self._read_last_coords(log, pos))
                     step += 1
 
-                    if '-- Number of steps exceeded' in line:
+                    if event == 'unconverged':
                         print('WARNING: An optimization step is unconverged in the file:\n'
                               f'         - {file_name}\n'
                               '           Double check to make sure it is fine.\n')
 
-                elif "Hirshfeld charges, spin densities" in line:
-                    point_charges['cm5'] = self._read_cm5_charges(file, n_atoms)
-                elif " ESP charges:" in line:
-                    point_charges['esp'] = self._read_esp_charges(file, n_atoms)
+            pos = log.rfind(b'Hirshfeld charges, spin densities')
+            if pos != -1:
+                point_charges['cm5'] = self._read_cm5_charges(block_after(log, pos, n_atoms+1),
+                                                              n_atoms)
+            pos = log.rfind(b' ESP charges:')
+            if pos != -1:
+                point_charges['esp'] = self._read_esp_charges(block_after(log, pos, n_atoms+1),
+                                                              n_atoms)
 
         energies = np.array(energies) * Hartree * mol / kJ
         return n_atoms, coords, angles, energies, point_charges
 
+    @staticmethod
+    def _read_last_energy(log, pos):
+        line = line_at(log, log.rfind(b'SCF Done:', 0, pos))
+        return round(float(line.split()[4]), 8)
+
+    @staticmethod
+    def _read_last_coords(log, pos):
+        coord = []
+        lines = lines_after(log, log.rfind(b'orientation:', 0, pos))
+        for line in islice(lines, 4, None):
+            if '--' in line:
+                break
+            coord.append([float(a) for a in line.split()[3:6]])
+        return coord
+
     @staticmethod
     def _read_cm5_charges(file, n_atoms):
         point_charges = []
@@ -129,15 +153,18 @@ class WriteGaussian(WriteABC):
         file.write('\n$nbo BNDIDX $end\n\n')
 
     def scan(self, file, job_name, config, coords, atnums, scanned_atoms, start_angle, charge,
-             multiplicity):
+             multiplicity, step_size=None, n_steps=None):
+        if step_size is None:
+            step_size = config.scan_step_size
         self._write_scan_job_setting(job_name, config, file, charge, multiplicity)
         self._write_coords(atnums, coords, file)
-        self._write_scanned_atoms(file, scanned_atoms, config.scan_step_size)
+        self._write_scanned_atoms(file, scanned_atoms, step_size, n_steps)
 
     @staticmethod
-    def _write_scanned_atoms(file, scanned_atoms, step_size):
+    def _write_scanned_atoms(file, scanned_atoms, step_size, n_steps=None):
         a1, a2, a3, a4 = scanned_atoms
-        n_steps = int(np.ceil(360/step_size))-1
+        if n_steps is None:
+            n_steps = int(np.ceil(360/step_size))-1
         file.write(f"\nD {a1} {a2} {a3} {a4} S {n_steps} {step_size:.2f}\n\n")
 
     @staticmethod
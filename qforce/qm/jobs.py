@@ -0,0 +1,161 @@
+import os
+import asyncio
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+#
+from .logfile import LOG_EXTENSIONS, open_log
+from ..misc import run_in_pool
+
+"""
+
+Execution of the generated QM inputs, either on this machine (run_jobs = local: each input is
+run with the local_command in its own directory, so that the outputs end up where qforce looks
+for them) or through a batch scheduler (run_jobs = scheduler: the inputs / job scripts are
+submitted with the submit_command and polled with the status_command until they are done).
+
+"""
+
+
+def run_jobs(inputs, config, has_output=None):
+    """
+    Run the QM input files with the selected run_jobs method and wait for them. A job succeeded
+    if has_output(input file) is true after it (default: has_log_output). SystemExit if any of
+    them failed.
+    """
+    if has_output is None:
+        has_output = has_log_output
+
+    if config.run_jobs == 'local':
+        failed = run_local_jobs(inputs, config, has_output)
+    else:
+        failed = asyncio.run(run_scheduler_jobs(inputs, config, has_output))
+
+    if failed:
+        print('ERROR: The following QM job(s) failed, see the .run file next to them for the '
+              'output:')
+        for file_name in failed:
+            print(f'  - {file_name}')
+        raise SystemExit
+    print('Done.\n')
+
+
+def has_log_output(file_name):
+    """Whether there is a log/out file of the input's job name (<jobname>.*log) next to it."""
+    directory, job_name = _split_job(file_name)
+    return any(file.startswith(f'{job_name}.') and file.endswith(LOG_EXTENSIONS)
+               for file in os.listdir(directory))
+
+
+def has_normal_termination(file_name, normal, error):
+    """
+    Whether a log/out file of the input's job name ends normally: it contains the normal
+    termination marker of the QM program after the last error marker (bytes).
+    """
+    directory, job_name = _split_job(file_name)
+    for file in os.listdir(directory):
+        if file.startswith(f'{job_name}.') and file.endswith(LOG_EXTENSIONS):
+            with open_log(f'{directory}/{file}') as log:
+                if log.rfind(normal) > log.rfind(error):
+                    return True
+    return False
+
+
+def run_local_jobs(inputs, config, has_output):
+    """Run the input files locally on a bounded pool. Returns the failed ones."""
+    print(f'Running {len(inputs)} QM job(s) locally ({config.max_jobs} at a time, '
+          f'{config.n_proc} core(s) each)...')
+    tasks = [(file_name, config.local_command, config.n_proc, config.memory)
+             for file_name in inputs]
+    return_codes = run_in_pool(run_local_job, tasks, config.max_jobs, executor=ThreadPoolExecutor)
+    return [file_name for file_name, code in zip(inputs, return_codes)
+            if code != 0 or not has_output(file_name)]
+
+
+def run_local_job(file_name, command, n_proc, memory):
+    """Run one input file, with its output in <file_name>.run. Returns the exit code."""
+    directory, job_name = _split_job(file_name)
+    env = dict(os.environ, OMP_NUM_THREADS=str(n_proc), MKL_NUM_THREADS=str(n_proc))
+
+    with open(f'{file_name}.run', 'w') as log:
+        return subprocess.run(_fill(command, file_name, n_proc=n_proc, memory=memory),
+                              shell=True, cwd=directory, env=env, stdout=log,
+                              stderr=subprocess.STDOUT).returncode
+
+
+async def run_scheduler_jobs(inputs, config, has_output):
+    """Submit the input files, at most max_jobs at the same time. Returns the failed ones."""
+    print(f'Submitting {len(inputs)} QM job(s) with "{config.submit_command}" '
+          f'({config.max_jobs} at a time)...')
+    slots = asyncio.Semaphore(config.max_jobs)
+    done = await asyncio.gather(*(run_scheduler_job(file_name, config, has_output, slots)
+                                  for file_name in inputs))
+    return [file_name for file_name, success in zip(inputs, done) if not success]
+
+
+async def run_scheduler_job(file_name, config, has_output, slots):
+    """Submit one input and wait for it, resubmitted up to n_retries times if it fails."""
+    async with slots:
+        for attempt in range(config.n_retries + 1):
+            if attempt > 0:
+                print(f'Resubmitting {file_name} ({attempt}/{config.n_retries})...')
+            job_id = await submit_job(file_name, config)
+            if job_id is not None:
+                await wait_for_job(file_name, job_id, config)
+                if has_output(file_name):
+                    return True
+    return False
+
+
+async def submit_job(file_name, config):
+    """Job id printed by the submit command (its last word), None if the submission failed."""
+    code, output = await _run_shell(_fill(config.submit_command, file_name), file_name)
+    with open(f'{file_name}.run', 'a') as log:
+        log.write(output)
+    if code != 0 or not output.split():
+        return None
+    return output.split()[-1]
+
+
+async def wait_for_job(file_name, job_id, config):
+    """
+    Poll the status command with an increasing interval as long as it reports the job. The job
+    is done once the status command succeeds without the job id, or keeps failing for
+    status_retries checks in a row (e.g. a scheduler that rejects finished job ids).
+    """
+    interval, n_failed = config.poll_interval, 0
+    while True:
+        await asyncio.sleep(interval)
+        code, output = await _run_shell(_fill(config.status_command, file_name, jobid=job_id),
+                                        file_name)
+        if code != 0:
+            n_failed += 1
+            if n_failed > config.status_retries:
+                return
+        elif job_id not in output.split():
+            return
+        else:
+            n_failed = 0
+        interval = min(2 * interval, config.max_poll_interval)
+
+
+async def _run_shell(command, file_name):
+    process = await asyncio.create_subprocess_shell(command, cwd=_split_job(file_name)[0],
+                                                    stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.STDOUT)
+    output, _ = await process.communicate()
+    return process.returncode, output.decode(errors='replace')
+
+
+def _split_job(file_name):
+    """(directory, job name) of an input file."""
+    directory, input_file = os.path.split(os.path.abspath(file_name))
+    return directory, os.path.splitext(input_file)[0]
+
+
+def _fill(command, file_name, **values):
+    """Replace the <input>, <jobname> and the given <key> placeholders of a command."""
+    command = command.replace('<input>', os.path.basename(file_name))
+    command = command.replace('<jobname>', _split_job(file_name)[1])
+    for key, value in values.items():
+        command = command.replace(f'<{key}>', str(value))
+    return command
@@ -0,0 +1,84 @@
+import os
+import io
+import mmap
+import gzip
+import lzma
+import shutil
+import tempfile
+from contextlib import contextmanager
+from itertools import islice
+
+"""
+
+Access to (very large) QM log files as one bytes-like buffer: plain files are memory mapped,
+.gz and .xz compressed logs are decompressed chunk by chunk into a temporary file that is memory
+mapped in turn, so that neither needs the whole log in memory. The readers jump between the markers
+they need with compiled byte regexes / rfind and only decode the lines they actually use.
+
+"""
+
+COMPRESSED = {'.gz': gzip.open, '.xz': lzma.open}
+DECOMPRESS_CHUNK = 16 * 1024**2  # bytes
+LOG_EXTENSIONS = tuple(f'{ext}{comp}' for ext in ('log', 'out') for comp in ['', *COMPRESSED])
+
+
+@contextmanager
+def open_log(file_name):
+    _, ext = os.path.splitext(file_name)
+    if ext in COMPRESSED:
+        with COMPRESSED[ext](file_name, 'rb') as file, tempfile.TemporaryFile() as tmp:
+            shutil.copyfileobj(file, tmp, DECOMPRESS_CHUNK)
+            tmp.flush()
+            with _map(tmp) as log:
+                yield log
+        return
+
+    with open(file_name, 'rb') as file, _map(file) as log:
+        yield log
+
+
+@contextmanager
+def _map(file):
+    try:
+        log = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:  # empty file
+        yield b''
+        return
+    try:
+        yield log
+    finally:
+        log.close()
+
+
+def strip_compression(file_name):
+    base, ext = os.path.splitext(file_name)
+    return base if ext in COMPRESSED else file_name
+
+
+def find_events(log, patterns):
+    """(position, name) of the matches of the byte regexes in {name: pattern}, in file order."""
+    return sorted((match.start(), name) for name, pattern in patterns.items()
+                  for match in pattern.finditer(log))
+
+
+def line_at(log, pos):
+    """The (decoded) line containing position pos."""
+    start = log.rfind(b'\n', 0, pos) + 1
+    end = log.find(b'\n', pos)
+    return log[start:end if end != -1 else len(log)].decode(errors='replace')
+
+
+def lines_after(log, pos):
+    """Generator of the (decoded) lines following the line containing position pos."""
+    start = log.find(b'\n', pos) + 1
+    while 0 < start < len(log):
+        end = log.find(b'\n', start)
+        if end == -1:
+            end = len(log)
+        yield log[start:end].decode(errors='replace')
+        start = end + 1
+
+
+def block_after(log, pos, n_lines):
+    """The n_lines lines after the line containing pos as a text stream (for readline parsers)."""
+    return io.StringIO(''.join(f'{line}\n' for line in islice(lines_after(log, pos), n_lines)))
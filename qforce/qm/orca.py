@@ -4,10 +4,14 @@ import re
 from colt import Colt
 import numpy as np
 from ase.units import Hartree, mol, kJ, Bohr
-from ase.io import read
 #
 from .qm_base import WriteABC, ReadABC
+from .logfile import open_log, lines_after, strip_compression
+from .jobs import has_normal_termination
 from ..elements import ATOM_SYM
+from ..misc import LazyImport
+
+ase_io = LazyImport('ase.io')
 
 
 class Orca(Colt):
@@ -44,6 +48,12 @@ class Orca(Colt):
         self.read = ReadORCA
         self.write = WriteORCA
 
+    @staticmethod
+    def is_complete(file_name):
+        """Whether the job of the input file terminated normally."""
+        return has_normal_termination(file_name, b'ORCA TERMINATED NORMALLY',
+                                      b'ORCA finished by error termination')
+
 
 class WriteORCA(WriteABC):
     def hessian(self, file, job_name, config, coords, atnums):
@@ -103,7 +113,7 @@ class WriteORCA(WriteABC):
         file.write('END\n')
 
     def scan(self, file, job_name, config, coords, atnums, scanned_atoms, start_angle, charge,
-             multiplicity):
+             multiplicity, step_size=None, n_steps=None):
         """ Write the input file for the dihedral scan and charge calculation.
 
         Parameters
@@ -126,7 +136,13 @@ class WriteORCA(WriteABC):
             The total charge of the molecule.
         multiplicity : int
             The multiplicity of the molecule.
+        step_size : float, optional
+            The step size of the scan in degree (default: scan_step_size).
+        n_steps : int, optional
+            The number of steps after the starting angle (default: a full rotation).
         """
+        if step_size is None:
+            step_size = config.scan_step_size
         # Using the ORCA compound functionality
         # Write the coordinates
         file.write(f"* xyz   {charge}   {multiplicity}\n")
@@ -160,7 +176,7 @@ class WriteORCA(WriteABC):
         file.write('New_Step\n')
         file.write(f"! opt {config.qm_method_opt} nopop\n")
         file.write(f'%base "{job_name}_scan"\n')
-        self._write_scanned_atoms(file, scanned_atoms, start_angle, config.scan_step_size)
+        self._write_scanned_atoms(file, scanned_atoms, start_angle, step_size, n_steps)
         file.write(f"*xyzfile {charge} {multiplicity} {job_name}_opt.xyz\n")
         file.write('STEP_END\n\n')
 
@@ -179,7 +195,7 @@ class WriteORCA(WriteABC):
         file.write('END\n')
 
     @staticmethod
-    def _write_scanned_atoms(file, scanned_atoms, start_angle, step_size):
+    def _write_scanned_atoms(file, scanned_atoms, start_angle, step_size, n_steps=None):
         """ Write the input line for dihedral scan.
 
         Parameters
@@ -192,17 +208,23 @@ class WriteORCA(WriteABC):
             The starting angle in degree.
         step_size : float
             The size of the step.
+        n_steps : int, optional
+            The number of steps after the starting angle (default: a full rotation).
         """
         # ORCA uses zero-based indexing
         a1, a2, a3, a4 = np.array(scanned_atoms) - 1
         start_angle = float(start_angle)
-        # Remove the last point as it is the same as the first point
-        end_angle = start_angle + 360 - step_size
-        n_steps = int(np.ceil(360 / step_size))
+        if n_steps is None:
+            # Remove the last point as it is the same as the first point
+            end_angle = start_angle + 360 - step_size
+            n_points = int(np.ceil(360 / step_size))
+        else:
+            end_angle = start_angle + n_steps * step_size
+            n_points = n_steps + 1
         file.write("%geom Scan\n")
         file.write(f"D {a1} {a2} {a3} {a4} = {start_angle:.2f},"
                    f" {end_angle:.2f},"
-                   f" {n_steps}\n")
+                   f" {n_points}\n")
         file.write("end\n")
         file.write("end\n")
 
@@ -266,30 +288,28 @@ class ReadORCA(ReadABC):
             text = f.read()
 
         text = text[text.index('$hessian'):]
-        lines = text.split('\n')[1:]
-
-        n_atoms_times_3 = int(lines[0])
-        lines = lines[1:]
+        _, n_atoms_times_3, header, text = text.split('\n', 3)
+        n_atoms_times_3 = int(n_atoms_times_3)
         hessian = np.empty((n_atoms_times_3, n_atoms_times_3))
 
-        for _ in range(int(np.ceil(n_atoms_times_3 / 5))):
-            trunk = lines[:(n_atoms_times_3 + 1)]
-            lines = lines[(n_atoms_times_3 + 1):]
-            cols = [int(col) for col in trunk[0].split()]
-            for row in range(n_atoms_times_3):
-                row_idx, *points = trunk[1 + row].split()
-                assert int(row_idx) == row
-                for point, col in zip(points, cols):
-                    hessian[row, col] = point
+        # blocks of columns: a line with the column indices, then one line per row with the row
+        # index and the values - all numbers of the section are parsed at once
+        n_cols = len(header.split())
+        values = np.fromstring(f"{header}\n{text.split('$')[0]}", sep=' ')
+        start = 0
+        for first in range(0, n_atoms_times_3, n_cols):
+            cols = np.arange(first, min(first+n_cols, n_atoms_times_3))
+            assert np.array_equal(values[start:start+cols.size], cols)
+            start += cols.size
+            block = values[start:start+n_atoms_times_3*(cols.size+1)]
+            block = block.reshape(n_atoms_times_3, cols.size+1)
+            assert np.array_equal(block[:, 0], np.arange(n_atoms_times_3))
+            hessian[:, cols] = block[:, 1:]
+            start += block.size
 
         # Output the lower triangle of the hessian matrix to match the
         # format adopted by Gaussian and Qchem.
-        out_hessian = []
-        for i in range(len(hessian)):
-            for j in range(i + 1):
-                hes = (hessian[i, j] + hessian[j, i]) / 2
-                out_hessian.append(hes)
-        return np.array(out_hessian) * Hartree * mol / kJ / Bohr**2
+        return ReadABC._get_lower_triangle(hessian) * Hartree * mol / kJ / Bohr**2
 
     @staticmethod
     def _read_orca_esp(pc_file):
@@ -335,22 +355,16 @@ class ReadORCA(ReadABC):
         point_charges : float
             A list of float of the size of n_atoms.
         """
-        file = open(out_file, 'r')
-        line = file.readline()
-        # Skip to HIRSHFELD ANALYSIS
-        while 'HIRSHFELD ANALYSIS' not in line:
-            line = file.readline()
-
-        while 'ATOM     CHARGE      SPIN' not in line:
-            line = file.readline()
-
         charges = []
-
-        while 'TOTAL' not in line:
-            line = file.readline()
-            if len(line.split()) == 4:
-                atom_id, element, charge, _ = line.split()
-                charges.append(float(charge))
+        with open_log(out_file) as log:
+            # Skip to HIRSHFELD ANALYSIS
+            pos = log.find(b'ATOM     CHARGE      SPIN', log.find(b'HIRSHFELD ANALYSIS'))
+            for line in lines_after(log, pos):
+                if len(line.split()) == 4:
+                    atom_id, element, charge, _ = line.split()
+                    charges.append(float(charge))
+                if 'TOTAL' in line:
+                    break
         # atom_id is zero-based index
         return int(atom_id) + 1, charges
 
@@ -405,7 +419,7 @@ class ReadORCA(ReadABC):
         coords : array
             An array of float of the shape (n_atoms, 3).
         """
-        mol = read(coord_file)
+        mol = ase_io.read(coord_file)
         n_atoms = len(mol)
         elements = np.array([atom.number for atom in mol])
         coords = mol.positions
@@ -581,7 +595,7 @@ class ReadORCA(ReadABC):
             A dictionary with key in charge_method and the value to be a
             list of float of the size of n_atoms.
         """
-        base, ext = os.path.splitext(file_name)
+        base, ext = os.path.splitext(strip_compression(file_name))
         point_charges = {}
         if config.charge_method == "cm5":
             n_atoms, charges = self._read_orca_cm5(file_name)
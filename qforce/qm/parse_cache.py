@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+"""
+
+Cache of parsed QM outputs: what a reader returns is stored in a compact .npz file next to the
+source files, together with the path, size, modification time and SHA-256 hash of every source
+file and the settings that affect the parsing. A rerun on unchanged outputs loads the arrays
+instead of parsing the text again.
+
+"""
+
+# to be increased whenever a reader changes what it returns
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.parsed.npz'
+
+
+def read_with_cache(cache_file, source_files, settings, read):
+    """Result of read(), taken from cache_file if it was made from the same files & settings."""
+    cached = load_cache(cache_file)
+    meta = cached[0] if cached is not None else {}
+    stamps = get_file_stamps(source_files, meta.get('files'))
+
+    if (meta.get('version') == CACHE_VERSION and meta['settings'] == _to_json(settings) and
+            [stamp[::3] for stamp in meta['files']] == [stamp[::3] for stamp in stamps]):
+        values = tuple(cached[1][f'item_{i}'] if kind == 'array' else value
+                       for i, (kind, value) in enumerate(meta['items']))
+        if meta['files'] != stamps:  # same content, touched files: refresh the stamps
+            save_parsed(cache_file, stamps, settings, values)
+        return values
+
+    values = read()
+    save_parsed(cache_file, stamps, settings, values)
+    return values
+
+
+def get_scan_sources(file_name):
+    """
+    A scan output and the files next to it with the same stem (read by ORCA, xTB), without the
+    job logs (.run) of the runner.
+    """
+    directory, base = os.path.split(file_name)
+    stem = base.split('.')[0]
+    siblings = [os.path.join(directory, file) for file in sorted(os.listdir(directory or '.'))
+                if file.split('.')[0] == stem and not file.endswith((CACHE_SUFFIX, '.run'))]
+    return [file_name] + [file for file in siblings if file != file_name]
+
+
+def get_file_stamps(files, known=None):
+    """
+    [path, size, mtime, sha256] of each file. The hash of a file with the same size and mtime as
+    in known (stamps of an earlier call) is taken from there instead of reading the file again.
+    """
+    known = {stamp[0]: stamp for stamp in known or []}
+    stamps = []
+    for file in files:
+        file = os.path.abspath(file)
+        stat = os.stat(file)
+        old = known.get(file)
+        if old is not None and old[1:3] == [stat.st_size, stat.st_mtime_ns]:
+            stamps.append(old)
+        else:
+            stamps.append([file, stat.st_size, stat.st_mtime_ns, hash_file(file)])
+    return stamps
+
+
+def hash_file(file_name, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def load_cache(cache_file):
+    """(meta, arrays) of a cache file, None if there is no readable one."""
+    if not os.path.isfile(cache_file):
+        return None
+    try:
+        with np.load(cache_file) as data:
+            return json.loads(str(data['meta'])), {key: data[key] for key in data.files}
+    except (OSError, ValueError, KeyError, EOFError):  # unreadable cache: parse again
+        return None
+
+
+def save_parsed(cache_file, stamps, settings, values):
+    items, arrays = [], {}
+    for i, value in enumerate(values):
+        array = _as_array(value)
+        if array is None:
+            items.append(('json', _to_json(value)))
+        else:
+            items.append(('array', None))
+            arrays[f'item_{i}'] = array
+
+    meta = {'version': CACHE_VERSION, 'settings': _to_json(settings), 'files': stamps,
+            'items': items}
+    try:
+        meta = json.dumps(meta)
+    except TypeError:  # not a plain reader output: do not cache it
+        return
+
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'wb') as file:
+            np.savez(file, meta=np.array(meta), **arrays)
+        os.replace(tmp_file, cache_file)
+    except OSError:  # e.g. read-only output directory: just no cache
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _as_array(value):
+    """Numeric arrays (and non-empty regular lists of numbers) are stored in the npz."""
+    if isinstance(value, np.ndarray):
+        return value if value.dtype != object else None
+    if isinstance(value, (list, tuple)) and len(value) > 0:
+        try:
+            array = np.asarray(value)
+        except ValueError:  # ragged
+            return None
+        if array.dtype.kind in 'biuf':
+            return array
+    return None
+
+
+def _to_json(value):
+    if isinstance(value, dict):
+        return {str(key): _to_json(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(val) for val in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -1,9 +1,13 @@
+import re
 import sys
+from itertools import islice
 from colt import Colt
 import numpy as np
 from ase.units import Hartree, mol, kJ
 #
 from .qm_base import WriteABC, ReadABC
+from .logfile import open_log, line_at, lines_after, block_after
+from .jobs import has_normal_termination
 from ..elements import ATOM_SYM
 
 
@@ -56,8 +60,16 @@ class QChem(Colt):
         self.read = ReadQChem
         self.write = WriteQChem
 
+    @staticmethod
+    def is_complete(file_name):
+        """Whether the job of the input file terminated normally."""
+        return has_normal_termination(file_name, b'Thank you very much for using Q-Chem',
+                                      b'Q-Chem fatal error')
+
 
 class ReadQChem(ReadABC):
+    _scan_point = re.compile(rb'PES scan, value:')
+
     def hessian(self, config, out_file, fchk_file):
         b_orders, point_charges = [], []
         n_atoms, charge, multiplicity, elements, coords, hessian = self._read_fchk_file(fchk_file)
@@ -75,40 +87,47 @@ class ReadQChem(ReadABC):
 
     def scan(self, config, file_name):
         n_atoms, angles, energies, coords, point_charges = None, [], [], [], {}
-        with open(file_name, "r", encoding='utf-8') as file:
-            angles, energies, coords = [], [], []
-            found_n_atoms = False
-
-            for line in file:
-                if not found_n_atoms and " NAtoms, " in line:
-                    line = file.readline()
-                    n_atoms = int(line.split()[0])
-                    found_n_atoms = True
-
-                elif "OPTIMIZATION CONVERGED" in line:
-                    coord = []
-                    for _ in range(4):
-                        file.readline()
-                    for n in range(n_atoms):
-                        line = file.readline().split()
-                        coord.append([float(c_xyz) for c_xyz in line[2:]])
-
-                elif "Final energy is" in line:
-                    energy = float(line.split()[3])
-
-                elif "PES scan, value:" in line:
-                    angles.append(float(line.split()[3]))
-                    energies.append(energy)
-                    coords.append(coord)
-
-                elif "Charge Model 5" in line and found_n_atoms:
-                    point_charges['cm5'] = self._read_cm5_charges(file, n_atoms)
-                elif "Merz-Kollman RESP Net Atomic" in line and found_n_atoms:
-                    point_charges['resp'] = self._read_resp_charges(file, n_atoms)
+        with open_log(file_name) as log:
+            pos = log.find(b' NAtoms, ')
+            if pos != -1:
+                n_atoms = int(next(lines_after(log, pos)).split()[0])
+                angles, energies, coords = self._read_scan_points(log, pos, n_atoms)
+                point_charges = self._read_scan_charges(log, pos, n_atoms)
 
         energies = np.array(energies) * Hartree * mol / kJ
         return n_atoms, coords, angles, energies, point_charges
 
+    def _read_scan_points(self, log, pos, n_atoms):
+        """Only the last energy and converged geometry before each scan point are decoded."""
+        angles, energies, coords = [], [], []
+        for match in self._scan_point.finditer(log, pos):
+            angles.append(float(line_at(log, match.start()).split()[3]))
+            energies.append(self._read_last_energy(log, match.start()))
+            coords.append(self._read_last_coords(log, match.start(), n_atoms))
+        return angles, energies, coords
+
+    def _read_scan_charges(self, log, pos, n_atoms):
+        point_charges = {}
+        found = log.rfind(b'Charge Model 5', pos)
+        if found != -1:
+            point_charges['cm5'] = self._read_cm5_charges(block_after(log, found, n_atoms+3),
+                                                          n_atoms)
+        found = log.rfind(b'Merz-Kollman RESP Net Atomic', pos)
+        if found != -1:
+            point_charges['resp'] = self._read_resp_charges(block_after(log, found, n_atoms+3),
+                                                            n_atoms)
+        return point_charges
+
+    @staticmethod
+    def _read_last_energy(log, pos):
+        return float(line_at(log, log.rfind(b'Final energy is', 0, pos)).split()[3])
+
+    @staticmethod
+    def _read_last_coords(log, pos, n_atoms):
+        lines = lines_after(log, log.rfind(b'OPTIMIZATION CONVERGED', 0, pos))
+        return [[float(c_xyz) for c_xyz in line.split()[2:]]
+                for line in islice(lines, 4, 4+n_atoms)]
+
     @staticmethod
     def _read_cm5_charges(file, n_atoms):
         point_charges = []
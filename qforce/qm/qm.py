@@ -1,6 +1,5 @@
 import os
 
-from ase.io import read, write
 import numpy as np
 from colt import Colt
 
@@ -10,6 +9,12 @@ from .orca import Orca
 from .xtb import xTB 
 from .qm_base import scriptify, HessianOutput, ScanOutput
 from .torsiondrive_xtb import TorsiondrivexTB
+from .jobs import run_jobs
+from .parse_cache import read_with_cache, get_scan_sources, CACHE_SUFFIX
+from ..misc import LazyImport
+
+ase_io = LazyImport('ase.io')
+interpolate = LazyImport('scipy.interpolate')
 
 
 implemented_qm_software = {'gaussian': Gaussian,
@@ -46,6 +51,55 @@ vib_scaling = 1.0 :: float
 
 # Use the internal relaxed scan method of the QM software or the Torsiondrive method using xTB
 dihedral_scanner = relaxed_scan :: str :: [relaxed_scan, xtb-torsiondrive]
+
+# Adaptive dihedral scan: start with a scan of adaptive_coarse_step and only add the midpoints
+# of the intervals where the estimated interpolation error of a periodic spline through the
+# profile is larger than adaptive_tol (kJ/mol), down to scan_step_size
+# (gaussian, orca and xtb with relaxed_scan)
+adaptive_scan = no :: bool
+
+# Step size of the first scan of an adaptive scan
+adaptive_coarse_step = 30.0 :: float
+
+# Refinement tolerance of an adaptive scan (kJ/mol)
+adaptive_tol = 0.5 :: float
+
+# Store the parsed QM outputs in .parsed.npz files next to them and reuse them as long as the
+# output files (path, size, modification time, content hash) and reading settings are unchanged
+parse_cache = yes :: bool
+
+# Run the generated QM inputs (Hessian, fragment scans) and continue with their outputs instead
+# of exiting: on this machine (local, e.g. for xtb and xtb-torsiondrive, whose inputs are command
+# lines) or by submitting them (with job_script: the job scripts) to a batch scheduler
+run_jobs = no :: str :: [no, local, scheduler]
+
+# Command that runs an input file in its directory. Placeholders: <input> (input file name),
+# <jobname>, <n_proc> and <memory> (MB, per job)
+local_command = sh <input> :: str
+
+# Maximum number of QM jobs that run (or are submitted) at the same time
+max_jobs = 1 :: int
+
+# Command that submits an input file in its directory (placeholders: <input>, <jobname>). The
+# last word of its output is taken as the job id (e.g. qsub <input>)
+submit_command = sbatch <input> :: str
+
+# Command that reports a submitted job (<jobid>): the job is considered running as long as this
+# succeeds and prints the job id (e.g. qstat <jobid>)
+status_command = squeue -h -j <jobid> :: str
+
+# Time between the status checks of a submitted job (s), doubled after every check
+poll_interval = 10.0 :: float
+
+# Longest time between the status checks of a submitted job (s)
+max_poll_interval = 300.0 :: float
+
+# Number of status checks in a row that may fail (e.g. a scheduler that is briefly unavailable)
+# before a submitted job is considered finished
+status_retries = 3 :: int
+
+# Number of times a submitted job is resubmitted if it did not produce its output
+n_retries = 1 :: int
 """
     _method = ['scan_step_size']
 
@@ -53,25 +107,60 @@ dihedral_scanner = relaxed_scan :: str :: [relaxed_scan, xtb-torsiondrive]
         self.job = job
         self.config = config
         self.software = self._set_qm_software(config.software)
+        self._check_adaptive_scan()
         self.hessian_files = self._check_hessian_output()
         self.method = self._register_method()
 
     def read_hessian(self):
-        qm_out = self.software.read().hessian(self.config, **self.hessian_files)
+        def read():
+            return self.software.read().hessian(self.config, **self.hessian_files)
+
+        files = list(self.hessian_files.values())
+        qm_out = self._read_with_cache(f'{self.job.dir}/{self.job.name}_hessian{CACHE_SUFFIX}',
+                                       files, read)
         return HessianOutput(self.config.vib_scaling, *qm_out)
 
-    def read_scan(self, files):
-        qm_outs = []
+    def read_scan(self, files, refine_angles=None):
+        """
+        Scan points of the output files. Adaptive scans (refine_angles: the requested refinement
+        midpoints, files[0]: a coarse scan file) expect the coarse grid through the first point of
+        the first file and the refinements, any other scan a full rotation with scan_step_size.
+        """
         n_scan_steps = int(np.ceil(360/self.config.scan_step_size))
-
-        for file in files:
-            if self.config.dihedral_scanner == 'relaxed_scan':
-                qm_outs.append(self.software.read().scan(self.config, f'{self.job.frag_dir}/{file}'))
-            elif self.config.dihedral_scanner == 'xtb-torsiondrive':
-                qm_outs.append(TorsiondrivexTB.read(f'{self.job.frag_dir}/{file}'))
+        qm_outs = [self._read_scan_file(file) for file in files]
         qm_out = self._get_unique_scan_points(qm_outs, n_scan_steps)
-
-        return ScanOutput(file, n_scan_steps, *qm_out)
+        if refine_angles is not None and len(qm_outs[0][2]) > 0:
+            n_scan_steps = self._count_adaptive_scan_points(qm_outs[0][2][0], refine_angles,
+                                                            qm_out[2])
+
+        return ScanOutput(files[-1], n_scan_steps, *qm_out)
+
+    def _count_adaptive_scan_points(self, start_angle, refine_angles, angles):
+        """Number of points of an adaptive scan: the ones found and the expected missing ones."""
+        coarse_step = self.config.adaptive_coarse_step
+        expected = [start_angle + i * coarse_step for i in range(round(360 / coarse_step))]
+        expected += list(refine_angles)
+        distances = np.abs((np.subtract.outer(expected, angles) + 180) % 360 - 180)
+        n_missing = (distances.min(axis=1, initial=360) > self.config.scan_step_size / 4).sum()
+        return len(angles) + int(n_missing)
+
+    def _read_scan_file(self, file):
+        file_name = f'{self.job.frag_dir}/{file}'
+        if self.config.dihedral_scanner == 'relaxed_scan':
+            def read():
+                return self.software.read().scan(self.config, file_name)
+        elif self.config.dihedral_scanner == 'xtb-torsiondrive':
+            def read():
+                return TorsiondrivexTB.read(file_name)
+        return self._read_with_cache(f'{file_name}{CACHE_SUFFIX}', get_scan_sources(file_name),
+                                     read)
+
+    def _read_with_cache(self, cache_file, source_files, read):
+        if not self.config.parse_cache:
+            return read()
+        settings = {key: getattr(self.config, key, None) for key in
+                    ['software', 'dihedral_scanner', 'charge_method', 'charge', 'multiplicity']}
+        return read_with_cache(cache_file, source_files, settings, read)
 
     @scriptify
     def write_hessian(self, file, coords, atnums):
@@ -79,7 +168,7 @@ dihedral_scanner = relaxed_scan :: str :: [relaxed_scan, xtb-torsiondrive]
 
     @scriptify
     def write_scan(self, file, scan_id, coords, atnums, scanned_atoms, start_angle, charge,
-                   multiplicity):
+                   multiplicity, step_size=None, n_steps=None):
         '''Generate the input file for the dihedral scan.
         Parameters
         ----------
@@ -102,35 +191,42 @@ dihedral_scanner = relaxed_scan :: str :: [relaxed_scan, xtb-torsiondrive]
             The total charge of the fragment.
         multiplicity : int
             The multiplicity of the molecule.
+        step_size : float, optional
+            The step size of the scan (default: scan_step_size, or adaptive_coarse_step for
+            adaptive scans).
+        n_steps : int, optional
+            The number of steps after the starting angle (default: a full rotation).
         '''
         if self.config.dihedral_scanner == 'relaxed_scan':
+            step = {}
+            if self.config.adaptive_scan:
+                step = {'step_size': step_size or self.config.adaptive_coarse_step,
+                        'n_steps': n_steps}
             self.software.write().scan(file, scan_id, self.config, coords,
                                        atnums, scanned_atoms, start_angle,
-                                       charge, multiplicity)
+                                       charge, multiplicity, **step)
         elif self.config.dihedral_scanner == 'xtb-torsiondrive':
             TorsiondrivexTB.write(self.config, file, self.job.frag_dir,
                                   scan_id, coords, atnums, scanned_atoms,
                                   charge, multiplicity)
 
     def _get_unique_scan_points(self, qm_outs, n_scan_steps):
-        all_angles, all_energies, all_coords, chosen_point_charges, final_e = [], [], [], {}, 0
-        all_angles_rounded = []
+        """Lowest energy point of each rounded angle over all scan files, in order of appearance"""
+        points, chosen_point_charges, final_e = {}, {}, 0
 
         for n_atoms, coords, angles, energies, point_charges in qm_outs:
             angles = [round(a % 360, 3) for a in angles]
 
             for angle, coord, energy in zip(angles, coords, energies):
                 angle_rounded = round(angle)
-                if angle_rounded not in all_angles_rounded:
-                    all_angles.append(angle)
-                    all_energies.append(energy)
-                    all_coords.append(coord)
-                    all_angles_rounded.append(angle_rounded)
-                else:
-                    idx = all_angles_rounded.index(angle_rounded)
-                    if energy < all_energies[idx]:
-                        all_energies[idx] = energy
-                        all_coords[idx] = coord
+                if angle_rounded not in points:
+                    points[angle_rounded] = [angle, energy, coord]
+                elif energy < points[angle_rounded][1]:
+                    points[angle_rounded][1:] = energy, coord
+
+        all_angles = [angle for angle, _, _ in points.values()]
+        all_energies = [energy for _, energy, _ in points.values()]
+        all_coords = [coord for _, _, coord in points.values()]
 
         if not chosen_point_charges:
             chosen_point_charges = point_charges
@@ -140,9 +236,21 @@ dihedral_scanner = relaxed_scan :: str :: [relaxed_scan, xtb-torsiondrive]
 
         return n_atoms, all_coords, all_angles, all_energies, chosen_point_charges
 
-    def _check_hessian_output(self):
+    def get_scan_refinements(self, angles, energies):
+        """Intervals of an adaptive scan that need a midpoint: (index of their start, half step)"""
+        return find_scan_refinements(angles, energies, self.config.scan_step_size,
+                                     self.config.adaptive_tol)
+
+    def _check_adaptive_scan(self):
+        if self.config.adaptive_scan and (self.config.software not in ['gaussian', 'orca', 'xtb']
+                                          or self.config.dihedral_scanner != 'relaxed_scan'):
+            raise ValueError('"adaptive_scan" is only available for the relaxed scans of the '
+                             '"gaussian", "orca" and "xtb" software.')
+
+    def _check_hessian_output(self, run=True):
         hessian_files = {}
         all_files = os.listdir(self.job.dir)
+        run = run and self.config.run_jobs != 'no'
 
         for req, tails in self.software.required_hessian_files.items():
             files = [file for file in all_files if any(file.endswith(f'{tail}') for tail in tails)]
@@ -151,11 +259,18 @@ dihedral_scanner = relaxed_scan :: str :: [relaxed_scan, xtb-torsiondrive]
             if n_files == 0 and self.job.coord_file:
                 coords, atnums = self._read_coord_file()
                 file_name = f'{self.job.dir}/{self.job.name}_hessian.inp'
-                print('Required Hessian output file(s) not found in the job directory.\n'
-                      'Creating the necessary input file and exiting...\nPlease run the '
-                      'calculation and put the output files in the same directory.\n')
+                if run:
+                    print('Required Hessian output file(s) not found in the job directory.\n'
+                          'Creating the necessary input file and running it...\n')
+                else:
+                    print('Required Hessian output file(s) not found in the job directory.\n'
+                          'Creating the necessary input file and exiting...\nPlease run the '
+                          'calculation and put the output files in the same directory.\n')
                 with open(file_name, 'w') as file:
                     self.write_hessian(file, coords, atnums)
+                if run:
+                    run_jobs([file_name], self.config, self._has_hessian_output)
+                    return self._check_hessian_output(run=False)
                 raise SystemExit
             elif n_files == 0:
                 print('Required Hessian output file(s) not found in the job directory\n'
@@ -169,12 +284,18 @@ dihedral_scanner = relaxed_scan :: str :: [relaxed_scan, xtb-torsiondrive]
                 hessian_files[req] = f'{self.job.dir}/{files[0]}'
         return hessian_files
 
+    def _has_hessian_output(self, file_name):
+        all_files = os.listdir(self.job.dir)
+        return (all(any(file.endswith(tail) for file in all_files for tail in tails)
+                    for tails in self.software.required_hessian_files.values())
+                and self.software.is_complete(file_name))
+
     def _read_coord_file(self):
-        molecule = read(self.job.coord_file)
+        molecule = ase_io.read(self.job.coord_file)
         coords = molecule.get_positions()
         atnums = molecule.get_atomic_numbers()
-        write(f'{self.job.dir}/init.xyz', molecule, plain=True,
-              comment=f'{self.job.name} - input geometry')
+        ase_io.write(f'{self.job.dir}/init.xyz', molecule, plain=True,
+                     comment=f'{self.job.name} - input geometry')
         return coords, atnums
 
     def _set_qm_software(self, selection):
@@ -199,3 +320,35 @@ dihedral_scanner = relaxed_scan :: str :: [relaxed_scan, xtb-torsiondrive]
         method.update({key: val.upper() for key, val in method.items() if isinstance(val, str)})
         method['software'] = self.config.software
         return method
+
+
+def find_scan_refinements(angles, energies, min_step, tol):
+    """
+    Estimate the interpolation error of a periodic cubic spline through the scan profile in each
+    interval as 5/384 h^4 |f^(4)|, with the fourth derivative taken from the jumps of the third
+    derivative of the spline at the ends of the interval. Intervals with an error above tol are
+    split (the profile is not resolved there: barriers, minima or other sharp features), but
+    not below min_step.
+
+    Returns
+    -------
+    refinements : list
+        (index of the start point, half of the interval) for each interval to be split.
+    """
+    angles, energies = np.asarray(angles, dtype=float), np.asarray(energies, dtype=float)
+    if angles.size < 4:
+        return []
+    order = np.argsort(angles % 360)
+    angles, energies = angles[order] % 360, energies[order]
+    steps = np.diff(np.append(angles, angles[0]+360))
+
+    spline = interpolate.CubicSpline(np.append(angles, angles[0]+360),
+                                     np.append(energies, energies[0]), bc_type='periodic')
+    third_deriv = 6 * spline.c[0]
+    # fourth derivative at the knots, then averaged over the two ends of each interval
+    fourth_deriv = np.abs(third_deriv - np.roll(third_deriv, 1)) / ((steps + np.roll(steps, 1))/2)
+    fourth_deriv = (fourth_deriv + np.roll(fourth_deriv, -1)) / 2
+    errors = 5 / 384 * steps**4 * fourth_deriv
+
+    refine = (steps/2 > min_step - 1e-3) & (errors > tol)
+    return [(order[i], steps[i]/2) for i in np.nonzero(refine)[0]]
@@ -1,9 +1,10 @@
-import math
 import numpy as np
 import sys
 from ase.units import Hartree, mol, kJ, Bohr
 from abc import ABC, abstractmethod
 from warnings import warn
+#
+from .fchk import FchkFile
 
 
 class WriteABC(ABC):
@@ -28,40 +29,25 @@ class ReadABC(ABC):
 
     @staticmethod
     def _read_fchk_file(fchk_file):
-        n_atoms, charge, multiplicity, elements, coords, hessian = None, None, None, [], [], []
-        with open(fchk_file, "r", encoding='utf-8') as file:
-            for line in file:
-                if "Charge                                     I" in line:
-                    charge = int(line.split()[2])
-                if "Multiplicity                               I" in line:
-                    multiplicity = int(line.split()[2])
-                if "Number of atoms  " in line:
-                    n_atoms = int(line.split()[4])
-                if "Atomic numbers  " in line:
-                    n_line = math.ceil(n_atoms/6)
-                    for i in range(n_line):
-                        line = file.readline()
-                        ids = [int(i) for i in line.split()]
-                        elements.extend(ids)
-                if "Current cartesian coordinates   " in line:
-                    n_line = math.ceil(3*n_atoms/5)
-                    for i in range(n_line):
-                        line = file.readline()
-                        coords.extend(line.split())
-                if "Cartesian Force Constants  " in line:
-                    n_line = math.ceil(3*n_atoms*(3*n_atoms+1)/10)
-                    for i in range(n_line):
-                        line = file.readline()
-                        hessian.extend(line.split())
-
-        coords = np.asfarray(coords, float)
-        hessian = np.asfarray(hessian, float)
+        with FchkFile(fchk_file) as fchk:
+            n_atoms = fchk.get('Number of atoms')
+            charge = fchk.get('Charge')
+            multiplicity = fchk.get('Multiplicity')
+            elements = fchk.get('Atomic numbers', np.array([], dtype=int))
+            coords = fchk.get('Current cartesian coordinates', np.array([]))
+            hessian = fchk.get('Cartesian Force Constants', np.array([]))
+
         coords = np.reshape(coords, (-1, 3))
-        elements = np.array(elements)
         coords = coords * Bohr
         hessian = hessian * Hartree * mol / kJ / Bohr**2
         return n_atoms, charge, multiplicity, elements, coords, hessian
 
+    @staticmethod
+    def _get_lower_triangle(hessian):
+        """Lower triangle (row by row) of the symmetrized Hessian matrix."""
+        hessian = (hessian + hessian.T) / 2
+        return hessian[np.tril_indices(len(hessian))]
+
     @staticmethod
     def _read_bond_order_from_nbo_analysis(file, n_atoms):
         b_orders = [[] for _ in range(n_atoms)]
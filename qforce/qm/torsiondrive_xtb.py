@@ -3,9 +3,12 @@ import os
 from warnings import warn
 
 import numpy as np
-from ase.io import read, write
 from ase import Atoms
 from ase.units import Hartree, mol, kJ
+#
+from ..misc import LazyImport
+
+ase_io = LazyImport('ase.io')
 
 
 class TorsiondrivexTB():
@@ -33,7 +36,7 @@ class TorsiondrivexTB():
             A dictionary with key in charge_method and the value to be a
             list of float of the size of n_atoms.
         '''
-        frames = read(log_file, index=':', format='extxyz')
+        frames = ase_io.read(log_file, index=':', format='extxyz')
         n_atoms = len(frames[0])
         energy_list = []
         coord_list = []
@@ -90,8 +93,8 @@ class TorsiondrivexTB():
         cmd = f'xTB arguments: --opt --chrg {charge} --uhf {uhf} --gfn 2 --parallel 1'
 
         mol = Atoms(positions=coords, numbers=atnums)
-        write(f'{dir}/{scan_id}_torsiondrive/input.xyz', mol, plain=True,
-              comment=cmd)
+        ase_io.write(f'{dir}/{scan_id}_torsiondrive/input.xyz', mol, plain=True,
+                     comment=cmd)
 
         with open(f"{dir}/{scan_id}_torsiondrive/dihedrals.txt", 'w') as f:
             f.write('{} {} {} {}'.format(*scanned_atoms))
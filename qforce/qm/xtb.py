@@ -3,10 +3,13 @@ import os.path
 from colt import Colt
 import numpy as np
 from ase.units import Hartree, mol, kJ, Bohr
-from ase.io import read, write
 from ase import Atoms
 #
 from .qm_base import WriteABC, ReadABC
+from .jobs import has_log_output
+from ..misc import LazyImport
+
+ase_io = LazyImport('ase.io')
 
 
 class xTB(Colt):
@@ -29,6 +32,16 @@ class xTB(Colt):
         self.read = ReadxTB
         self.write = WritexTB
 
+    @staticmethod
+    def is_complete(file_name):
+        """
+        Whether the job of the input file finished: xtb reports its termination only on stdout,
+        but writes the charges after the optimization / Hessian, next to the scan log or Hessian.
+        """
+        stem = os.path.splitext(file_name)[0]
+        return os.path.isfile(f'{stem}.charges') and (os.path.isfile(f'{stem}.hessian')
+                                                     or has_log_output(file_name))
+
 
 class WritexTB(WriteABC):
     def hessian(self, file, job_name, config, coords, atnums):
@@ -59,11 +72,11 @@ class WritexTB(WriteABC):
         file.write(cmd)
         # Write the coordinates, which is the standard xyz file.
         mol = Atoms(positions=coords, numbers=atnums)
-        write(f'{base}/{job_name}_input.xyz', mol, plain=True,
-              comment=cmd)
+        ase_io.write(f'{base}/{job_name}_input.xyz', mol, plain=True,
+                     comment=cmd)
 
     def scan(self, file, job_name, config, coords, atnums, scanned_atoms,
-             start_angle, charge, multiplicity):
+             start_angle, charge, multiplicity, step_size=None, n_steps=None):
         """ Write the input file for the dihedral scan and charge calculation.
 
         Parameters
@@ -86,6 +99,10 @@ class WritexTB(WriteABC):
             The total charge of the molecule.
         multiplicity : int
             The multiplicity of the molecule.
+        step_size : float, optional
+            The step size of the scan in degree (default: scan_step_size).
+        n_steps : int, optional
+            The number of steps after the starting angle (default: a full rotation).
         """
         # Write the xTB input file
         name = file.name
@@ -99,8 +116,14 @@ class WritexTB(WriteABC):
 
         # Create the scan input file
         a1, a2, a3, a4 = np.array(scanned_atoms)
-        step_num = int(360 // config.scan_step_size)
-        end_angle = start_angle + 360 - config.scan_step_size
+        if step_size is None:
+            step_size = config.scan_step_size
+        if n_steps is None:
+            step_num = int(360 // step_size)
+            end_angle = start_angle + 360 - step_size
+        else:
+            step_num = n_steps + 1
+            end_angle = start_angle + n_steps * step_size
 
         with open(f'{base}/{job_name}.dat', 'w') as f:
             f.write('$constrain\n')
@@ -112,8 +135,8 @@ class WritexTB(WriteABC):
 
         # Write the coordiante file in the xyz file format
         mol = Atoms(positions=coords, numbers=atnums)
-        write(f'{base}/{job_name}_input.xyz', mol, plain=True,
-              comment=cmd)
+        ase_io.write(f'{base}/{job_name}_input.xyz', mol, plain=True,
+                     comment=cmd)
 
         file.write(cmd)
 
@@ -143,29 +166,15 @@ class ReadxTB(ReadABC):
             text = f.read()
 
         text = text[text.index('$hessian'):]
-        lines = text.split('\n')[1:]
+        text = text[text.index('\n'):].split('$')[0]
         # number of atoms * 3 for the x, y and z axis
         n_atoms *= 3
-        hessian = np.empty((n_atoms, n_atoms))
-
-        for i in range(n_atoms):
-            # Find the row
-            trunk = lines[: int(np.ceil(n_atoms / 5))]
-            lines = lines[int(np.ceil(n_atoms / 5)):]
-            # Split into columns
-            row = []
-            for line in trunk:
-                row.extend(line.split())
-            hessian[i, :] = row
+        # rows are stored one after the other, 5 values per line
+        hessian = np.fromstring(text, sep=' ')[:n_atoms**2].reshape(n_atoms, n_atoms)
 
         # Output the lower triangle of the hessian matrix to match the
         # format adopted by Gaussian and Qchem.
-        out_hessian = []
-        for i in range(len(hessian)):
-            for j in range(i + 1):
-                hes = (hessian[i, j] + hessian[j, i]) / 2
-                out_hessian.append(hes)
-        return np.array(out_hessian) * Hartree * mol / kJ / Bohr ** 2
+        return ReadABC._get_lower_triangle(hessian) * Hartree * mol / kJ / Bohr ** 2
 
     @staticmethod
     def _read_xtb_charge(pc_file):
@@ -212,7 +221,7 @@ class ReadxTB(ReadABC):
         coords : array
             An array of float of the shape (n_atoms, 3).
         """
-        mol = read(coord_file)
+        mol = ase_io.read(coord_file)
         n_atoms = len(mol)
         elements = np.array([atom.number for atom in mol])
         coords = mol.positions
@@ -239,7 +248,7 @@ class ReadxTB(ReadABC):
         coord_list : array
             An array of float of the shape (n_atoms, 3).
         """
-        frames = read(coord_file, index=':', format='extxyz')
+        frames = ase_io.read(coord_file, index=':', format='extxyz')
         energy_list = []
         coord_list = []
         for frame in frames:
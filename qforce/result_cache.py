@@ -0,0 +1,106 @@
+import os
+import glob
+import json
+import time
+import shutil
+import pickle
+#
+from .checkpoint import get_settings
+from .qm.parse_cache import hash_file
+
+"""
+
+Store of finished runs shared between jobs (e.g. a high-throughput screening): the outputs of a
+run are copied to <store>/<key>, where the key is a hash of the QM data, the effective settings,
+the qforce code and the scan data of the fragments. A run with the same key copies them back
+instead of computing them. Data that a run reads from outside of its job directory (the scan
+data in the fragment library) is recorded with its hash and has to be unchanged for a stored run
+to be reused. The store is kept below a maximum size by removing the least recently used runs.
+
+"""
+
+# outputs of a run, relative to the job directory
+OUTPUT_PATTERNS = ['gas*.top', 'gas*.gro', '*_qforce*.itp', 'frequencies.*',
+                   'fragments/scan_data_*', 'fragments/fit_data_*', 'fragments/unfit_data_*']
+
+
+def get_cache_settings(config):
+    """The effective settings of a run without the ones that do not affect its outputs."""
+    # plots decides which output files there are
+    return {block: get_settings(section, block, keep=['plots'])
+            for block, section in vars(config).items()}
+
+
+def restore_results(store, key, job_dir):
+    """Copy the outputs of a stored run into job_dir. Returns its terms, None if not stored."""
+    entry = f'{store}/{key}'
+    meta = _load_meta(entry)
+    if meta is None or any(not os.path.isfile(file) or hash_file(file) != sha
+                           for file, sha in meta['dependencies'].items()):
+        return None
+
+    try:
+        with open(f'{entry}/terms.pkl', 'rb') as file:
+            terms = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+    for name in meta['outputs']:
+        os.makedirs(os.path.dirname(f'{job_dir}/{name}'), exist_ok=True)
+        shutil.copyfile(f'{entry}/outputs/{name}', f'{job_dir}/{name}')
+    os.utime(f'{entry}/meta.json')  # last use, for the eviction
+    print(f'Taking the results from the result cache: {entry}\n')
+    return terms
+
+
+def store_results(store, key, job_dir, terms, dependencies=(), max_size=1000.):
+    """Copy the outputs of a finished run to the store and evict old runs beyond max_size MB."""
+    os.makedirs(store, exist_ok=True)
+    tmp_entry = f'{store}/{key}.{os.getpid()}.tmp'
+    outputs = sorted(os.path.relpath(file, job_dir) for pattern in OUTPUT_PATTERNS
+                     for file in glob.glob(f'{job_dir}/{pattern}'))
+    try:
+        for name in outputs:
+            os.makedirs(os.path.dirname(f'{tmp_entry}/outputs/{name}'), exist_ok=True)
+            shutil.copyfile(f'{job_dir}/{name}', f'{tmp_entry}/outputs/{name}')
+        with open(f'{tmp_entry}/terms.pkl', 'wb') as file:
+            pickle.dump(terms, file, pickle.HIGHEST_PROTOCOL)
+        with open(f'{tmp_entry}/meta.json', 'w') as file:
+            json.dump({'outputs': outputs, 'time': time.time(),
+                       'dependencies': {os.path.abspath(dep): hash_file(dep)
+                                        for dep in dependencies if os.path.isfile(dep)}}, file)
+        shutil.rmtree(f'{store}/{key}', ignore_errors=True)
+        os.replace(tmp_entry, f'{store}/{key}')
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):  # just not stored
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        return
+    evict(store, max_size)
+
+
+def evict(store, max_size):
+    """Remove the least recently used runs until the store is at most max_size MB."""
+    entries = []
+    for name in os.listdir(store):
+        entry = f'{store}/{name}'
+        if os.path.isfile(f'{entry}/meta.json'):
+            entries.append((os.path.getmtime(f'{entry}/meta.json'), _get_size(entry), entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_size * 1e6:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def _load_meta(entry):
+    try:
+        with open(f'{entry}/meta.json') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _get_size(entry):
+    return sum(os.path.getsize(os.path.join(root, file))
+               for root, _, files in os.walk(entry) for file in files)
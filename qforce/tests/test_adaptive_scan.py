@@ -0,0 +1,76 @@
+import io
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+from qforce.qm.qm import QM, find_scan_refinements
+from qforce.qm.qm_base import ScanOutput
+from qforce.qm.gaussian import WriteGaussian
+from qforce.qm.orca import WriteORCA
+
+
+def test_smooth_profile_is_not_refined():
+    angles = np.arange(0, 360, 30.)
+    energies = 5 * (1 + np.cos(np.radians(3 * angles)))
+    assert find_scan_refinements(angles, energies, 15., 0.5) == []
+
+
+def test_sharp_profile_is_refined():
+    angles = np.arange(0, 360, 30.)
+    energies = 20 * np.exp(-((angles - 180) / 25)**2)
+    refinements = find_scan_refinements(angles, energies, 15., 0.5)
+    starts = [angles[idx] for idx, _ in refinements]
+
+    assert 0 < len(refinements) < angles.size
+    assert all(120 <= start <= 210 for start in starts)
+    assert all(np.isclose(step, 15.) for _, step in refinements)
+    assert find_scan_refinements(angles, energies, 30., 0.5) == []
+
+
+def test_irregular_scan_output():
+    angles = [0., 30., 45., 60., 90., 180., 270.]
+    energies = [1., 2., 3., 2., 4., 5., 0.5]
+    coords = np.zeros((7, 3, 3))
+    scan = ScanOutput('scan.log', len(angles), 3, coords, angles, energies, {})
+
+    assert not scan.mismatch
+    assert np.allclose(scan.angles, angles)
+    assert scan.energies.min() == 0
+
+
+@pytest.mark.parametrize('writer, expected', [(WriteGaussian, 'D 1 2 3 4 S 1 7.50'),
+                                              (WriteORCA, 'D 0 1 2 3 = 10.00, 17.50, 2')])
+def test_single_step_writer(writer, expected):
+    class Config:
+        scan_step_size = 15.
+        memory = 1000
+        n_proc = 1
+        method = 'PBE'
+        dispersion = None
+        basis = None
+        solvent_method = None
+        qm_method_opt = qm_method_charge = qm_method_sp = 'XTB2'
+
+    file = io.StringIO()
+    writer().scan(file, 'frag', Config(), np.zeros((4, 3)), [6, 6, 6, 6], [1, 2, 3, 4], 10.,
+                  0, 1, step_size=7.5, n_steps=1)
+    assert expected in file.getvalue()
+
+
+@pytest.mark.parametrize('coarse, refine, requested, mismatch', [
+    (np.arange(10., 360., 30.), [55.], [55], False),
+    (np.arange(10., 360., 30.), None, [55], True),  # refinement not done
+    (np.delete(np.arange(10., 360., 30.), 3), [55.], [55], True),  # coarse point missing
+])
+def test_adaptive_scan_points(coarse, refine, requested, mismatch):
+    outputs = {'frag~1.log': coarse}
+    if refine is not None:
+        outputs['frag~1_refine055.log'] = refine
+    qm = QM.__new__(QM)
+    qm.config = SimpleNamespace(scan_step_size=15., adaptive_coarse_step=30.)
+    qm._read_scan_file = lambda file: (3, np.zeros((len(outputs[file]), 3, 3)), outputs[file],
+                                       np.ones(len(outputs[file])), {})
+
+    scan = qm.read_scan(list(outputs), requested)
+    assert bool(scan.mismatch) == mismatch
+    assert scan.angles.size == len(coarse) + len(refine or [])
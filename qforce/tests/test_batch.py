@@ -0,0 +1,140 @@
+import os
+from io import StringIO
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from ase.build import molecule
+
+from qforce import batch, main
+from qforce.batch import get_batch_inputs, run_batch, sets_option
+from qforce.initialize import get_config, get_memory_job
+from qforce.qm.qm import QM
+from qforce.qm.qm_base import HessianOutput
+
+
+def test_inputs_from_directory(tmpdir):
+    tmpdir.join('propane.xyz').write('')
+    tmpdir.join('butane.pdb').write('')
+    tmpdir.join('settings.ini').write('')
+    tmpdir.mkdir('propane_qforce')
+    tmpdir.mkdir('ethane_qforce')
+    tmpdir.mkdir('qforce_fragments')
+
+    inputs = get_batch_inputs(tmpdir.strpath)
+    assert inputs == [tmpdir.join(name).strpath for name in ['butane.pdb', 'ethane_qforce',
+                                                             'propane.xyz']]
+
+
+def test_inputs_from_list(tmpdir):
+    tmpdir.join('molecules').write('propane.xyz\n\n# skipped\nbutane_qforce  # comment\n')
+
+    inputs = get_batch_inputs(tmpdir.join('molecules').strpath)
+    assert inputs == [tmpdir.join('propane.xyz').strpath, tmpdir.join('butane_qforce').strpath]
+
+
+def test_no_inputs(tmpdir):
+    with pytest.raises(ValueError):
+        get_batch_inputs(tmpdir.strpath)
+
+
+def setup_butane(job_dir, frag_lib, shift):
+    """The setup stage of a butane molecule (synthetic xTB data) without QM output files."""
+    atoms = molecule('trans-butane')
+    coords = atoms.positions + shift
+    dists = np.linalg.norm(coords[:, np.newaxis] - coords, axis=-1)
+    matrix = np.random.default_rng(1).normal(size=(42, 42))
+    qm_out = HessianOutput(1.0, n_atoms=14, charge=0, multiplicity=1, elements=atoms.numbers,
+                           coords=coords, hessian=(matrix @ matrix.T)[np.tril_indices(42)],
+                           b_orders=((dists > 0) & (dists < 1.7)).astype(float),
+                           point_charges=np.where(atoms.numbers == 6, -0.3, 0.12))
+
+    config = get_config(StringIO(f'[qm]\nsoftware = xtb\n[scan]\nfrag_lib = {frag_lib}\n'))
+    config.scan.batch_run = True
+    job = get_memory_job(os.path.basename(job_dir), job_dir)
+    qm = QM.__new__(QM)
+    qm.job, qm.config = job, config.qm
+    qm.software = qm._set_qm_software('xtb')
+    qm.method = qm._register_method()
+    return SimpleNamespace(config=config, job=job, qm=qm, ext_q=None, ext_lj=None, qm_out=qm_out,
+                           mol=None, md_hessian=None, fragments=[], result_key=None)
+
+
+def fake_fit_hessian(terms, mol, qm_out):
+    return qm_out.coords[0, 0], os.getpid()
+
+
+def fake_frequencies(job, qm_out, md_hessian, plots):
+    with open(f'{job.dir}/md_hessian', 'w') as file:
+        file.write(f'{md_hessian[0]} {md_hessian[1]}')
+
+
+def fake_fragment(mol, qm, job, config):
+    return [SimpleNamespace(id=job.name, qm_energies=np.zeros(3), qm_coords=np.zeros((3, 14, 3)),
+                            frag_charges=[])]
+
+
+def fake_dihedral_scan(fragments, mol, job, config):
+    with open(f'{job.dir}/dihedrals', 'w') as file:
+        file.write(' '.join(frag.id for frag in fragments))
+
+
+class FakeForceField:
+    def __init__(self, name, config, mol, neighbors):
+        pass
+
+    def write_gromacs(self, directory, mol, coords):
+        open(f'{directory}/gas.top', 'w').close()
+
+
+def test_run_batch(tmpdir, monkeypatch):
+    tmpdir.join('molecules').write('butane\nbutane_shifted\nno_hessian\n')
+    shifts = {'butane': 0., 'butane_shifted': 1.}
+
+    def setup_molecule(input_arg, config, presets):
+        name = os.path.basename(input_arg)
+        if name == 'no_hessian':  # like initialize: exits after writing the Hessian input
+            raise SystemExit
+        return setup_butane(f'{input_arg}_qforce', tmpdir.join('frag_lib').strpath,
+                            shifts[name])
+
+    monkeypatch.setattr(batch, 'setup_molecule', setup_molecule)
+    monkeypatch.setattr(main, 'fit_hessian', fake_fit_hessian)
+    monkeypatch.setattr(main, 'calc_qm_vs_md_frequencies', fake_frequencies)
+    monkeypatch.setattr(main, 'DihedralScan', fake_dihedral_scan)
+    monkeypatch.setattr(main, 'ForceField', FakeForceField)
+    job_dirs = [tmpdir.join(f'{name}_qforce') for name in shifts]
+
+    # both molecules have the same fragments: only the first one writes their QM inputs
+    done, pending = run_batch(tmpdir.join('molecules').strpath, n_workers=2)
+    assert done == []
+    assert pending == [tmpdir.join('no_hessian').strpath] + [job_dir.strpath
+                                                             for job_dir in job_dirs]
+    inputs = sorted(file.purebasename for file in job_dirs[0].join('fragments').listdir('*.inp'))
+    assert len(inputs) == 2
+    assert job_dirs[1].join('fragments').listdir('*.inp') == []
+    assert sorted(job_dirs[1].join('fragments', 'generated').read().split()) == inputs
+    assert all(job_dir.join('checkpoints', 'hessian_fit.pkl').check() for job_dir in job_dirs)
+
+    # once the scan data is there, the Hessian and dihedral fits run on the pool
+    monkeypatch.setattr(main, 'fragment', fake_fragment)
+    done, pending = run_batch(tmpdir.join('molecules').strpath, n_workers=2)
+    assert done == [job_dir.strpath for job_dir in job_dirs]
+    assert pending == [tmpdir.join('no_hessian').strpath]
+
+    md_hessians = [job_dir.join('md_hessian').read().split() for job_dir in job_dirs]
+    assert np.isclose(float(md_hessians[1][0]) - float(md_hessians[0][0]), 1.)
+    assert all(int(pid) != os.getpid() for _, pid in md_hessians)
+    for job_dir in job_dirs:
+        assert job_dir.join('dihedrals').read() == job_dir.basename
+        assert job_dir.join('gas.top').check()
+
+
+def test_sets_option(tmpdir):
+    settings = tmpdir.join('settings.ini')
+    settings.write('[ff]\nbatch_run = yes\n[scan]\n# batch_run = yes\nfrag_lib = lib\n')
+    assert not sets_option(settings.strpath, 'scan', 'batch_run')
+    assert sets_option(settings.strpath, 'scan', 'frag_lib')
+
+    settings.write('[scan]\nbatch_run = no  # write the inputs of all molecules\n')
+    assert sets_option(settings.strpath, 'scan', 'batch_run')
+    assert not sets_option(tmpdir.join('missing.ini').strpath, 'scan', 'batch_run')
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import numpy as np
+
+from qforce import checkpoint
+from qforce.checkpoint import run_stage, make_key, get_settings
+
+
+class Stage():
+    def __init__(self):
+        self.n_calls = 0
+
+    def __call__(self):
+        self.n_calls += 1
+        return {'terms': np.arange(3.), 'n_calls': self.n_calls}
+
+
+def test_make_key():
+    config = SimpleNamespace(n_equiv=4, charge_scaling=1.2, exclusions=None)
+    key = make_key(np.ones((2, 3)), config, [1, 'a'])
+    assert key == make_key(np.ones((2, 3)), SimpleNamespace(**vars(config)), [1, 'a'])
+    assert key != make_key(np.ones((3, 2)), config, [1, 'a'])
+    assert key != make_key(np.ones((2, 3)), SimpleNamespace(**{**vars(config), 'n_equiv': 3}),
+                           [1, 'a'])
+    assert make_key(1) != make_key(1.0) != make_key('1')
+
+
+def test_code_fingerprint(monkeypatch):
+    key = make_key('stage')
+    monkeypatch.setattr(checkpoint, 'get_code_fingerprint', lambda: 'modified source tree')
+    assert make_key('stage') != key
+
+
+def test_run_stage(tmpdir):
+    job = SimpleNamespace(dir=tmpdir.strpath)
+    stage = Stage()
+
+    first = run_stage(job, 'molecule', 'key1', stage)
+    second = run_stage(job, 'molecule', 'key1', stage)
+    assert stage.n_calls == 1
+    assert np.array_equal(second['terms'], first['terms']) and second['n_calls'] == 1
+    assert tmpdir.join('checkpoints', 'molecule.pkl').check()
+
+    assert run_stage(job, 'molecule', 'key2', stage)['n_calls'] == 2
+    assert run_stage(job, 'molecule', 'key2', stage, enabled=False)['n_calls'] == 3
+
+    tmpdir.join('checkpoints', 'molecule.pkl').write('broken')
+    assert run_stage(job, 'molecule', 'key2', stage)['n_calls'] == 4
+
+
+def test_ignored_settings(tmpdir):
+    job = SimpleNamespace(dir=tmpdir.strpath)
+    stage = Stage()
+    ff = SimpleNamespace(n_equiv=4, plots='inline', checkpoints=True)
+    qm = SimpleNamespace(software='xtb', run_jobs='no', max_jobs=1, poll_interval=10.)
+
+    def get_key(ff, qm):
+        return make_key(get_settings(ff, 'ff'), get_settings(qm, 'qm'))
+
+    run_stage(job, 'dihedral_fit', get_key(ff, qm), stage)
+    ff.plots = 'none'
+    qm.run_jobs, qm.max_jobs, qm.poll_interval = 'scheduler', 8, 60.
+    assert run_stage(job, 'dihedral_fit', get_key(ff, qm), stage)['n_calls'] == 1
+
+    ff.n_equiv = 3
+    assert run_stage(job, 'dihedral_fit', get_key(ff, qm), stage)['n_calls'] == 2
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import scipy.optimize as optimize
+from scipy import sparse
+
+from qforce.dihedral_scan import (solve_multi_rb, calc_multi_rb_obj, calc_multi_rb_matrix,
+                                  calc_rb)
+
+
+@pytest.fixture(scope='module')
+def rb_problem():
+    rng = np.random.default_rng(0)
+    angles = np.radians(np.arange(-180, 180, 15))
+    # two fragments, three dihedral types, the second type appears in both fragments
+    matrix = np.zeros((2 * angles.size, 18))
+    matrix[:angles.size, 0:6] = calc_rb(angles)
+    matrix[:angles.size, 6:12] = calc_rb(angles + 0.4)
+    matrix[angles.size:, 6:12] = calc_rb(angles - 1.)
+    matrix[angles.size:, 12:18] = calc_rb(angles)
+    energy_diffs = matrix @ rng.normal(scale=3., size=18) + rng.normal(scale=0.1,
+                                                                       size=2*angles.size)
+    weights = np.exp(-0.2 * np.sqrt(np.abs(energy_diffs)))
+    return matrix, weights, energy_diffs
+
+
+def test_solve_multi_rb(rb_problem):
+    matrix, weights, energy_diffs = rb_problem
+    params = solve_multi_rb(matrix, weights, energy_diffs)
+
+    ref = optimize.minimize(calc_multi_rb_obj, x0=np.zeros(18),
+                            args=(matrix, weights, energy_diffs)).x
+    obj = calc_multi_rb_obj(params, matrix, weights, energy_diffs)
+    assert obj <= calc_multi_rb_obj(ref, matrix, weights, energy_diffs) + 1e-8
+
+    gradient = optimize.approx_fprime(params, calc_multi_rb_obj, 1e-6, matrix, weights,
+                                      energy_diffs)
+    assert np.allclose(gradient, 0, atol=1e-3)
+
+    assert np.allclose(solve_multi_rb(sparse.csr_matrix(matrix), weights, energy_diffs), params)
+
+
+def test_solve_multi_rb_bounded(rb_problem):
+    matrix, weights, energy_diffs = rb_problem
+    params = solve_multi_rb(matrix, weights, energy_diffs)
+    bound = np.abs(params).max() / 2
+
+    bounded = solve_multi_rb(matrix, weights, energy_diffs, bound=bound)
+    assert np.abs(bounded).max() <= bound + 1e-10
+    assert np.allclose(solve_multi_rb(matrix, weights, energy_diffs, bound=1e6), params,
+                       atol=1e-6)
+    assert np.allclose(solve_multi_rb(sparse.csr_matrix(matrix), weights, energy_diffs,
+                                      bound=bound), bounded, atol=1e-6)
+
+
+def test_calc_multi_rb_matrix():
+    angles = np.radians(np.arange(0, 360, 30))
+    fragments = [SimpleNamespace(qm_angles=angles, fit_terms=[
+                     {'idx': 1, 'angles': angles}, {'idx': 1, 'angles': angles + 0.5}]),
+                 SimpleNamespace(qm_angles=angles[:6], fit_terms=[
+                     {'idx': 0, 'angles': angles[:6]}, {'idx': 2, 'angles': angles[:6] - 1}])]
+
+    matrix = calc_multi_rb_matrix(fragments, {'a': 0, 'b': 1, 'c': 2}, 18)
+
+    ref = np.zeros((18, 18))
+    ref[:12, 6:12] = calc_rb(angles) + calc_rb(angles + 0.5)
+    ref[12:, 0:6] = calc_rb(angles[:6])
+    ref[12:, 12:18] = calc_rb(angles[:6] - 1)
+    assert np.allclose(matrix.toarray(), ref)
+    assert np.allclose(calc_rb(angles)[:, 3], np.cos(angles - np.pi)**3)
@@ -0,0 +1,236 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+from qforce.dihedral_scan import (DihedralScan, calc_rb_pot, calc_frag_rb_change,
+                                  relax_scan_point, evict_scans)
+from qforce.molecule.terms import Terms as MoleculeTerms
+from qforce.molecule.storage import TermStorage, MultipleTermStorge
+from qforce.molecule.non_dihedral_terms import BondTerm, AngleTerm
+from qforce.molecule.dihedral_terms import FlexibleDihedralTerm
+
+
+def make_scan(tmpdir, **config):
+    scan = DihedralScan.__new__(DihedralScan)
+    scan.frag_dir = tmpdir.strpath
+    scan.symmetrize = {}
+    scan.config = SimpleNamespace(**{'rerelax_tol': 0.0, **config})
+    return scan
+
+
+def test_rerelax_tol(tmpdir):
+    # one dihedral at 0, 90, 180 and 270 degrees: a change of its first RB parameter changes
+    # the energies by -cos(phi) = -1, 0, 1, 0 to first order
+    phis = np.radians([0, 90, 180, 270])
+    coords = np.array([[[1., 0., 0.], [0., 0., 0.], [0., 0., 1.5],
+                        [np.cos(phi), np.sin(phi), 1.5]] for phi in phis])
+    term = SimpleNamespace(atomids=np.arange(4), equ=np.array([0., 1., 0., 0., 0., 0.]))
+    frag = SimpleNamespace(id='frag~1', coords=coords, terms={'dihedral/flexible': [term]},
+                           relaxed=[(energy, [np.zeros(6)]) for energy in [5., 6., 7., 8.]])
+    scan = make_scan(tmpdir, rerelax_tol=0.5)
+
+    scan.select_scan_points([frag], n_run=1)  # not in the first two runs
+    assert frag.rerelax.all()
+
+    scan.select_scan_points([frag], n_run=2)
+    assert list(frag.rerelax) == [True, False, True, False]
+    assert np.allclose(frag.energy_estimates[[1, 3]], [6., 8.])
+
+    term.equ[1] = 0.2
+    scan.select_scan_points([frag], n_run=3)
+    assert not frag.rerelax.any()
+    assert np.allclose(frag.energy_estimates, [4.8, 6., 7.2, 8.])
+
+    log = tmpdir.join('mm_scan_frag~1.log').read()  # all runs, outside of the scan directory
+    assert [line for line in log.splitlines() if line.startswith('Run')] == [
+        'Run 2: relaxed 4 of 4 scan points', 'Run 3: relaxed 2 of 4 scan points',
+        'Run 4: relaxed 0 of 4 scan points']
+    assert '   3  skipped, energy: 8.0000 kJ/mol (first order)' in log
+
+
+class Term(SimpleNamespace):
+    def __str__(self):
+        return self.name
+
+
+class Terms(dict):
+    """Iterates over the terms like the Terms of a molecule."""
+    def __iter__(self):
+        for terms in self.values():
+            yield from terms
+
+
+def make_fragment(name, qm_energy):
+    """A rigid four atom fragment scanned around the 2-0-1-3 dihedral in 30 degree steps."""
+    phis = np.radians(np.arange(0, 360, 30))
+    coords = np.array([[[0., 0., 0.], [0., 0., 1.5], [1., 0., 0.], [np.cos(phi), np.sin(phi), 1.5]]
+                       for phi in phis])
+    term = Term(name=name, atomids=np.array([2, 0, 1, 3]), equ=np.zeros(6), fconst=0.)
+    return SimpleNamespace(id=name, qm_coords=coords, qm_energies=qm_energy(phis), fit_terms=[],
+                           scanned_atomids=np.array([2, 0, 1, 3]), central_atoms=(0, 1),
+                           terms=Terms({'dihedral/flexible': [term]}))
+
+
+def relax(frag):
+    """Synthetic MM scan: the RB energy of the dihedral, lowered a bit by the "relaxation"."""
+    rb_energy = calc_rb_pot(frag.terms['dihedral/flexible'][0].equ, frag.fit_terms[0]['angles'])
+    return 2 + rb_energy - 0.02 * np.tanh(rb_energy)
+
+
+@pytest.mark.parametrize('barrier, param_tol, n_iterations', [
+    (400., 0.01, {'fast': 3, 'slow': 5}),
+    (400., 0., {'fast': 5, 'slow': 5}),  # disabled
+    (0.4, 0.01, {'fast': 3, 'slow': 3}),  # all converged: early stop
+    (0., 0.01, {'fast': 3, 'slow': 2}),  # flat profile: converged after the second scan
+])
+def test_convergence(tmpdir, barrier, param_tol, n_iterations):
+    # a high barrier gives small fit weights: the regularization slows the fit down
+    fragments = [make_fragment('fast', lambda phi: 0.2 * (1 + np.cos(phi))),
+                 make_fragment('slow', lambda phi: barrier / 2 * (1 - np.cos(phi)))]
+    scan = make_scan(tmpdir, n_dihed_scans=5, param_tol=param_tol, energy_tol=0.01,
+                     fit_bound=None, scan_cache=False)
+    mol = SimpleNamespace(terms={'dihedral/flexible': [Term(name=name, equ=np.zeros(6))
+                                                       for name in ['fast', 'slow']]})
+    fragments, all_dih_terms, weights = scan.arrange_data(mol, fragments)
+
+    scanned = []
+
+    def scan_fragments(all_config, frags, mol, n_run):
+        scanned.append([frag.id for frag in frags])
+        for frag in frags:
+            scan.calc_fit_angles(frag)
+        return [relax(frag) for frag in frags]
+
+    scan.scan = scan_fragments
+    final_energy, params = scan.scan_dihedrals(fragments, mol, None, all_dih_terms, weights)
+
+    assert {frag.id: frag.n_iterations for frag in fragments} == n_iterations
+    assert scanned == [[name for name in ['fast', 'slow'] if n_iterations[name] > n_run]
+                       for n_run in range(max(n_iterations.values()))]
+
+    # the energies of the converged fragment, updated to first order since, match a relaxation
+    fast = fragments[0]
+    full = relax(fast)
+    assert np.allclose(final_energy[:12] - final_energy[:12].min(), full - full.min(), atol=1e-3)
+
+    change = np.zeros_like(params).reshape(-1, 6)
+    change[fast.fit_idx[0]] = [0.5, -1., 0.3, 0.2, 0., 0.1]
+    fast.terms['dihedral/flexible'][0].equ += change[fast.fit_idx[0]]
+    assert np.allclose(calc_frag_rb_change(fast, change), relax(fast) - full, atol=0.05)
+
+
+@pytest.mark.parametrize('change', ['term', 'restraint', 'method', 'hessian_guess',
+                                    'gromacs_exec'])
+def test_scan_cache(tmpdir, change):
+    frag = make_fragment('frag', lambda phi: 1 + np.cos(phi))
+    frag.dir = tmpdir.join('frag_lib').strpath
+    frag.hessian_guess = np.eye(12)
+    scan = make_scan(tmpdir, scan_cache=True, scan_cache_size=100.,
+                     method='gromacs' if change == 'gromacs_exec' else 'qforce',
+                     exact_constraints=False, hessian_guess=change == 'hessian_guess',
+                     gromacs_exec='gmx')
+    scan.arrange_data(SimpleNamespace(terms=frag.terms), [frag])
+
+    relaxations, shift = [], np.zeros((4, 3))
+    shift[3, 2] = 0.1
+
+    def scan_fragments(all_config, frags, mol, n_run):
+        # "relaxes" the points by moving the last atom along the dihedral axis
+        points = list(scan.get_scan_points(frags, n_run))
+        relaxations.append(len(points))
+        return scan.collect_scan_results(frags, [(coord + shift, float(i))
+                                                 for _, i, coord, _, _ in points])
+
+    scan.scan = scan_fragments
+    energies = scan.scan_with_cache(None, [frag], None, 1)
+    relaxed_coords, fit_angles = frag.coords.copy(), frag.fit_terms[0]['angles']
+    assert relaxations == [12]
+    assert len(tmpdir.join('frag_lib', 'mm_scans').listdir()) == 1
+
+    frag.coords = frag.qm_coords.copy()  # the same scan again: read from the cache
+    frag.fit_terms[0]['angles'] = None
+    assert np.allclose(scan.scan_with_cache(None, [frag], None, 1), energies)
+    assert np.allclose(frag.coords, relaxed_coords)
+    assert np.allclose(frag.fit_terms[0]['angles'], fit_angles)
+    assert relaxations == [12]
+
+    frag.coords = frag.qm_coords.copy()
+    if change == 'term':
+        frag.terms['dihedral/flexible'][0].equ[1] = 0.5
+    elif change == 'restraint':
+        frag.qm_coords[3] = frag.qm_coords[4]  # restrained to another angle
+    elif change == 'method':
+        scan.config.method = 'qforce_native'
+    elif change == 'hessian_guess':
+        frag.hessian_guess = 2 * np.eye(12)
+    else:
+        scan.config.gromacs_exec = 'gmx_mpi'
+    scan.scan_with_cache(None, [frag], None, 1)
+    assert relaxations == [12, 12]
+    assert len(tmpdir.join('frag_lib', 'mm_scans').listdir()) == 2
+
+
+def test_evict_scans(tmpdir):
+    for i, name in enumerate(['a', 'b', 'c']):
+        tmpdir.join(f'{name}.npz').write(b'0' * 400_000)
+        os.utime(tmpdir.join(f'{name}.npz').strpath, (i, i))
+    os.utime(tmpdir.join('a.npz').strpath)  # used last
+
+    evict_scans(tmpdir.strpath, 1.)
+    assert sorted(file.basename for file in tmpdir.listdir()) == ['a.npz', 'c.npz']
+
+
+def make_butane_fragment(frag_dir, name, rb_params):
+    """Four carbon fragment with Q-Force terms, scanned around its dihedral in 45 degree steps."""
+    bonds = TermStorage('BondTerm', [BondTerm([i, i+1], 1.5, 'cc', fconst=1000.)
+                                     for i in range(3)])
+    angles = TermStorage('AngleTerm', [AngleTerm([i, i+1, i+2], 1.95, 'ccc', fconst=400.)
+                                       for i in range(2)])
+    flexible = TermStorage('FlexibleDihedralTerm', [
+        FlexibleDihedralTerm([0, 1, 2, 3], np.array(rb_params), 'cccc')])
+    terms = MoleculeTerms.from_terms({'bond': bonds, 'angle': angles,
+                                      'dihedral': MultipleTermStorge('dihedral',
+                                                                     {'flexible': flexible})},
+                                     [], [])
+    coords = []
+    for phi in np.radians(np.arange(0, 360, 45)):
+        coord = np.array([[1.2, 0.8, 0.], [0., 0., 0.], [1.5, 0., 0.], [2.7, 0.8, 0.]])
+        rot = np.array([[1, 0, 0], [0, np.cos(phi), -np.sin(phi)], [0, np.sin(phi), np.cos(phi)]])
+        coord[3] = coord[2] + rot @ (coord[3] - coord[2])
+        coords.append(coord)
+    os.makedirs(f'{frag_dir}/{name}', exist_ok=True)
+    return SimpleNamespace(id=name, elements=[6]*4, terms=terms, coords=np.array(coords),
+                           qm_coords=np.array(coords), scanned_atomids=np.array([0, 1, 2, 3]),
+                           fit_terms=[{'atomids': np.array([0, 1, 2, 3])}])
+
+
+@pytest.mark.parametrize('method', ['qforce', 'qforce_native'])
+@pytest.mark.parametrize('n_proc', [2, 3])
+def test_parallel_scan(tmpdir, method, n_proc):
+    results = []
+    for n in [1, n_proc]:
+        scan = make_scan(tmpdir.join(f'n{n}').ensure_dir(), n_proc=n, exact_constraints=False)
+        fragments = [make_butane_fragment(scan.frag_dir, 'frag~1', [2., 1., -3., 0.5, 0., 0.]),
+                     make_butane_fragment(scan.frag_dir, 'frag~2', [0., -2., 1., 0., 0., 0.])]
+        energies = getattr(scan, f'scan_dihed_{method}')(None, fragments, None, 1)
+        results.append((energies, [frag.coords for frag in fragments],
+                        [frag.fit_terms[0]['angles'] for frag in fragments]))
+
+    (serial_energies, serial_coords, serial_angles), (energies, coords, angles) = results
+    assert len(energies) == 2 and all(len(frag_energies) == 8 for frag_energies in energies)
+    assert not np.allclose(energies[0], energies[1])
+    assert np.allclose(energies, serial_energies)
+    assert np.allclose(coords, serial_coords)
+    assert np.allclose(angles, serial_angles)
+
+
+def test_hessian_guess_unchanged(tmpdir):
+    frag = make_butane_fragment(tmpdir.strpath, 'frag~1', [2., 1., -3., 0.5, 0., 0.])
+    DihedralScan.set_hessian_guess([frag])
+    guess = frag.hessian_guess.copy()
+    coord = frag.coords[1] + np.random.default_rng(1).normal(scale=0.05, size=(4, 3))
+
+    relax_scan_point(frag.terms, frag.elements, coord, [], tmpdir.join('opt.traj').strpath,
+                     tmpdir.join('opt.log').strpath, 1000, frag.hessian_guess)
+    assert np.array_equal(frag.hessian_guess, guess)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from ase.units import Hartree, mol, kJ, Bohr
+
+from qforce.qm.fchk import FchkFile
+from qforce.qm.qm_base import ReadABC
+
+
+def write_array(name, kind, values):
+    per_line, fmt = (6, '{:12d}') if kind == 'I' else (5, '{:16.8E}')
+    text = f'{name:<40}   {kind}   N={len(values):12d}\n'
+    for i in range(0, len(values), per_line):
+        text += ''.join(fmt.format(value) for value in values[i:i+per_line]) + '\n'
+    return text
+
+
+@pytest.fixture
+def fchk_file(tmpdir):
+    rng = np.random.default_rng(1)
+    n_atoms = 4
+    data = {'elements': [6, 1, 1, 8], 'coords': rng.normal(size=3*n_atoms),
+            'hessian': rng.normal(size=3*n_atoms*(3*n_atoms+1)//2)}
+    text = ('methanal\nFreq      RPBEPBE                                   6-31+G(d)\n'
+            f'{"Number of atoms":<40}   I     {n_atoms:12d}\n'
+            f'{"Charge":<40}   I     {-1:12d}\n'
+            f'{"Multiplicity":<40}   I     {2:12d}\n'
+            f'{"Total Energy":<40}   R     {-114.123456789:22.15E}\n'
+            + write_array('Atomic numbers', 'I', data['elements'])
+            + write_array('Current cartesian coordinates', 'R', data['coords'])
+            + f'{"Route":<40}   C   N=           2\n#P Freq PBEPBE          \n'
+            + write_array('Cartesian Force Constants', 'R', data['hessian'])
+            + write_array('Dipole Moment', 'R', [0.1, -0.2, 0.3]))
+    tmpdir.join('methanal.fchk').write(text)
+    return tmpdir.join('methanal.fchk').strpath, data
+
+
+def test_records(fchk_file):
+    file_name, data = fchk_file
+    with FchkFile(file_name) as fchk:
+        assert 'Cartesian Force Constants' in fchk
+        assert 'Nuclear charges' not in fchk
+        assert fchk['Charge'] == -1
+        assert np.isclose(fchk['Total Energy'], -114.123456789)
+        assert fchk['Atomic numbers'].tolist() == data['elements']
+        assert np.allclose(fchk['Cartesian Force Constants'], data['hessian'])
+        assert np.allclose(fchk['Dipole Moment'], [0.1, -0.2, 0.3])
+        assert fchk['Route'].startswith('#P Freq')
+        assert fchk.get('Nuclear charges') is None
+
+
+def test_read_fchk_file(fchk_file):
+    file_name, data = fchk_file
+    n_atoms, charge, multiplicity, elements, coords, hessian = ReadABC._read_fchk_file(file_name)
+    assert (n_atoms, charge, multiplicity) == (4, -1, 2)
+    assert elements.tolist() == data['elements']
+    assert coords.shape == (4, 3)
+    assert np.allclose(coords, data['coords'].reshape(-1, 3) * Bohr)
+    assert np.allclose(hessian, data['hessian'] * Hartree * mol / kJ / Bohr**2)
+
+
+def test_truncated_record(tmpdir):
+    text = write_array('Cartesian Force Constants', 'R', [1., 2., 3., 4., 5., 6.])
+    tmpdir.join('cut.fchk').write(text.replace('N=           6', 'N=           7'))
+    with FchkFile(tmpdir.join('cut.fchk').strpath) as fchk:
+        with pytest.raises(ValueError):
+            fchk['Cartesian Force Constants']
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from qforce.forces import get_dist, get_angle, get_dihed
+from qforce.geometry import get_dists, get_angles, get_diheds, set_dists
+
+
+@pytest.fixture(scope='module')
+def frames():
+    rng = np.random.default_rng(0)
+    coords = rng.normal(scale=2., size=(5, 8, 3))
+    indices = np.array([rng.permutation(8)[:4] for _ in range(10)])
+    return coords, indices
+
+
+def test_get_dists(frames):
+    coords, indices = frames
+    ref = [[get_dist(frame[i], frame[j])[1] for i, j in indices[:, :2]] for frame in coords]
+    assert np.allclose(get_dists(coords, indices[:, :2]), ref)
+
+
+def test_get_angles(frames):
+    coords, indices = frames
+    ref = [[get_angle(frame[idx])[0] for idx in indices[:, :3]] for frame in coords]
+    assert np.allclose(get_angles(coords, indices[:, :3]), ref)
+    assert get_angles(coords[0], []).shape == (0,)  # e.g. a diatomic molecule
+
+
+def test_get_diheds(frames):
+    coords, indices = frames
+    ref = [[get_dihed(frame[idx])[0] for idx in indices] for frame in coords]
+    assert np.allclose(get_diheds(coords, indices), ref)
+    assert np.allclose(get_diheds(coords[2], indices), ref[2])
+    assert get_diheds(coords, indices[0]).shape == (5, 1)
+
+
+def test_set_dists(frames):
+    coords, indices = frames
+    coords = coords.copy()
+    set_dists(coords, [[0, 1], [2, 1]], [1.1, 1.5])
+    assert np.allclose(get_dists(coords, [[0, 1], [2, 1]]), [1.1, 1.5])
@@ -0,0 +1,61 @@
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+
+from qforce.dihedral_scan import run_gromacs_scan_point, read_gro_coords
+from qforce.misc import run_in_pool
+
+# Stands in for gmx: "minimizes" by shifting all x coordinates by 0.1 nm and writes the energy
+STUB_GMX = """#!/bin/sh
+case "$1" in
+    grompp)
+        [ -f ../default.mdp ] && [ -f gas.top ] && [ -f gas.gro ] || exit 1
+        touch em.tpr ;;
+    mdrun)
+        awk 'NR > 2 && NF > 3 {printf "%-20s%8.3f%s\\n", substr($0, 1, 20), substr($0, 21, 8) + 0.1,
+             substr($0, 29)} NR <= 2 || NF <= 3 {print}' gas.gro > em.gro
+        echo "   Potential Energy  = -1.00000e+00" > em.log
+        echo "   Potential Energy  = $(basename $PWD | tr -d step)" >> em.log ;;
+    trjconv)
+        cat > /dev/null
+        cp em.gro geom.gro ;;
+esac
+"""
+
+GRO = """mol
+     2
+    1MOL     C1    1   0.100   0.200   0.300
+    1MOL     H2    2  -0.100   1.250  10.000
+    20.00000    20.00000    20.00000
+"""
+
+
+@pytest.fixture
+def scan_dir(tmpdir):
+    gmx = tmpdir.join('gmx')
+    gmx.write(STUB_GMX)
+    os.chmod(gmx.strpath, os.stat(gmx.strpath).st_mode | stat.S_IEXEC)
+    tmpdir.join('default.mdp').write('integrator = steep\n')
+    for i in range(4):
+        step_dir = tmpdir.mkdir(f'step{i:02d}')
+        step_dir.join('gas.top').write('')
+        step_dir.join('gas.gro').write(GRO)
+    return tmpdir
+
+
+def test_read_gro_coords(tmpdir):
+    gro = tmpdir.join('geom.gro')
+    gro.write(GRO)
+    assert np.allclose(read_gro_coords(gro.strpath), [[1., 2., 3.], [-1., 12.5, 100.]])
+
+
+def test_gromacs_scan_points(scan_dir):
+    gmx = scan_dir.join('gmx').strpath
+    tasks = [(scan_dir.join(f'step{i:02d}').strpath, gmx, '') for i in range(4)]
+    results = run_in_pool(run_gromacs_scan_point, tasks, 4, executor=ThreadPoolExecutor)
+
+    for i, (coords, energy) in enumerate(results):
+        assert energy == i
+        assert np.allclose(coords, [[2., 2., 3.], [0., 12.5, 100.]])
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from ase.units import Hartree, mol, kJ, Bohr
+
+from qforce.qm.orca import ReadORCA
+from qforce.qm.xtb import ReadxTB
+
+
+@pytest.fixture
+def hessian():
+    rng = np.random.default_rng(2)
+    matrix = rng.normal(size=(12, 12)).round(8)
+    lower = ((matrix + matrix.T) / 2)[np.tril_indices(12)] * Hartree * mol / kJ / Bohr**2
+    return matrix, lower
+
+
+@pytest.mark.parametrize('n_cols', [5, 6])
+def test_orca_hess(tmpdir, hessian, n_cols):
+    matrix, lower = hessian
+    text = '\n$orca_hessian_file\n\n$hessian\n12\n'
+    for first in range(0, 12, n_cols):
+        cols = range(first, min(first+n_cols, 12))
+        text += '          ' + ''.join(f'{col:>19d}' for col in cols) + '\n'
+        for row in range(12):
+            text += f'{row:6d}     ' + ''.join(f'{matrix[row, col]:19.10E}' for col in cols) + '\n'
+    text += '\n$vibrational_frequencies\n36\n    0      0.000000\n'
+    tmpdir.join('mol.hess').write(text)
+
+    assert np.allclose(ReadORCA._read_orca_hess(tmpdir.join('mol.hess').strpath), lower)
+
+
+def test_xtb_hess(tmpdir, hessian):
+    matrix, lower = hessian
+    text = ' $hessian\n'
+    for row in matrix:
+        for first in range(0, 12, 5):
+            text += ''.join(f'{value:15.10f}' for value in row[first:first+5]) + '\n'
+    tmpdir.join('hessian').write(text)
+
+    assert np.allclose(ReadxTB._read_xtb_hess(tmpdir.join('hessian').strpath, 4), lower)
@@ -0,0 +1,142 @@
+import os
+import stat
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+from qforce.qm.jobs import run_jobs, wait_for_job
+from qforce.qm.qm import QM
+from qforce.qm.xtb import xTB
+from qforce.qm.gaussian import Gaussian
+
+MOCK_XTB = '''#!/bin/sh
+# mock QM program: "mock_xtb <input> <n_proc>" writes <jobname>.xtbscan.log with the settings
+name=$(basename "$1" .inp)
+[ "$name" = "broken" ] && exit 3
+echo "n_proc=$2 threads=$OMP_NUM_THREADS input=$(cat "$1")" > "$name.xtbscan.log"
+'''
+
+
+@pytest.fixture
+def mock_xtb(tmpdir):
+    exe = tmpdir.join('mock_xtb')
+    exe.write(MOCK_XTB)
+    os.chmod(exe.strpath, os.stat(exe.strpath).st_mode | stat.S_IEXEC)
+    return exe.strpath
+
+
+def make_config(mock_xtb, max_jobs=2):
+    return SimpleNamespace(run_jobs='local', local_command=f'{mock_xtb} <input> <n_proc>',
+                           n_proc=3, memory=100, max_jobs=max_jobs)
+
+
+def test_run_local_jobs(tmpdir, mock_xtb):
+    frag_dir = tmpdir.mkdir('fragments')
+    inputs = []
+    for i in range(4):
+        frag_dir.join(f'frag~{i}.inp').write(f'scan {i}')
+        inputs.append(frag_dir.join(f'frag~{i}.inp').strpath)
+
+    run_jobs(inputs, make_config(mock_xtb))
+
+    for i in range(4):  # outputs are written in the directory of the input
+        output = frag_dir.join(f'frag~{i}.xtbscan.log').read()
+        assert output == f'n_proc=3 threads=3 input=scan {i}\n'
+        assert frag_dir.join(f'frag~{i}.inp.run').check()
+
+
+def test_failed_job(tmpdir, mock_xtb, capsys):
+    tmpdir.join('broken.inp').write('')
+    tmpdir.join('good.inp').write('')
+
+    with pytest.raises(SystemExit):
+        run_jobs([tmpdir.join('good.inp').strpath, tmpdir.join('broken.inp').strpath],
+                 make_config(mock_xtb, max_jobs=1))
+    assert tmpdir.join('good.xtbscan.log').check()
+    assert 'broken.inp' in capsys.readouterr().out
+
+
+def test_hessian_job(tmpdir):
+    tmpdir.join('mol.xyz').write('2\n\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n')
+    job_dir = tmpdir.mkdir('mol_qforce')
+    # stands in for the xtb run of the written input: creates the expected output files
+    command = 'touch <jobname>.hessian <jobname>.charges <jobname>.wbo <jobname>.xtbopt.xyz'
+    qm = QM.__new__(QM)
+    qm.job = SimpleNamespace(dir=job_dir.strpath, name='mol',
+                             coord_file=tmpdir.join('mol.xyz').strpath)
+    qm.config = SimpleNamespace(run_jobs='local', local_command=command, n_proc=1, memory=100,
+                                max_jobs=1, job_script=None, charge=0, multiplicity=1,
+                                xtb_command='--gfn 2')
+    qm.software = xTB()
+
+    files = qm._check_hessian_output()
+    assert files['hess_file'] == f'{job_dir.strpath}/mol_hessian.hessian'
+    assert files['coord_file'] == f'{job_dir.strpath}/mol_hessian.xtbopt.xyz'
+
+
+def test_scheduler_jobs(tmpdir, mock_xtb):
+    # a local shell stands in for the scheduler: the jobs run in the background and are
+    # reported by the status command until they have written their .done file
+    for name in ['frag~1', 'frag~2', 'frag~3', 'broken']:
+        tmpdir.join(f'{name}.inp').write(name)
+    config = SimpleNamespace(run_jobs='scheduler', max_jobs=2, n_retries=1, poll_interval=0.01,
+                             max_poll_interval=0.05, status_retries=0,
+                             submit_command=f'({mock_xtb} <input> 1; touch <jobname>.done) '
+                                            '> /dev/null 2>&1 & echo "Submitted job <jobname>"',
+                             status_command='[ -e <jobid>.done ] || echo <jobid>')
+
+    with pytest.raises(SystemExit):
+        run_jobs([tmpdir.join(f'{name}.inp').strpath for name in ['frag~1', 'frag~2', 'frag~3',
+                                                                   'broken']], config)
+    for name in ['frag~1', 'frag~2', 'frag~3']:
+        assert tmpdir.join(f'{name}.xtbscan.log').read().endswith(f'input={name}\n')
+    # submitted once more after the first failure
+    assert tmpdir.join('broken.inp.run').read().count('Submitted job broken') == 2
+
+
+def test_status_failures(tmpdir, mock_xtb):
+    # the status command fails on its first two checks while the job is still running
+    tmpdir.join('frag~1.inp').write('frag~1')
+    config = SimpleNamespace(run_jobs='scheduler', max_jobs=1, n_retries=0, poll_interval=0.01,
+                             max_poll_interval=0.02, status_retries=2,
+                             submit_command=f'(sleep 0.3; {mock_xtb} <input> 1) > /dev/null 2>&1 '
+                                            '& echo "Submitted job <jobname>"',
+                             status_command='echo x >> checks; [ $(wc -l < checks) -gt 2 ] || '
+                                            'exit 1; [ -e <jobid>.xtbscan.log ] || echo <jobid>')
+
+    run_jobs([tmpdir.join('frag~1.inp').strpath], config)
+    assert tmpdir.join('frag~1.xtbscan.log').check()
+
+
+def test_wait_for_job(tmpdir):
+    # job 12 is reported on the first two checks, job 123 stays in the queue
+    tmpdir.join('frag~1.inp').write('')
+    config = SimpleNamespace(poll_interval=0.01, max_poll_interval=0.01, status_retries=0,
+                             status_command='echo x >> checks; [ $(wc -l < checks) -gt 2 ] && '
+                                            'echo "123" || echo "123 <jobid>"')
+
+    asyncio.run(asyncio.wait_for(wait_for_job(tmpdir.join('frag~1.inp').strpath, '12', config),
+                                 timeout=10))
+    assert len(tmpdir.join('checks').readlines()) == 3
+
+
+@pytest.mark.parametrize('log, complete', [
+    ('Link1\n Normal termination of Gaussian 16\n', True),
+    (' Normal termination of Gaussian 16\nLink2\n Error termination via Lnk1e\n', False),
+    ('partial log of a crashed job\n', False),
+])
+def test_gaussian_termination(tmpdir, log, complete):
+    tmpdir.join('frag~1.inp').write('')
+    assert not Gaussian.is_complete(tmpdir.join('frag~1.inp').strpath)
+    tmpdir.join('frag~1.log').write(log)
+    assert Gaussian.is_complete(tmpdir.join('frag~1.inp').strpath) == complete
+
+
+def test_incomplete_output(tmpdir, capsys):
+    tmpdir.join('frag~1.inp').write('')
+    config = SimpleNamespace(run_jobs='local', local_command='echo "partial" > <jobname>.log',
+                             n_proc=1, memory=100, max_jobs=1)
+
+    with pytest.raises(SystemExit):
+        run_jobs([tmpdir.join('frag~1.inp').strpath], config, Gaussian.is_complete)
+    assert 'frag~1.inp' in capsys.readouterr().out
@@ -0,0 +1,132 @@
+import gzip
+import lzma
+import mmap
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from ase.units import Hartree, mol, kJ
+
+from qforce.qm.gaussian import ReadGaussian
+from qforce.qm.qchem import ReadQChem
+from qforce.qm.qm import QM
+from qforce.qm import logfile
+
+COORDS = np.array([[0., 0., 0.], [1.1, 0., 0.], [1.5, 1.0, 0.2]])
+OPEN = {'': open, '.gz': gzip.open, '.xz': lzma.open}
+
+
+def orientation(coords):
+    text = ('                          Standard orientation:\n'
+            ' ---------------------------------------------------------------------\n'
+            ' Center     Atomic      Atomic             Coordinates (Angstroms)\n'
+            ' Number     Number       Type             X           Y           Z\n'
+            ' ---------------------------------------------------------------------\n')
+    for i, (x, y, z) in enumerate(coords):
+        text += f'{i+1:7d}{6:11d}{0:12d}    {x:12.6f}{y:12.6f}{z:12.6f}\n'
+    return text + ' ---------------------------------------------------------------------\n'
+
+
+def gaussian_log():
+    text = (' Entering Gaussian System\n'
+            ' NAtoms=      3 NQM=        3\n'
+            ' The following ModRedundant input section has been read:\n'
+            ' D       1       2       3       4 S  2 120.000\n\n'
+            ' !    D1    D(1,2,3,4)              60.0  Scan                           !\n')
+    for step in range(3):
+        for i in range(3):  # the optimization steps before the stationary point
+            text += orientation(COORDS + step + i/10)
+            text += f' SCF Done:  E(RPBE-PBE) =  -{100 + step + i/10:.8f}     A.U. after  9\n'
+            text += ' Step number   1 out of a maximum of  20\n'
+        text += '    -- Stationary point found.\n'
+    text += ' Hirshfeld charges, spin densities, dipoles, and CM5 charges\n'
+    text += '              Q-H        S-H        Dx         Dy         Dz        Q-CM5\n'
+    text += ''.join(f'     {i+1}  C   0.0  0.0  0.0  0.0  0.0  {0.1*i-0.1:.6f}\n' for i in range(3))
+    text += ' ESP charges:\n               1\n'
+    text += ''.join(f'     {i+1}  C   {0.2*i-0.2:.6f}\n' for i in range(3))
+    return text
+
+
+def qchem_log():
+    text = ' NAtoms, NIC, NZ, NZVar:\n     3     3     0     0\n'
+    for step in range(3):
+        for i in range(2):
+            text += f' Final energy is   -{100 + step + i/10:.12f}\n'
+        text += (' **  OPTIMIZATION CONVERGED  **\n ******************************\n\n'
+                 '                           Coordinates (Angstroms)\n')
+        text += '     ATOM              X               Y               Z\n'
+        text += ''.join(f'      {i+1}  C   {x:14.10f}  {y:14.10f}  {z:14.10f}\n'
+                        for i, (x, y, z) in enumerate(COORDS + step))
+        text += f' PES scan, value:    {60. + 120*step:.4f}    energy:   -{100.1 + step:.10f}\n'
+    for method in ['Charge Model 5', 'Merz-Kollman RESP Net Atomic Charges']:
+        text += f'          {method}\n ----------------------\n   Atom  Charge\n -------\n'
+        text += ''.join(f'      {i+1} C    {0.1*i-0.1:.6f}\n' for i in range(3))
+    return text
+
+
+@pytest.mark.parametrize('ext', ['', '.gz', '.xz'])
+def test_gaussian_scan(tmpdir, ext):
+    file_name = tmpdir.join(f'scan.log{ext}').strpath
+    with OPEN[ext](file_name, 'wt') as file:
+        file.write(gaussian_log())
+
+    n_atoms, coords, angles, energies, charges = ReadGaussian().scan(None, file_name)
+    assert n_atoms == 3
+    assert angles == [60., 180., 300.]
+    assert np.allclose(energies, -(100.2 + np.arange(3)) * Hartree * mol / kJ)
+    assert np.allclose(coords, [COORDS + step + 0.2 for step in range(3)])
+    assert np.allclose(charges['cm5'], [-0.1, 0., 0.1])
+    assert np.allclose(charges['esp'], [-0.2, 0., 0.2])
+
+
+@pytest.mark.parametrize('ext', ['', '.gz', '.xz'])
+def test_qchem_scan(tmpdir, ext):
+    file_name = tmpdir.join(f'scan.out{ext}').strpath
+    with OPEN[ext](file_name, 'wt') as file:
+        file.write(qchem_log())
+
+    n_atoms, coords, angles, energies, charges = ReadQChem().scan(None, file_name)
+    assert n_atoms == 3
+    assert angles == [60., 180., 300.]
+    assert np.allclose(energies, -(100.1 + np.arange(3)) * Hartree * mol / kJ)
+    assert np.allclose(coords, [COORDS + step for step in range(3)])
+    assert np.allclose(charges['cm5'], [-0.1, 0., 0.1])
+    assert np.allclose(charges['resp'], [-0.1, 0., 0.1])
+
+
+@pytest.mark.parametrize('ext', ['.gz', '.xz'])
+def test_compressed_log(tmpdir, monkeypatch, ext):
+    monkeypatch.setattr(logfile, 'DECOMPRESS_CHUNK', 1000)
+    file_name = tmpdir.join(f'scan.log{ext}').strpath
+    with OPEN[ext](file_name, 'wt') as file:
+        file.write(gaussian_log())
+
+    with logfile.open_log(file_name) as log:  # mapped from disk, not read into memory
+        assert isinstance(log, mmap.mmap)
+        assert log[:] == gaussian_log().encode()
+
+    with OPEN[ext](file_name, 'wt'):
+        pass
+    with logfile.open_log(file_name) as log:
+        assert log == b''
+
+
+def test_read_scan_chunks(tmpdir):
+    text = gaussian_log()
+    files = []
+    for i, start in enumerate([60., 180., 180.]):  # a restart that repeats two angles
+        file_name = f'frag~1_{i}.log'
+        tmpdir.join(file_name).write(text.replace('60.0  Scan', f'{start}  Scan').replace(
+            'SCF Done:  E(RPBE-PBE) =  -', f'SCF Done:  E(RPBE-PBE) =  -{i}'))
+        files.append(file_name)
+
+    qm = QM.__new__(QM)
+    qm.job = SimpleNamespace(frag_dir=tmpdir.strpath)
+    qm.config = SimpleNamespace(scan_step_size=120., dihedral_scanner='relaxed_scan',
+                                adaptive_scan=False, parse_cache=False)
+    qm.software = SimpleNamespace(read=ReadGaussian)
+
+    scan = qm.read_scan(files)
+    assert np.array_equal(scan.angles, [60., 180., 300.])
+    # all angles have their lowest energy in the last file (-2100.2 to -2102.2 Hartree)
+    assert np.allclose(scan.energies, np.array([0., 2., 1.]) * Hartree * mol / kJ)
+    assert np.allclose(scan.coords, [COORDS + 2.2, COORDS + 0.2, COORDS + 1.2])
@@ -0,0 +1,62 @@
+import os
+from io import StringIO
+import pytest
+import numpy as np
+
+from qforce import run_hessian_fitting_in_memory, get_config
+
+
+def water_qm_data():
+    coords = np.array([[0., 0., 0.119], [0., 0.763, -0.477], [0., -0.763, -0.477]])
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(9, 9))
+    hessian = matrix @ matrix.T
+    return {'n_atoms': 3, 'charge': 0, 'multiplicity': 1, 'elements': np.array([8, 1, 1]),
+            'coords': coords, 'hessian': hessian[np.tril_indices(9)],
+            'b_orders': np.array([[0., 1., 1.], [1., 0., 0.], [1., 0., 0.]]),
+            'point_charges': np.array([-0.8, 0.4, 0.4])}
+
+
+def test_in_memory(tmpdir, monkeypatch, capsys):
+    monkeypatch.chdir(tmpdir)
+    result = run_hessian_fitting_in_memory(water_qm_data(), 'water', config=get_config())
+
+    assert os.listdir(tmpdir) == []
+    assert capsys.readouterr().out == ''
+    assert 'Fitting the MD hessian' in result.log
+    assert len(result.terms['bond']) == 2 and len(result.terms['angle']) == 1
+    assert np.allclose(result.non_bonded.q, [-0.96, 0.48, 0.48])
+    assert result.frequencies.qm.shape == result.frequencies.md.shape == (3,)
+    assert result.force_field is None
+
+
+def test_serialize_and_write(tmpdir):
+    result = run_hessian_fitting_in_memory(water_qm_data(), 'water', serialize=True,
+                                           output_dir=tmpdir.join('out').strpath)
+
+    assert sorted(result.force_field) == ['gas.gro', 'gas.top', 'water_qforce.itp']
+    for name, content in result.force_field.items():
+        assert tmpdir.join('out', name).read() == content
+    assert tmpdir.join('out', 'frequencies.txt').check()
+
+
+@pytest.mark.parametrize('settings, kwargs, error', [
+    ('ext_charges = yes', {}, 'ext_charges'),
+    ('lennard_jones = opls', {}, 'lennard_jones = opls'),
+    ('lennard_jones = opls', {'ext_lj': {'atomic_numbers': [8, 1, 1]}}, 'lj_types'),
+])
+def test_external_settings_without_files(settings, kwargs, error):
+    config = get_config(StringIO(f'[ff]\n{settings}\n'))
+    with pytest.raises(ValueError, match=error):
+        run_hessian_fitting_in_memory(water_qm_data(), 'water', config=config, **kwargs)
+
+
+def test_external_in_memory():
+    config = get_config(StringIO('[ff]\next_charges = yes\nlennard_jones = opls\n'))
+    result = run_hessian_fitting_in_memory(water_qm_data(), 'water', config=config,
+                                           ext_q=[-0.834, 0.417, 0.417],
+                                           ext_lj={'lj_types': ['opls_111', 'opls_112',
+                                                                'opls_112']})
+
+    assert np.allclose(result.non_bonded.q, [-0.834, 0.417, 0.417])
+    assert list(result.non_bonded.lj_types) == ['opls_111', 'opls_112', 'opls_112']
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from ase import Atoms
+from ase.optimize import BFGS
+
+from qforce.calculator import QForce
+from qforce.forces import get_dihed
+from qforce.molecule.terms import Terms
+from qforce.molecule.storage import TermStorage, MultipleTermStorge
+from qforce.molecule.non_dihedral_terms import BondTerm, AngleTerm
+from qforce.molecule.dihedral_terms import FlexibleDihedralTerm
+from qforce.optimizer import relax_native, get_hessian_guess, minimize_lbfgs
+from qforce.hessian import calc_term_hessian
+
+
+@pytest.fixture(scope='module')
+def terms():
+    bonds = TermStorage('BondTerm', [BondTerm([0, 1], 1.5, 'cc', fconst=1000.),
+                                     BondTerm([1, 2], 1.5, 'cc', fconst=1000.),
+                                     BondTerm([2, 3], 1.5, 'cc', fconst=1000.)])
+    angles = TermStorage('AngleTerm', [AngleTerm([0, 1, 2], 1.95, 'ccc', fconst=400.),
+                                       AngleTerm([1, 2, 3], 1.95, 'ccc', fconst=400.)])
+    flexible = TermStorage('FlexibleDihedralTerm', [
+        FlexibleDihedralTerm([0, 1, 2, 3], np.array([2., 1., -3., 0.5, 0., 0.]), 'cccc')])
+    dihedral = MultipleTermStorge('dihedral', {'flexible': flexible})
+    return Terms.from_terms({'bond': bonds, 'angle': angles, 'dihedral': dihedral}, [], [])
+
+
+def make_coords(phi):
+    coords = np.array([[1.2, 0.8, 0.], [0., 0., 0.], [1.5, 0., 0.], [2.7, 0.8, 0.]])
+    rot = np.array([[1, 0, 0], [0, np.cos(phi), -np.sin(phi)], [0, np.sin(phi), np.cos(phi)]])
+    coords[3] = coords[2] + rot @ (coords[3] - coords[2])
+    return coords + np.random.default_rng(1).normal(scale=0.05, size=coords.shape)
+
+
+@pytest.mark.parametrize("phi", np.radians([0, 60, 135, 240]))
+def test_native_vs_ase(terms, phi, tmpdir):
+    coords = make_coords(phi)
+    restraints = [[np.array([0, 1, 2, 3]), get_dihed(coords)[0]]]
+
+    atoms = Atoms([6]*4, positions=coords, calculator=QForce(terms, dihedral_restraints=restraints))
+    BFGS(atoms, logfile=tmpdir.join('opt.log').strpath).run(fmax=0.01, steps=1000)
+
+    native_coords, native_energy, _ = relax_native(terms, coords, restraints)
+
+    assert np.isclose(native_energy, atoms.get_potential_energy(), atol=1e-3)
+    assert np.isclose(get_dihed(native_coords)[0], get_dihed(atoms.get_positions())[0],
+                      atol=1e-3)
+
+
+@pytest.mark.parametrize("phi", np.radians([0, 60, 135, 240]))
+def test_exact_constraints(terms, phi):
+    coords = make_coords(phi)
+    target = get_dihed(coords)[0] + 0.05
+    restraints = [[np.array([0, 1, 2, 3]), target]]
+
+    _, energy, n_evals = relax_native(terms, coords, restraints)
+    constrained_coords, constrained_energy, constrained_n_evals = relax_native(
+        terms, coords, restraints, constrained=True)
+
+    assert np.isclose(get_dihed(constrained_coords)[0], target, atol=1e-8)
+    assert np.isclose(constrained_energy, energy, atol=0.01)
+    assert constrained_n_evals <= n_evals
+
+
+@pytest.mark.parametrize("phi", np.radians([0, 60, 135, 240]))
+def test_hessian_guess(terms, phi):
+    coords = make_coords(phi)
+    restraints = [[np.array([0, 1, 2, 3]), get_dihed(coords)[0] + 0.05]]
+    _, inv_hessian = get_hessian_guess(calc_term_hessian(make_coords(0.), terms))
+
+    _, energy, n_evals = relax_native(terms, coords, restraints)
+    _, guess_energy, guess_n_evals = relax_native(terms, coords, restraints,
+                                                  inv_hessian_guess=inv_hessian)
+
+    assert np.isclose(guess_energy, energy, atol=1e-3)
+    assert guess_n_evals <= n_evals
+
+
+def test_rejected_steps():
+    # forces that point uphill: no step decreases the energy, the start point is kept
+    calls = []
+
+    def objective(x):
+        calls.append(x.copy())
+        return (x**2).sum(), x.copy()
+
+    x0 = np.array([0.3, -0.2, 0.1])
+    x, n_evals = minimize_lbfgs(objective, x0, max_steps=5)
+    assert np.array_equal(x, x0)
+    assert n_evals == len(calls) == 21  # the L-BFGS step and the steepest descent retry
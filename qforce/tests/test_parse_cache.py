@@ -0,0 +1,56 @@
+import os
+import numpy as np
+
+from qforce.qm.parse_cache import read_with_cache, get_scan_sources
+
+
+class Reader():
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.n_calls = 0
+
+    def __call__(self):
+        self.n_calls += 1
+        with open(self.file_name) as file:
+            energies = np.array([float(line) for line in file])
+        return 3, None, [[0., 1., 2.], [3., 4., 5.]], energies, {'cm5': [0.1, -0.1, 0.]}
+
+
+def test_read_with_cache(tmpdir):
+    source = tmpdir.join('scan.log')
+    source.write('1.5\n2.5\n')
+    cache_file = tmpdir.join('scan.log.parsed.npz').strpath
+    read = Reader(source.strpath)
+    settings = {'software': 'gaussian', 'charge_method': 'cm5'}
+
+    first = read_with_cache(cache_file, [source.strpath], settings, read)
+    second = read_with_cache(cache_file, [source.strpath], settings, read)
+    assert read.n_calls == 1
+    assert second[0] == 3 and isinstance(second[0], int)
+    assert second[1] is None
+    assert np.array_equal(second[2], first[2])
+    assert np.array_equal(second[3], [1.5, 2.5])
+    assert second[4] == {'cm5': [0.1, -0.1, 0.]}
+
+    # touched but unchanged: still from the cache
+    os.utime(source.strpath, ns=(0, 10**9))
+    read_with_cache(cache_file, [source.strpath], settings, read)
+    assert read.n_calls == 1
+
+    read_with_cache(cache_file, [source.strpath], {**settings, 'charge_method': 'esp'}, read)
+    assert read.n_calls == 2
+
+    source.write('1.5\n3.5\n')
+    assert np.array_equal(read_with_cache(cache_file, [source.strpath], settings, read)[3],
+                          [1.5, 3.5])
+    assert read.n_calls == 3
+
+
+def test_scan_sources(tmpdir):
+    for name in ['frag~1.log', 'frag~1.charges', 'frag~1.xtbscan.log', 'frag~1.log.parsed.npz',
+                 'frag~1.inp.run', 'frag~1_refine045.log', 'frag~10.log', 'other.log']:
+        tmpdir.join(name).write('')
+
+    sources = get_scan_sources(tmpdir.join('frag~1.log').strpath)
+    assert [os.path.basename(file) for file in sources] == ['frag~1.log', 'frag~1.charges',
+                                                            'frag~1.xtbscan.log']
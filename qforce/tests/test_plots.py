@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from qforce.plots import make_report, get_report_tasks
+
+
+@pytest.fixture
+def job_dir(tmpdir):
+    angles = np.radians(np.arange(0, 360, 15))
+    qm_energies = 5 * (1 - np.cos(3*angles))
+    md_energies = qm_energies + 0.1 * np.sin(angles)
+    fit_sum = 4 * (1 - np.cos(3*angles))
+
+    np.save(tmpdir.join('frequencies.npy').strpath, np.vstack((np.linspace(50, 3000, 20),
+                                                               np.linspace(60, 3100, 20))))
+    frag_dir = tmpdir.mkdir('fragments')
+    np.save(frag_dir.join('scan_data_CT_CT_H0.npy').strpath,
+            np.vstack((angles, qm_energies, md_energies)))
+    np.save(frag_dir.join('fit_data_CT_CT_H0.npy').strpath,
+            np.vstack((angles, qm_energies, md_energies - fit_sum, fit_sum)))
+    return tmpdir
+
+
+def test_report_tasks(job_dir):
+    assert [kind for kind, _ in get_report_tasks(job_dir.strpath)] == ['frequencies', 'scan']
+    assert [kind for kind, _ in get_report_tasks(job_dir.strpath, plot_fit=True)] == [
+        'frequencies', 'scan', 'fit']
+
+
+def test_report(job_dir):
+    pytest.importorskip('matplotlib')
+    pytest.importorskip('seaborn')
+    make_report(job_dir.strpath, plot_fit=True, n_proc=2)
+    for name in ['frequencies.pdf', 'fragments/scan_data_CT_CT_H0.pdf',
+                 'fragments/fit_data_CT_CT_H0.pdf', 'fragments/unfit_data_CT_CT_H0.pdf']:
+        assert job_dir.join(name).check(file=True)
+
+
+def test_no_data(tmpdir):
+    with pytest.raises(ValueError):
+        make_report(tmpdir.strpath)
@@ -0,0 +1,79 @@
+import os
+from types import SimpleNamespace
+
+from qforce.result_cache import restore_results, store_results, evict, get_cache_settings
+from qforce.main import restore_run
+
+
+def make_run(job_dir, content):
+    job_dir.ensure_dir()
+    for name in ['gas.top', 'gas.gro', 'mol_qforce.itp', 'frequencies.txt',
+                 'fragments/scan_data_CC~1.npy']:
+        job_dir.join(name).write(content, ensure=True)
+    job_dir.join('settings.ini').write('[ff]')
+    job_dir.join('mol_hessian.out').write('QM output')
+
+
+def test_store_and_restore(tmpdir):
+    store = tmpdir.join('store').strpath
+    scandata = tmpdir.join('frag_lib', 'scandata_1')
+    scandata.write('0.0 1.0', ensure=True)
+    make_run(tmpdir.join('run1'), 'fitted')
+
+    store_results(store, 'key', tmpdir.join('run1').strpath, {'terms': [1, 2]},
+                  [scandata.strpath])
+    assert restore_results(store, 'other', tmpdir.join('run2').strpath) is None
+
+    assert restore_results(store, 'key', tmpdir.join('run2').strpath) == {'terms': [1, 2]}
+    assert sorted(os.listdir(tmpdir.join('run2'))) == ['fragments', 'frequencies.txt', 'gas.gro',
+                                                       'gas.top', 'mol_qforce.itp']
+    assert tmpdir.join('run2', 'fragments', 'scan_data_CC~1.npy').read() == 'fitted'
+
+    scandata.write('0.0 2.0')  # the scan data of the stored run has changed
+    assert restore_results(store, 'key', tmpdir.join('run3').strpath) is None
+
+
+def test_evict(tmpdir):
+    store = tmpdir.join('store')
+    for i, key in enumerate(['old', 'used', 'new']):
+        make_run(tmpdir.join(key), 'x' * 100_000)
+        store_results(store.strpath, key, tmpdir.join(key).strpath, None)
+        os.utime(store.join(key, 'meta.json').strpath, (i, i))
+    restore_results(store.strpath, 'used', tmpdir.join('restored').strpath)
+
+    evict(store.strpath, max_size=1.1)  # MB: two of the three runs fit
+    assert sorted(os.listdir(store)) == ['new', 'used']
+
+
+def test_cache_settings():
+    config = SimpleNamespace(ff=SimpleNamespace(n_equiv=4, result_cache='store', checkpoints=True,
+                                                plots='inline'),
+                             qm=SimpleNamespace(software='xtb', run_jobs='local', max_jobs=4))
+    assert get_cache_settings(config) == {'ff': {'n_equiv': 4, 'plots': 'inline'},
+                                          'qm': {'software': 'xtb'}}
+    assert config.ff.result_cache == 'store'
+
+
+def test_restore_run_fragments(tmpdir):
+    # a partial run (avail_only) is not reused once another fragment has its scan data
+    make_run(tmpdir.join('run'), 'fitted')
+    scandata = [tmpdir.join('frag_lib', f'scandata_{i}') for i in range(2)]
+    for data in scandata:
+        data.write('0.0 1.0', ensure=True)
+    fragments = [SimpleNamespace(id=f'frag~{i}', get_data_files=lambda data=data: [data.strpath])
+                 for i, data in enumerate(scandata)]
+    config = SimpleNamespace(ff=SimpleNamespace(result_cache=tmpdir.join('store').strpath))
+    job = SimpleNamespace(name='mol', dir=tmpdir.join('run').strpath)
+    qm = SimpleNamespace(hessian_files={'out_file': f'{job.dir}/mol_hessian.out'})
+    run = SimpleNamespace(config=config, job=job, qm=qm, ext_q=None, ext_lj=None,
+                          fragments=fragments[:1])
+
+    assert not restore_run(run)
+    store_results(config.ff.result_cache, run.result_key, job.dir, {'terms': [1, 2]})
+    assert restore_run(run)
+
+    run.fragments = fragments
+    assert not restore_run(run)
+    run.fragments = fragments[:1]
+    scandata[0].write('0.0 2.0')
+    assert not restore_run(run)
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+import time
+import pytest
+
+
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'pulp', 'networkx', 'ase.io', 'ase.optimize',
+                 'scipy.optimize', 'scipy.interpolate', 'scipy.sparse', 'pkg_resources',
+                 'qforce.polarize', 'qforce.calculator']
+
+
+def test_no_heavy_imports():
+    code = ('import sys, qforce.main; '
+            f'print(" ".join(m for m in {HEAVY_MODULES} if m in sys.modules))')
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert out.stdout.split() == []
+
+
+@pytest.mark.slow
+def test_time_to_first_output():
+    """Startup benchmark: time until the command line help of qforce is printed."""
+    code = 'import sys; sys.argv = ["qforce", "-h"]; from qforce.main import run; run()'
+    subprocess.run([sys.executable, '-c', code], capture_output=True)  # fill the numba cache
+
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+
+    assert 'usage' in out.stdout.lower()
+    assert elapsed < 5